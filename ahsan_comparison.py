@@ -4,11 +4,12 @@ import pandas as pd
 import numpy as np
 import scipy.stats as stats
 
-from uncertain_val import UncertainVal
+from analysis_data import load
+from uncertain_val import UncertainVal, UncertainArray
 from solve_mass_balance import apply_formatting
 
 # bring in data
-data = pd.read_csv('../araihazar-data/to_analyze/data_for_regressions.csv')
+data = load(['arsenic_ugl'])
 
 # fraction of water from primary wells and other wells
 fp = 0.5
@@ -25,20 +26,22 @@ max_As = [8, 40, 91, 175, 864]
 # add column to data for estimate of As in all water consumed (primary wells and other wells)
 data['arsenic_ugl_water_consumed'] = (fp*data['arsenic_ugl'] + fo*mean_As_all_wells.value)/(fp+fo)
 
+subsets = [data[(data['arsenic_ugl'] >= min_val) & (data['arsenic_ugl'] <= max_val)]
+           for min_val, max_val in zip(min_As, max_As)]
+# mean primary well As in each category, and from it the mean As in all water consumed for every category at once
+mean_As_primary_well = UncertainArray([np.mean(subset_data['arsenic_ugl']) for subset_data in subsets],
+                                      [stats.sem(subset_data['arsenic_ugl']) for subset_data in subsets])
+mean_As_water_consumed = (fp*mean_As_primary_well + fo*mean_As_all_wells.value)/(fp+fo)
+
 solutions_dict = {}
-for category, min_val, max_val in zip(categories, min_As, max_As):
-    subset_data = data[(data['arsenic_ugl'] >= min_val) & (data['arsenic_ugl'] <= max_val)]
+for i, (category, subset_data) in enumerate(zip(categories, subsets)):
     num_subj = subset_data.shape[0]
-    mean_As_primary_well = UncertainVal(np.mean(subset_data['arsenic_ugl']),
-                                        stats.sem(subset_data['arsenic_ugl']))
-    mean_As_water_consumed = UncertainVal(np.mean(subset_data['arsenic_ugl_water_consumed']),
-                                          stats.sem(subset_data['arsenic_ugl_water_consumed']))
     median_As_primary_well = np.median(subset_data['arsenic_ugl'])
     median_As_water_consumed = np.median(subset_data['arsenic_ugl_water_consumed'])
     min_As_water_consumed = min(subset_data['arsenic_ugl_water_consumed'])
     max_As_water_consumed = max(subset_data['arsenic_ugl_water_consumed'])
-    solutions_dict.update({category: {'mean primary well As (ug/L)': mean_As_primary_well,
-                                      'mean all water As (ug/L)': mean_As_water_consumed,
+    solutions_dict.update({category: {'mean primary well As (ug/L)': mean_As_primary_well[i],
+                                      'mean all water As (ug/L)': mean_As_water_consumed[i],
                                       'median primary well As (ug/L)': median_As_primary_well,
                                       'median all water As (ug/L)': median_As_water_consumed,
                                       'min all water As (ug/L)': min_As_water_consumed,
@@ -0,0 +1,108 @@
+"""This module loads the analysis data (data_for_regressions.csv, extracted from the database by
+get_data_from_db.pgsql) from a typed, columnar copy of it.
+
+The first time the data is loaded, and whenever the csv is newer than the copy, the csv is converted
+to one .npy file per column plus meta.json (the column order and types). Loading then memory-maps
+only the columns that are asked for, instead of parsing the whole csv and inferring its types again.
+"""
+import json
+import os
+
+import numpy as np
+import pandas as pd
+
+DATA_PATH = '../araihazar-data/to_analyze/data_for_regressions.csv'
+
+# values of knew_well_as in the csv, as written by pandas (True/False) or by psql (t/f)
+TRUE_VALUES = ['true', 't', '1', 'yes', 'y']
+FALSE_VALUES = ['false', 'f', '0', 'no', 'n']
+# version of the columnar copy; copies made by an earlier version are converted again
+FORMAT_VERSION = 2
+
+def columnar_path(csv_path):
+    """Return the folder holding the columnar copy of the csv at csv_path."""
+    return os.path.splitext(csv_path)[0] + '_columns'
+
+def parse_bool(values):
+    """Return a boolean array from values written as any of TRUE_VALUES or FALSE_VALUES (in any case).
+
+    >>> parse_bool(pd.Series(['True', 'f', 'FALSE', '1'])).tolist()
+    [True, False, False, True]
+    """
+    values = pd.Series(values).astype(str).str.strip().str.lower()
+    unknown = ~values.isin(TRUE_VALUES + FALSE_VALUES)
+    if unknown.any():
+        raise ValueError(f'cannot read {values[unknown].iloc[0]!r} as true or false')
+    return values.isin(TRUE_VALUES).to_numpy()
+
+def typed_columns(data):
+    """Return the columns of data converted to the types they are stored as: knew_well_as as bool,
+    well arsenic (arsenic_ugl, other_as_* and avg_as_*) as float64, and text columns (such as sex) as categorical.
+
+    >>> data = pd.DataFrame({'knew_well_as': ['t', 'f'], 'sex': ['male', 'female'], 'arsenic_ugl': [8.3, 40.1]})
+    >>> typed_columns(data).dtypes.astype(str).tolist()
+    ['bool', 'category', 'float64']
+    """
+    typed = {}
+    for col in data.columns:
+        values = data[col]
+        if col == 'knew_well_as':
+            values = parse_bool(values)
+        elif col == 'arsenic_ugl' or col.startswith(('other_as_', 'avg_as_')):
+            values = values.astype(np.float64)
+        elif values.dtype == object or pd.api.types.is_string_dtype(values):
+            values = values.astype('category')
+        typed[col] = values
+    return pd.DataFrame(typed, index=data.index)
+
+def convert(csv_path=DATA_PATH):
+    """Convert the csv at csv_path to its columnar copy."""
+    data = typed_columns(pd.read_csv(csv_path))
+    out_dir = columnar_path(csv_path)
+    os.makedirs(out_dir, exist_ok=True)
+    meta = {'version': FORMAT_VERSION, 'rows': len(data), 'columns': {}}
+    for col in data.columns:
+        values = data[col]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            meta['columns'][col] = {'dtype': 'category', 'categories': values.cat.categories.tolist()}
+            values = values.cat.codes
+        else:
+            meta['columns'][col] = {'dtype': str(values.dtype)}
+        np.save(os.path.join(out_dir, col + '.npy'), values.to_numpy())
+    # write meta.json last, so that a partly written copy is never taken as up to date
+    with open(os.path.join(out_dir, 'meta.json'), 'w') as meta_file:
+        json.dump(meta, meta_file, indent=1)
+
+def load(columns=None, csv_path=DATA_PATH, mmap=True):
+    """Return the analysis data as a DataFrame, with only the given columns (by default, all of them).
+    The columnar copy is made or remade first if it is missing, older than the csv, or made by an earlier
+    version of this module. If mmap is True,
+    the columns are memory-mapped copy-on-write, so only the parts that are used are read from disk,
+    and changing values in the DataFrame does not change the files."""
+    csv_path = os.path.abspath(csv_path)
+    data_dir = columnar_path(csv_path)
+    meta_path = os.path.join(data_dir, 'meta.json')
+    meta = None
+    if os.path.exists(meta_path) and os.path.getmtime(meta_path) >= os.path.getmtime(csv_path):
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+    if meta is None or meta.get('version') != FORMAT_VERSION:
+        convert(csv_path)
+        with open(meta_path) as meta_file:
+            meta = json.load(meta_file)
+    if columns is None:
+        columns = list(meta['columns'])
+    missing = [col for col in columns if col not in meta['columns']]
+    if missing:
+        raise KeyError(f'columns not in {csv_path}: {missing}')
+    data = {}
+    for col in columns:
+        values = np.load(os.path.join(data_dir, col + '.npy'), mmap_mode='c' if mmap else None)
+        if meta['columns'][col]['dtype'] == 'category':
+            values = pd.Categorical.from_codes(values, meta['columns'][col]['categories'])
+        data[col] = values
+    return pd.DataFrame(data, copy=False)
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
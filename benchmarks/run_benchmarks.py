@@ -0,0 +1,187 @@
+"""Time the steps of the data wrangling and analysis on synthetic data of different sizes.
+
+Each size runs in a temporary folder laid out like the araihazar and araihazar-data repos, so the
+real data is never touched. The times are printed and added to benchmarks/results.csv (with the date
+and git commit), so that changes in speed show up over time. For example,
+
+    python3 benchmarks/run_benchmarks.py --wells 6615 100000
+
+The HEALS study has 6615 wells; there are HEALS_PEOPLE/HEALS_WELLS people per well at every size.
+100,000 wells is the largest size that runs in a few GB of memory (about 3 GB at the default radius);
+the number of well pairs, and the memory, grow in proportion to the number of wells, so 1,000,000 wells
+(about 3e8 pairs) does not fit in memory.
+"""
+import argparse
+import datetime
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+
+import matplotlib
+matplotlib.use('Agg')
+import numpy as np
+import pandas as pd
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path[:0] = [REPO_DIR, os.path.join(REPO_DIR, 'ingest')]
+# pylint: disable=wrong-import-position
+import analysis_data
+import local_database
+import regressions
+from clean_people_data import clean_people_data
+from compare_subsets import SubsetIndex, make_subset, GROUPS
+from neighbor_arsenic import build_csr, compute_exposures
+from plots import get_binned_data, plot_specs
+from run_all import run_many
+from solve_mass_balance import (calculate_parameters, distributed_model, propagate_uncertainty_numeric,
+                                split_uncertainties)
+from sweep_config import load_sweep_config
+from synthetic_data import HEALS_WELLS, write_data_dir
+from uncertain_val import UncertainVal
+from well_distances import find_neighbor_pairs, load_wells
+
+RESULTS_PATH = os.path.join(REPO_DIR, 'benchmarks', 'results.csv')
+BENCHMARKS = ['clean_people_data', 'find_neighbor_pairs', 'compute_exposures', 'database_extract',
+              'load_analysis_data', 'make_subset', 'get_binned_data', 'run_regressions',
+              'propagate_uncertainty_numeric', 'calculate_parameters', 'make_plots', 'run_many']
+
+# input parameters of the mass balance: the first set in sweep_config.json
+PARAMETERS = load_sweep_config().parameter_sets[0]
+
+def time_call(function, *args, repeat=3, setup=None):
+    """Call function(*args) repeat times, calling setup() (if given) before each, untimed.
+    Returns the result of the last call and the time each call took, in seconds."""
+    times = []
+    for _ in range(repeat):
+        if setup is not None:
+            setup()
+        start = time.perf_counter()
+        result = function(*args)
+        times.append(time.perf_counter() - start)
+    return result, times
+
+def parameters():
+    """Return a new dict of the input parameters as UncertainVals (calculate_parameters adds to it)."""
+    return {k: UncertainVal(*v) for k, v in PARAMETERS.items()}
+
+def run_benchmarks(n_wells, repeat=3, skip=(), radius_m=500):
+    """Run the benchmarks not in skip on synthetic data with n_wells wells, in the current folder (the
+    araihazar folder of a temporary layout), and yield the name and times of each."""
+    data_dir = os.path.abspath('../araihazar-data')
+    wells_path = os.path.join(data_dir, 'to_ingest', 'wells.csv')
+    people_path = os.path.join(data_dir, 'to_ingest', 'people.csv')
+    # data wrangling: each step also makes the inputs of the next, so they always run
+    _, times = time_call(clean_people_data, os.path.join(data_dir, 'to_clean'), wells_path, people_path,
+                         repeat=repeat)
+    yield 'clean_people_data', times
+    wells = load_wells(wells_path)
+    well_distances, times = time_call(find_neighbor_pairs, wells, radius_m, repeat=repeat)
+    yield 'find_neighbor_pairs', times
+    csr = build_csr(wells, well_distances)
+    exposures_table, times = time_call(compute_exposures, csr, repeat=repeat)
+    yield 'compute_exposures', times
+    def load_and_extract():
+        connection = local_database.connect(':memory:')
+        local_database.load_wells(connection, wells)
+        local_database.load_people(connection, pd.read_csv(people_path))
+        local_database.load_exposures(connection, exposures_table)
+        return local_database.extract(connection)
+    data, times = time_call(load_and_extract, repeat=repeat)
+    yield 'database_extract', times
+    # the regressions need every household well column, so wells with no other wells in range
+    # (which are rare in the real data) take their own arsenic, as other_as_20m and other_as_30m do
+    for col in data.columns:
+        if col.startswith('other_as_'):
+            data[col] = data[col].fillna(data['arsenic_ugl'])
+    data.to_csv(analysis_data.DATA_PATH, index=False)
+    analysis_data.convert()
+    data, times = time_call(analysis_data.load, repeat=repeat)
+    yield 'load_analysis_data', times
+
+    # data analysis
+    def subsets():
+        index = SubsetIndex(data)
+        return [make_subset(index, group_name) for group_name in GROUPS]
+    if 'make_subset' not in skip:
+        yield 'make_subset', time_call(subsets, repeat=repeat)[1]
+    data_subset = make_subset(data, 'all')
+    household_well_as = 'other_as_50m'
+    columns = ['arsenic_ugl', household_well_as, 'urine_as']
+    if 'get_binned_data' not in skip:
+        yield 'get_binned_data', time_call(get_binned_data, data_subset, 15, columns, repeat=repeat)[1]
+    (distributed_results, household_results, data_subset), times = time_call(
+        lambda: regressions.run_regressions(data_subset.copy(), 'all', household_well_as), repeat=repeat)
+    if 'run_regressions' not in skip:
+        yield 'run_regressions', times
+    if 'propagate_uncertainty_numeric' not in skip:
+        # solve every output of the distributed wells model, as solve_params_distributed does
+        params = parameters()
+        params['slope'] = UncertainVal(distributed_results.params[1], distributed_results.bse[1])
+        params['intercept'] = UncertainVal(distributed_results.params[0], distributed_results.bse[0])
+        values, uncertainties = split_uncertainties(params)
+        def propagate():
+            return {name: propagate_uncertainty_numeric(expr, values, uncertainties)
+                    for name, expr in distributed_model().items()}
+        yield 'propagate_uncertainty_numeric', time_call(propagate, repeat=repeat)[1]
+    (distributed_params, household_params), times = time_call(
+        lambda: calculate_parameters(distributed_results, household_results, parameters(), 'all', household_well_as),
+        repeat=repeat)
+    if 'calculate_parameters' not in skip:
+        yield 'calculate_parameters', times
+    if 'make_plots' not in skip:
+        specs = plot_specs(distributed_results, distributed_params, household_results, household_params,
+                           data_subset, 'all', 15, household_well_as)
+        # call the plotting functions directly, since render_plots skips plots that are up to date
+        def make_plots():
+            for spec in specs:
+                spec.function(*spec.args)
+        yield 'make_plots', time_call(make_plots, repeat=repeat)[1]
+    if 'run_many' not in skip:
+        yield 'run_many', time_call(lambda: run_many(jobs=1, use_cache=False, plots='none'), repeat=repeat)[1]
+
+def git_commit():
+    """Return the current git commit of the repo, or '' if it cannot be found."""
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return ''
+
+def main(sizes, repeat=3, skip=(), radius_m=500, results_path=RESULTS_PATH):
+    """Run the benchmarks for each number of wells in sizes and add the times to results_path."""
+    run_info = {'date': datetime.datetime.now().isoformat(timespec='seconds'), 'commit': git_commit(),
+                'machine': platform.node()}
+    start_dir = os.getcwd()
+    for n_wells in sizes:
+        temp_dir = tempfile.mkdtemp(prefix='araihazar-benchmark-')
+        try:
+            write_data_dir(os.path.join(temp_dir, 'araihazar-data'), n_wells)
+            os.makedirs(os.path.join(temp_dir, 'araihazar', 'plots'))
+            os.chdir(os.path.join(temp_dir, 'araihazar'))
+            for name, times in run_benchmarks(n_wells, repeat, skip, radius_m):
+                print(f'{n_wells:>9} wells  {name:<29} first {times[0]:9.4f} s  best {min(times):9.4f} s  '
+                      f'median {np.median(times):9.4f} s', flush=True)
+                result = pd.DataFrame([{**run_info, 'benchmark': name, 'n_wells': n_wells, 'radius_m': radius_m,
+                                        'repeat': repeat, 'first_s': times[0], 'best_s': min(times),
+                                        'median_s': np.median(times)}])
+                result.to_csv(results_path, mode='a', header=not os.path.exists(results_path), index=False)
+        finally:
+            os.chdir(start_dir)
+            shutil.rmtree(temp_dir, ignore_errors=True)
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--wells', type=int, nargs='+', default=[HEALS_WELLS],
+                        help=f'numbers of wells to run the benchmarks for (default: {HEALS_WELLS})')
+    parser.add_argument('--repeat', type=int, default=3, help='number of times to time each step (default: 3)')
+    parser.add_argument('--skip', nargs='+', default=[], choices=BENCHMARKS[5:], metavar='BENCHMARK',
+                        help='analysis benchmarks to leave out, from: ' + ', '.join(BENCHMARKS[5:]))
+    parser.add_argument('--radius', type=float, default=500,
+                        help='largest distance between wells kept in the well distances, in meters (default: 500)')
+    parser.add_argument('--results', default=RESULTS_PATH, help='csv file to add the results to')
+    args = parser.parse_args()
+    main(args.wells, args.repeat, args.skip, args.radius, os.path.abspath(args.results))
@@ -0,0 +1,79 @@
+"""Make synthetic versions of the well and people data, with the same files and columns as the real data,
+for any number of wells.
+
+Wells are placed in villages of about 100 wells, over an area that grows with the number of wells so that
+the density of wells (and so the number of pairs of nearby wells) stays like that of the HEALS study area.
+There are HEALS_PEOPLE/HEALS_WELLS people per well.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+# size of the Health Effects of Arsenic Longitudinal Study (HEALS) original cohort
+HEALS_WELLS = 6615
+HEALS_PEOPLE = 11746
+# the study area is about 25 km^2, about 0.045 degrees on a side
+HEALS_SIDE_DEGREES = 0.045
+WELLS_PER_VILLAGE = 100
+# spread of wells around the center of their village
+VILLAGE_RADIUS_DEGREES = 0.0008
+
+def make_wells(n_wells, seed=0):
+    """Return a wells table (as in to_ingest/wells.csv) with n_wells wells."""
+    rng = np.random.default_rng(seed)
+    side = HEALS_SIDE_DEGREES*np.sqrt(n_wells/HEALS_WELLS)
+    n_villages = max(1, n_wells//WELLS_PER_VILLAGE)
+    village = rng.integers(0, n_villages, n_wells)
+    center_latitude = 23.75 + rng.random(n_villages)*side
+    center_longitude = 90.60 + rng.random(n_villages)*side
+    # the original survey numbered wells from 1; later wells have IDs above 5000
+    well_id = np.arange(1, n_wells + 1)
+    well_id[well_id > 5000] += 5000
+    return pd.DataFrame({
+        'Well ID': well_id,
+        'Union': np.array(['Araihazar', 'Duptara', 'Haizadi', 'Satgram', 'Uchitpura'])[village % 5],
+        'Village': [f'village {v}' for v in village],
+        'Owner': 'owner',
+        # well arsenic is roughly lognormal, measured to 0.1 ug/L
+        'As% (ug/l)': np.round(rng.lognormal(4, 1.3, n_wells), 1),
+        'Latitude': center_latitude[village] + rng.normal(0, VILLAGE_RADIUS_DEGREES, n_wells),
+        'Longitude': center_longitude[village] + rng.normal(0, VILLAGE_RADIUS_DEGREES, n_wells),
+        'Depth': rng.integers(5, 100, n_wells).astype(float),
+        'Year': rng.integers(1980, 2000, n_wells),
+    })
+
+def make_people_sources(wells, n_people, seed=0):
+    """Return the sources of the people data (as in the to_clean folder) for n_people people drinking
+    from the given wells, as a dict mapping file names to tables."""
+    rng = np.random.default_rng(seed + 1)
+    subject = np.arange(1, n_people + 1)
+    row = rng.integers(0, len(wells), n_people)
+    well_arsenic = wells['As% (ug/l)'].to_numpy()[row]
+    # urinary arsenic rises with well arsenic, as in the distributed wells model
+    urine_as = np.abs(0.9*well_arsenic + 65 + rng.normal(0, 80, n_people))
+    creatinine = rng.lognormal(4, 0.5, n_people)
+    interview_date = pd.Timestamp(2000, 10, 1) + pd.to_timedelta(rng.integers(0, 730, n_people), unit='D')
+    return {
+        'age.csv': pd.DataFrame({'Subject': subject, 'Age': rng.integers(18, 65, n_people)}),
+        'baseline_urine_as.csv': pd.DataFrame({'SubjectID': subject, 'UrineAs': urine_as, 'UrineCreat': creatinine,
+                                               'UrAsgmCr': urine_as/creatinine*100}),
+        'interview_dates.csv': pd.DataFrame({'SubjectID': subject,
+                                             'DateInt': interview_date.strftime('%Y-%m-%d')}),
+        'sex.csv': pd.DataFrame({'SubjectID': subject, 'Sex': rng.integers(1, 3, n_people)}),
+        'subject_well_mapping.csv': pd.DataFrame({'subject ID': subject,
+                                                  'Index well': wells['Well ID'].to_numpy()[row],
+                                                  'cohort': 'OrigCohort'}),
+    }
+
+def write_data_dir(data_dir, n_wells, n_people=None, seed=0):
+    """Write synthetic to_clean and to_ingest files to data_dir, laid out as in the araihazar-data repo.
+    By default there are HEALS_PEOPLE/HEALS_WELLS people per well."""
+    if n_people is None:
+        n_people = round(n_wells*HEALS_PEOPLE/HEALS_WELLS)
+    for folder in ['to_clean', 'to_ingest', 'to_analyze', 'analysis_output']:
+        os.makedirs(os.path.join(data_dir, folder), exist_ok=True)
+    wells = make_wells(n_wells, seed)
+    wells.to_csv(os.path.join(data_dir, 'to_ingest', 'wells.csv'), index=False)
+    for file_name, table in make_people_sources(wells, n_people, seed).items():
+        table.to_csv(os.path.join(data_dir, 'to_clean', file_name), index=False)
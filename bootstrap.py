@@ -0,0 +1,56 @@
+"""This module refits the regressions on bootstrap resamples of the study participants.
+
+Every resample is represented by how many times it draws each participant, so the Gram matrices
+of all resamples in a chunk are one matrix product of those counts with the pairwise products of
+the data columns, and all the fits are solved together as a stack of small linear systems.
+"""
+import numpy as np
+
+def bootstrap_coefficients(y, regressors, n_resamples, seed=0, chunk_size=200):
+    """Regress y on a constant and the columns of regressors for n_resamples resamples of the rows
+    drawn with replacement. Returns an (n_resamples, 1 + number of regressors) array of coefficients,
+    constant term first.
+
+    >>> x = np.arange(10.)
+    >>> coefficients = bootstrap_coefficients(2*x + 1, x[:, np.newaxis], 5)
+    >>> np.allclose(coefficients, [1., 2.])
+    True
+    """
+    return bootstrap_nested_coefficients(y, regressors, [list(range(np.shape(regressors)[1]))],
+                                         n_resamples, seed, chunk_size)[0]
+
+def bootstrap_nested_coefficients(y, regressors, models, n_resamples, seed=0, chunk_size=200):
+    """Like bootstrap_coefficients, but fits several models on the same resamples. Each model is a list of
+    the columns of regressors it uses. Returns one array of coefficients per model."""
+    y = np.asarray(y, dtype=float)
+    z = np.column_stack([np.ones(y.shape[0]), np.asarray(regressors, dtype=float), y])
+    nobs, ncols = z.shape
+    # products of every pair of columns, so that each resample's Gram matrix is a weighted sum of rows
+    first, second = np.triu_indices(ncols)
+    products = z[:, first]*z[:, second]
+    rng = np.random.default_rng(seed)
+    coefficients = [np.empty((n_resamples, len(model) + 1)) for model in models]
+    for start in range(0, n_resamples, chunk_size):
+        size = min(chunk_size, n_resamples - start)
+        counts = rng.multinomial(nobs, np.full(nobs, 1/nobs), size=size).astype(float)
+        gram = np.empty((size, ncols, ncols))
+        gram[:, first, second] = counts @ products
+        gram[:, second, first] = gram[:, first, second]
+        for model, model_coefficients in zip(models, coefficients):
+            # constant, then the model's regressors, then y
+            columns = np.array([0] + [col + 1 for col in model])
+            xtx = gram[:, columns[:, np.newaxis], columns]
+            xty = gram[:, columns, ncols - 1]
+            model_coefficients[start:start + size] = np.linalg.solve(xtx, xty[..., np.newaxis])[..., 0]
+    return coefficients
+
+def bootstrap_fits(data, household_well_as, n_resamples, seed=0):
+    """Return arrays of bootstrap coefficients for the distributed wells model (intercept, slope)
+    and for the household wells model (intercept, slope_primary, slope_household), both fit on the
+    same resamples of data."""
+    return bootstrap_nested_coefficients(data.urine_as, data[['arsenic_ugl', household_well_as]],
+                                         [[0], [0, 1]], n_resamples, seed)
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -3,10 +3,33 @@ import csv
 
 import scipy
 import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
 from matplotlib.ticker import MultipleLocator
 
+import results_sink
+from pipeline_cache import content_hash, file_hash, run_stage
 from plots import get_binned_data
+from regressions import distributed_wells_regress
+
+def compare_subsets_stage(data, data_path):
+    """Compare the subsets of participants who did not know and may have known their well As, using the
+    distributed wells model fit to all the data. Skipped if the data file and the fit are unchanged since
+    the comparison last ran and its outputs still exist."""
+    _, distributed_results = distributed_wells_regress(make_subset(data, 'all'))
+    key = content_hash(file_hash(data_path), distributed_results.params, distributed_results.cov_params())
+    outputs = ['../araihazar-data/analysis_output/not_know_subset.csv',
+               '../araihazar-data/analysis_output/may_know_subset.csv',
+               'plots/subset_comparison_binned.png', 'plots/subset_comparison_binned_inset.png']
+    for lower_bound, upper_bound in COMPARISON_BOUNDS:
+        outputs.extend(results_sink.csv_outputs(
+            [f'../araihazar-data/analysis_output/well_as_{lower_bound}_to_{upper_bound}_well_and_urine_as_comparison.csv']))
+        outputs.extend(f'plots/{to_compare}_did_not_know_may_have_known_comparison_well_as_{lower_bound}_to_{upper_bound}.png'
+                       for to_compare in ['urine_as', 'arsenic_ugl'])
+    return run_stage('compare_subsets', key, outputs, compare_subsets, distributed_results, data)
+
+# ranges of primary well arsenic in which compare_subsets compares the two subsets
+COMPARISON_BOUNDS = [(250, 100000), (0, 10)]
 
 def compare_subsets(distributed_results, data):
     # get data subset
@@ -20,51 +43,112 @@ def compare_subsets(distributed_results, data):
     # inset (lower left)
     plot_group_comparison(distributed_results, not_know_subset, may_know_subset, 'subset_comparison_binned_inset', xmax=100, ymax=100, tick_spacing=25)
 
-    # hypothesis: for the people with primary well arsenic greater than 250 ug/L, 
+    # hypotheses: for the people with primary well arsenic greater than 250 ug/L, 
+    # and for the people with primary well arsenic less than 10 ug/L,
     # the group that may have been informed of their well arsenic has lower urinary 
     # arsenic than the group that was not informed
-    compare_well_and_urine_as_means(not_know_subset, may_know_subset, arsenic_ugl_lower_bound=250, arsenic_ugl_upper_bound=100000)
-
-    # hypothesis: for the people with primary well arsenic less than 10 ug/L,
-    # the group that may have been informed of their well arsenic has lower urinary 
-    # arsenic than the group that was not informed
-    compare_well_and_urine_as_means(not_know_subset, may_know_subset, arsenic_ugl_lower_bound=0, arsenic_ugl_upper_bound=10)
-
-
-def make_subset(data, group_name): # pylint: disable=too-many-return-statements
-    """Given a group name and the full data set, return the subset of the data that corresponds
-    to the group name."""
-    if group_name == 'did_not_know':
-        # keep only the rows where people did not know their well As
-        # when their urine As was measured
-        return data[data['knew_well_as'] == False]
-    if group_name == 'may_have_known':
-        # keep only the rows where people may have known their well As
-        # when their urine As was measured
-        return data[data['knew_well_as'] == True]
-    if group_name == 'women':
-        return data[data['sex'] == 'female']
-    if group_name == 'women_did_not_know':
-        return data[(data['knew_well_as'] == False) & (data['sex'] == 'female')]
-    if group_name == 'women_may_have_known':
-        return data[(data['knew_well_as'] == True) & (data['sex'] == 'female')]
-    if group_name == 'men':
-        return data[data['sex'] == 'male']
-    if group_name == 'men_did_not_know':
-        return data[(data['knew_well_as'] == False) & (data['sex'] == 'male')]
-    if group_name == 'men_may_have_known':
-        return data[(data['knew_well_as'] == True) & (data['sex'] == 'male')]
-    if group_name == 'all':
-        return data
-    assert False, 'Group does not exist'
-    return False
-
-
-def plot_group_comparison(results, not_know_subset, may_know_subset, plotname, xmax, ymax, tick_spacing):
-    """Binned errorbar plots of the two subsets alongisde the model fit line"""
+    for lower_bound, upper_bound in COMPARISON_BOUNDS:
+        compare_well_and_urine_as_means(not_know_subset, may_know_subset, arsenic_ugl_lower_bound=lower_bound,
+                                        arsenic_ugl_upper_bound=upper_bound)
+
+
+# Groups of study participants. Each group maps column names to a filter that rows in the group pass:
+# a single value, a list of allowed values, or a dict with a 'min' (inclusive) and/or 'max' (exclusive)
+# for a range of values. Rows must pass every filter in the group.
+GROUPS = {
+    'all': {},
+    # people who did not know their well As when their urine As was measured
+    'did_not_know': {'knew_well_as': False},
+    # people who may have known their well As when their urine As was measured
+    'may_have_known': {'knew_well_as': True},
+    'women': {'sex': 'female'},
+    'women_did_not_know': {'knew_well_as': False, 'sex': 'female'},
+    'women_may_have_known': {'knew_well_as': True, 'sex': 'female'},
+    'men': {'sex': 'male'},
+    'men_did_not_know': {'knew_well_as': False, 'sex': 'male'},
+    'men_may_have_known': {'knew_well_as': True, 'sex': 'male'},
+}
+
+def band_groups(column, edges):
+    """Return groups for bands of the values in column between consecutive edges.
+
+    >>> band_groups('age', [20, 40, 60])
+    {'age_20_to_40': {'age': {'min': 20, 'max': 40}}, 'age_40_to_60': {'age': {'min': 40, 'max': 60}}}
+    """
+    return {f'{column}_{lower:g}_to_{upper:g}': {column: {'min': lower, 'max': upper}}
+            for lower, upper in zip(edges[:-1], edges[1:])}
+
+def group_mask(data, filters):
+    """Return a boolean array that is True for the rows of data that pass every filter."""
+    mask = np.ones(data.shape[0], dtype=bool)
+    for column, allowed in filters.items():
+        values = data[column]
+        if isinstance(allowed, dict):
+            if 'min' in allowed:
+                mask &= (values >= allowed['min']).to_numpy()
+            if 'max' in allowed:
+                mask &= (values < allowed['max']).to_numpy()
+        elif isinstance(allowed, list):
+            mask &= values.isin(allowed).to_numpy()
+        else:
+            mask &= (values == allowed).to_numpy()
+    return mask
+
+
+class SubsetIndex:
+    """
+    This is a class for looking up the rows of each group of study participants,
+    computed once when the data is loaded.
+
+    Attributes:
+        data (DataFrame): The full data set, with sex stored as a categorical column
+        positions (dict): Maps each group name to an array of the row positions in the group
+    """
+    def __init__(self, data, groups=None):
+        """
+        Initializes SubsetIndex with the full data set and the row positions of each group
+        (by default, those in GROUPS).
+        """
+        if 'sex' in data.columns:
+            data = data.assign(sex=data['sex'].astype('category'))
+        self.data = data
+        self.positions = {}
+        for group_name, filters in (GROUPS if groups is None else groups).items():
+            self.add_group(group_name, filters)
+
+    def add_group(self, group_name, filters):
+        """Add a group defined by filters, as in GROUPS."""
+        self.positions[group_name] = np.flatnonzero(group_mask(self.data, filters))
+
+    def subset(self, group_name):
+        """Return a copy of the rows of the data in the group."""
+        assert group_name in self.positions, 'Group does not exist'
+        return self.data.iloc[self.positions[group_name]]
+
+
+def make_subset(data, group_name):
+    """Given a group name and the full data set (as a DataFrame or a SubsetIndex),
+    return the subset of the data that corresponds to the group name.
+
+    >>> data = pd.DataFrame({'sex': ['male', 'female', 'female'], 'knew_well_as': [True, False, True]})
+    >>> make_subset(data, 'women_did_not_know').index.tolist()
+    [1]
+    >>> make_subset(SubsetIndex(data), 'may_have_known').index.tolist()
+    [0, 2]
+    """
+    if isinstance(data, SubsetIndex):
+        return data.subset(group_name)
+    assert group_name in GROUPS, 'Group does not exist'
+    return data[group_mask(data, GROUPS[group_name])]
+
+
+def plot_group_comparison(results, not_know_subset, may_know_subset, plotname, xmax, ymax, tick_spacing,
+                          binning='equal_count'):
+    """Binned errorbar plots of the two subsets alongisde the model fit line.
+    binning is 'equal_count' or 'equal_width', as in get_binned_data."""
     # bin both and plot the binned data
-    binned_data_may_know = get_binned_data(may_know_subset, 15, ['arsenic_ugl', 'urine_as'])
-    binned_data_not_know = get_binned_data(not_know_subset, 15, ['arsenic_ugl', 'urine_as'])
+    binned_data_may_know = get_binned_data(may_know_subset, 15, ['arsenic_ugl', 'urine_as'], binning)
+    binned_data_not_know = get_binned_data(not_know_subset, 15, ['arsenic_ugl', 'urine_as'], binning)
 
     fig, ax = plt.subplots(figsize=(8, 6))
     ax.set_ylabel(r'Urinary Arsenic ($\mu g/L$)', fontsize=18)
@@ -85,6 +169,7 @@ def plot_group_comparison(results, not_know_subset, may_know_subset, plotname, x
     ax.yaxis.set_major_locator(MultipleLocator(tick_spacing))
     ax.tick_params(axis='both', labelsize=16)
     plt.savefig(f'plots/{plotname}.png')
+    plt.close(fig)
 
 
 def compare_well_and_urine_as_means(not_know_subset, may_know_subset, arsenic_ugl_lower_bound, arsenic_ugl_upper_bound):
@@ -102,11 +187,16 @@ def compare_well_and_urine_as_means(not_know_subset, may_know_subset, arsenic_ug
     make_histograms(not_know_subset, 'did_not_know', may_know_subset, 'may_have_known',
                     arsenic_ugl_lower_bound, arsenic_ugl_upper_bound, 
                     'arsenic_ugl')
-    with open(os.path.abspath(f'../araihazar-data/analysis_output/well_as_{arsenic_ugl_lower_bound}_to_{arsenic_ugl_upper_bound}_well_and_urine_as_comparison.csv'), "w") as savefile:
-        writer = csv.writer(savefile)
-        writer.writerow(['mean compared', 'equal variance', 'test statistic', 'one-tailed p-value'])
-        writer.writerow(['urine'] + urine_comparison)
-        writer.writerow(['well water'] + well_comparison)
+    header = ['mean compared', 'equal variance', 'test statistic', 'one-tailed p-value']
+    def save_csv():
+        with open(os.path.abspath(f'../araihazar-data/analysis_output/well_as_{arsenic_ugl_lower_bound}_to_{arsenic_ugl_upper_bound}_well_and_urine_as_comparison.csv'), "w") as savefile:
+            writer = csv.writer(savefile)
+            writer.writerow(header)
+            writer.writerow(['urine'] + urine_comparison)
+            writer.writerow(['well water'] + well_comparison)
+    comparison = pd.DataFrame([['urine'] + urine_comparison, ['well water'] + well_comparison], columns=header)
+    results_sink.write('comparison', comparison, save_csv, arsenic_ugl_lower_bound=arsenic_ugl_lower_bound,
+                       arsenic_ugl_upper_bound=arsenic_ugl_upper_bound)
 
 
 def make_histograms(subset1, subset1_name, subset2, subset2_name,
@@ -132,6 +222,7 @@ def make_histograms(subset1, subset1_name, subset2, subset2_name,
     ax.tick_params(axis='x', labelsize=16)
     ax.tick_params(axis='y', labelsize=10)
     plt.savefig(f'plots/{to_compare}_{subset1_name}_{subset2_name}_comparison_well_as_{arsenic_ugl_lower_bound}_to_{arsenic_ugl_upper_bound}.png', transparent=True)
+    plt.close(fig)
 
 
 def compare_means(not_know_subset, may_know_subset, to_compare):
@@ -152,3 +243,8 @@ def compare_means(not_know_subset, may_know_subset, to_compare):
     p_value_one_tailed = p_value_two_tailed/2
     # we expect a positive test statistic if mean of not_know_subset is greater than mean of may_know_subset
     return [equal_var, test_statistic, p_value_one_tailed]
+
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -4,14 +4,17 @@ from matplotlib.offsetbox import AnchoredText
 import scipy.stats as stats
 import numpy as np
 
+from analysis_data import load
 from plots import get_binned_data
 from compare_subsets import make_subset
 
 # set parameters
-data = pd.read_csv('../araihazar-data/to_analyze/data_for_regressions.csv')
+data = load(['arsenic_ugl', 'urine_as'])
 group_name = 'all'
 data_subset = make_subset(data, group_name)
 numbins = 15
+# 'equal_count' for the same number of people in each bin, 'equal_width' for equal ranges of well arsenic
+binning = 'equal_count'
 household_well_as = 'other_as_50m'
 
 names = ['reference_case', 'fu=0.5', 'Mf=64', 'fp=0.5', 'ff_and_fc', 'md']
@@ -21,7 +24,7 @@ colors = [(.18, .33, .59), (.18, .33, .59), (.18, .33, .59), (.18, .33, .59), 't
 
 # bin data
 binned_data = get_binned_data(data_subset, numbins,
-                              ['arsenic_ugl', 'urine_as'])
+                              ['arsenic_ugl', 'urine_as'], binning)
 for i in range(len(names)):
     fig, ax = plt.subplots(figsize=(8, 6))
     ax.set_ylabel(r'Urinary Arsenic ($\mu g/L$)', fontsize=18)
@@ -0,0 +1,166 @@
+"""Fit the household wells model for a whole family of household well arsenic columns at once, such as
+other_as_* for a series of radii or decay lengths, to find the neighborhood scale that best explains
+urinary arsenic.
+
+Every fit shares its sums over the constant, primary well arsenic and urinary arsenic, so only the sums
+involving each exposure column are computed per column, as matrix products, and all the fits are solved
+together as a stack of 3x3 linear systems. For example, to sweep uniform radii from 10 m to 500 m,
+calculated from the well distances,
+
+    python3 exposure_sweep.py --radii 10 500 10
+"""
+import argparse
+import os
+import re
+import sys
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from analysis_data import load
+from compare_subsets import make_subset
+from plots import plot_exposure_sweep
+from solve_mass_balance import household_model, solve_batch
+from sweep_config import SWEEP_CONFIG, load_sweep_config
+from uncertain_val import UncertainVal
+
+# regression coefficients of the household wells model, in the order they are fit
+COEFFICIENTS = ['intercept', 'slope_primary', 'slope_household']
+
+# the household well columns in the analysis data for a series of radii
+RADIUS_COLUMNS = ['other_as_20m', 'other_as_30m', 'other_as_50m', 'other_as_100m', 'other_as_200m', 'other_as_300m',
+                  'other_as_400m', 'other_as_500m']
+
+# one household wells model fit per exposure column: coefficients (in the order of COEFFICIENTS),
+# their covariance matrices, and the number of observations, R^2 and adjusted R^2 of each fit
+HouseholdFits = namedtuple('HouseholdFits', ['params', 'cov', 'nobs', 'rsquared', 'rsquared_adj'])
+
+def household_fits(y, primary, exposures):
+    """Regress y on a constant, primary and each column of exposures in turn, as
+    regressions.household_wells_regress does for one column. Rows where the column
+    (or y or primary) is missing are left out of that column's fit.
+
+    >>> x = np.arange(8.)
+    >>> fits = household_fits(1 + 2*x + 3*x**2, x, np.column_stack([x**2, 5 - x**2]))
+    >>> np.round(fits.params, 6)
+    array([[ 1.,  2.,  3.],
+           [16.,  2., -3.]])
+    """
+    y = np.asarray(y, dtype=float)
+    primary = np.asarray(primary, dtype=float)
+    exposures = np.asarray(exposures, dtype=float).reshape(y.shape[0], -1)
+    valid = ~np.isnan(exposures) & ~np.isnan(y)[:, np.newaxis] & ~np.isnan(primary)[:, np.newaxis]
+    weights = valid.astype(float)
+    y, primary = np.nan_to_num(y), np.nan_to_num(primary)
+    h = np.where(valid, exposures, 0.)
+    # sums of the constant, primary and y terms over the rows of each fit
+    nobs, sum_p, sum_y, sum_pp, sum_py, sum_yy = (weights.T @ np.column_stack(
+        [np.ones(y.shape[0]), primary, y, primary**2, primary*y, y**2])).T
+    # sums involving each exposure column
+    sum_h, sum_hh, sum_ph, sum_hy = h.sum(axis=0), (h**2).sum(axis=0), primary @ h, y @ h
+    xtx = np.stack([np.stack([nobs, sum_p, sum_h], axis=-1),
+                    np.stack([sum_p, sum_pp, sum_ph], axis=-1),
+                    np.stack([sum_h, sum_ph, sum_hh], axis=-1)], axis=1)
+    xty = np.stack([sum_y, sum_py, sum_hy], axis=-1)
+    xtx_inv = np.linalg.inv(xtx)
+    params = (xtx_inv @ xty[..., np.newaxis])[..., 0]
+    ssr = sum_yy - (params*xty).sum(axis=-1)
+    rsquared = 1 - ssr/(sum_yy - sum_y**2/nobs)
+    rsquared_adj = 1 - (nobs - 1)/(nobs - 3)*(1 - rsquared)
+    cov = (ssr/(nobs - 3))[:, np.newaxis, np.newaxis]*xtx_inv
+    return HouseholdFits(params, cov, nobs, rsquared, rsquared_adj)
+
+def exposure_scale(column):
+    """Return the length scale in meters in the name of an exposure column (the radius of other_as_100m,
+    or the decay length of other_as_exp_5m), or NaN if it has none.
+
+    >>> exposure_scale('other_as_100m'), exposure_scale('other_as_exp_2.5m'), exposure_scale('other_as_exp')
+    (100.0, 2.5, nan)
+    """
+    match = re.search(r'_(\d+(?:\.\d+)?)m$', column)
+    return float(match.group(1)) if match else np.nan
+
+def exposure_sweep(data, columns, ext_params):
+    """Fit the household wells model to data with each of columns as the household well arsenic and solve
+    for the fractions of water from each source. ext_params maps the input parameter names to UncertainVals,
+    or is a list of such dicts, which are all solved from the same fits.
+    Returns a DataFrame with one row per column: its scale, the fit quality, the coefficients and the
+    solved fractions, with their uncertainties. For a list of dicts, it has one row per column for each,
+    with the number of the dict in a 'parameters' column."""
+    fits = household_fits(data['urine_as'], data['arsenic_ugl'], data[columns])
+    table = pd.DataFrame({'exposure': columns, 'scale_m': [exposure_scale(col) for col in columns],
+                          'nobs': fits.nobs, 'r2': fits.rsquared, 'r2_adj': fits.rsquared_adj})
+    for i, name in enumerate(COEFFICIENTS):
+        table[name] = fits.params[:, i]
+        table[name + '_uncertainty'] = np.sqrt(fits.cov[:, i, i])
+    if isinstance(ext_params, dict):
+        return solved_table(table, fits, ext_params)
+    return pd.concat([solved_table(table, fits, params).assign(parameters=i) for i, params in enumerate(ext_params)],
+                     ignore_index=True)
+
+def solved_table(table, fits, ext_params):
+    """Return table with the fractions of water from each source solved from fits for one set of input
+    parameters, with their uncertainties."""
+    params = {name: v for name, v in ext_params.items() if name not in COEFFICIENTS}
+    solved = solve_batch(household_model(), params, COEFFICIENTS, fits.params, fits.cov)
+    table = table.copy()
+    for name, values in solved.items():
+        table[name] = values.value
+        table[name + '_uncertainty'] = values.uncertainty
+    return table
+
+def save_sweep(table, group_name):
+    """Save a table from exposure_sweep (optionally for several sets of input parameters, in a 'parameters'
+    column) to csv, and plot fit quality and the fractions from other wells against scale."""
+    table.to_csv(f'../araihazar-data/analysis_output/{group_name}_exposure_sweep.csv', index=False)
+    plot_exposure_sweep(table, group_name)
+
+def family_columns(data, exposures, wells_path, distances_path):
+    """Return data with a column for each exposure in exposures (specs as in ingest/neighbor_arsenic.py),
+    calculated from the wells table and the well distances."""
+    sys.path.append(os.path.join(os.path.dirname(os.path.abspath(__file__)), 'ingest'))
+    # pylint: disable=import-outside-toplevel
+    from neighbor_arsenic import build_csr, compute_exposures
+    from well_distances import load_wells, load_well_distances
+    wells = load_wells(wells_path)
+    csr = build_csr(wells, load_well_distances(distances_path))
+    # about 20 million weights at a time, however many exposures there are
+    exposures_table = compute_exposures(csr, exposures, max_pairs_per_chunk=max(1, 20_000_000//len(exposures)))
+    data = data.drop(columns=[col for col in exposures if col in data.columns])
+    return data.merge(exposures_table, on='well_id', how='left')
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--group', default='all', help="group of participants to fit (default: 'all')")
+    family = parser.add_mutually_exclusive_group()
+    family.add_argument('--columns', nargs='+', metavar='COLUMN',
+                        help='household well arsenic columns of the analysis data to sweep '
+                             '(default: the other_as_* columns for radii from 20 m to 500 m)')
+    family.add_argument('--radii', type=float, nargs=3, metavar=('START', 'STOP', 'STEP'),
+                        help='sweep the average arsenic of the other wells within each radius from START to STOP m')
+    family.add_argument('--decay-lengths', type=float, nargs=3, metavar=('START', 'STOP', 'STEP'),
+                        help='sweep arsenic of the other wells weighted by exp(-distance/decay length) for each '
+                             'decay length from START to STOP m')
+    parser.add_argument('--wells', default='../araihazar-data/to_ingest/wells.csv')
+    parser.add_argument('--distances', default='../araihazar-data/to_ingest/well_distances.npz')
+    parser.add_argument('--config', default=SWEEP_CONFIG,
+                        help='sweep config file whose first set of input parameters is used '
+                             '(default: sweep_config.json)')
+    args = parser.parse_args()
+    data = make_subset(load(), args.group)
+    columns = args.columns or RADIUS_COLUMNS
+    if args.radii or args.decay_lengths:
+        start, stop, step = args.radii or args.decay_lengths
+        scales = np.arange(start, stop + step/2, step)
+        if args.radii:
+            exposures = {f'other_as_{scale:g}m': {'weight': 'uniform', 'max_distance_m': scale} for scale in scales}
+        else:
+            exposures = {f'other_as_exp_{scale:g}m': {'weight': 'exponential', 'decay_length_m': scale}
+                         for scale in scales}
+        data = family_columns(data, exposures, os.path.abspath(args.wells), os.path.abspath(args.distances))
+        columns = list(exposures)
+    parameters = load_sweep_config(args.config).parameter_sets[0]
+    save_sweep(exposure_sweep(data, columns, {k: UncertainVal(*v) for k, v in parameters.items()}), args.group)
@@ -1,59 +1,107 @@
+"""Clean and combine the sources of the people data into the people table.
+
+The tables keyed by subject (age, sex, interview dates and the subject-well mapping) are read once and
+indexed by subject ID. The urine arsenic table, which has one row per person, can be read in chunks and
+joined to them chunk by chunk, so the output is written as it is made and cohorts of any size fit in memory.
+The output is a csv with the columns in the order ingest_people.pgsql copies them into the people table.
+"""
 #%% package imports
-import pandas as pd
+import argparse
 import os
-import numpy as np
-import datetime
-
-#%% file imports
-# people data
-age = pd.read_csv(os.path.abspath("../araihazar-data/to_clean/age.csv"))
-urine_as = pd.read_csv(os.path.abspath("../araihazar-data/to_clean/baseline_urine_as.csv"))
-sex = pd.read_csv(os.path.abspath("../araihazar-data/to_clean/sex.csv"))
-well = pd.read_csv(os.path.abspath("../araihazar-data/to_clean/subject_well_mapping.csv"))
-interview_date = pd.read_csv(os.path.abspath("../araihazar-data/to_clean/interview_dates.csv"))
-
-# well data
-all_wells = pd.read_csv(os.path.abspath("../araihazar-data/to_ingest/wells.csv"))
-
-#%% 
-
-# keep only people from original cohort
-well = well[well['cohort'] == 'OrigCohort']
-
-# how many people from orig cohort have wells without a known well As? 
-# It looks like about 10 people and 5 wells. 
-# Those people should be filtered out since we can't use them in our analysis
-# So do an inner join of the person-well mapping ('well' table) with the well data ('all_wells' table)
-well = pd.merge(left=well, right=all_wells, left_on='Index well', right_on='Well ID', how='inner')
-
-# inner join urine_as and well tables 
-# (inner join because we can only do a useful analysis on people with known primary well and known urine As)
-people = pd.merge(left=urine_as, right=well, left_on='SubjectID', right_on='subject ID', how='inner')
-people = people.drop('subject ID', axis=1)
-# left join that table with age table
-people = pd.merge(left=people, right=age, left_on='SubjectID', right_on='Subject', how='left')
-people = people.drop(['Subject'], axis=1)
-# left join with sex table
-people = pd.merge(left=people, right=sex, on='SubjectID', how='left')
-# left join with interview date table
-people = pd.merge(left=people, right=interview_date, on='SubjectID', how='left')
-
-# flag if knew well As
-people['knew_well_arsenic'] = False
-for i, row in people.iterrows():    
-    if ((datetime.datetime.strptime(row['DateInt'], '%Y-%m-%d') < datetime.datetime(2001, 1, 1)) 
-       or (row['Index well'] > 5000)):
-        knew_well_as = False
-    else:
-        knew_well_as = True
-    people.at[i,'knew_well_arsenic'] = knew_well_as
-
-# replace sex markers with something more meaningful
-people['Sex'] = people['Sex'].map({1: 'male', 2: 'female'})
-#make well id int type
-people = people.astype({'Index well': int})
-#reorder columns
-people = people[['SubjectID', 'Sex', 'Age','Index well', 'UrineAs', 'UrineCreat', 'UrAsgmCr', 'DateInt', 'knew_well_arsenic']]
-print(people.head(5))
-
-people.to_csv(os.path.abspath("../araihazar-data/to_clean/people.csv"), index=False)
\ No newline at end of file
+
+import pandas as pd
+
+from well_distances import load_wells
+
+# columns of people.csv, in the order ingest_people.pgsql copies them into the people table
+PEOPLE_COLUMNS = ['SubjectID', 'Sex', 'Age', 'Index well', 'UrineAs', 'UrineCreat', 'UrAsgmCr', 'DateInt',
+                  'knew_well_arsenic']
+# people may have known their well As if they were interviewed after well testing began,
+# unless their well was installed after the original survey (well IDs above 5000)
+WELL_TESTING_DATE = pd.Timestamp(2001, 1, 1)
+LAST_ORIGINAL_WELL_ID = 5000
+
+def knew_well_arsenic(interview_date, well_id):
+    """Return whether each person may have known their well arsenic when their urine arsenic was measured.
+    Raises ValueError if anyone has no interview date, since then it is not known.
+
+    >>> knew_well_arsenic(pd.to_datetime(pd.Series(['2000-06-01', '2001-06-01', '2001-06-01'])),
+    ...                   pd.Series([10, 10, 6000])).tolist()
+    [False, True, False]
+    >>> knew_well_arsenic(pd.to_datetime(pd.Series(['2001-06-01', None])), pd.Series([10, 10]))
+    Traceback (most recent call last):
+    ...
+    ValueError: 1 people have no interview date, so whether they knew their well arsenic is unknown
+    """
+    missing = interview_date.isna()
+    if missing.any():
+        raise ValueError(f'{missing.sum()} people have no interview date, '
+                         'so whether they knew their well arsenic is unknown')
+    return ~((interview_date < WELL_TESTING_DATE) | (well_id > LAST_ORIGINAL_WELL_ID))
+
+def load_lookups(to_clean_dir, wells_path):
+    """Read the tables that are joined to the urine arsenic table, each indexed by subject ID."""
+    def read(file_name):
+        return pd.read_csv(os.path.join(to_clean_dir, file_name))
+    well = read('subject_well_mapping.csv')
+    # keep only people from original cohort
+    well = well[well['cohort'] == 'OrigCohort']
+    # how many people from orig cohort have wells without a known well As?
+    # It looks like about 10 people and 5 wells.
+    # Those people should be filtered out since we can't use them in our analysis
+    wells = load_wells(wells_path)
+    known_wells = wells.loc[wells['arsenic_ugl'].notna(), 'well_id']
+    well = well[well['Index well'].isin(known_wells)]
+    return {'well': well.set_index('subject ID')[['Index well']],
+            'age': read('age.csv').set_index('Subject')[['Age']],
+            'sex': read('sex.csv').set_index('SubjectID')[['Sex']],
+            'interview_date': read('interview_dates.csv').set_index('SubjectID')[['DateInt']]}
+
+def clean_people(urine_as, lookups):
+    """Return the rows of the people table for the people in (a chunk of) the urine arsenic table."""
+    # inner join with the well table
+    # (inner join because we can only do a useful analysis on people with known primary well and known urine As)
+    people = urine_as.join(lookups['well'], on='SubjectID', how='inner')
+    # left join with the age, sex and interview date tables
+    people = people.join(lookups['age'], on='SubjectID').join(lookups['sex'], on='SubjectID')
+    people = people.join(lookups['interview_date'], on='SubjectID')
+    # flag if knew well As
+    people['knew_well_arsenic'] = knew_well_arsenic(pd.to_datetime(people['DateInt'], format='%Y-%m-%d'),
+                                                    people['Index well'])
+    # replace sex markers with something more meaningful
+    people['Sex'] = people['Sex'].map({1: 'male', 2: 'female'})
+    # integer types, leaving missing ages empty so that COPY loads them as NULL
+    people = people.astype({'Index well': int, 'Age': 'Int64'})
+    return people[PEOPLE_COLUMNS]
+
+def clean_people_data(to_clean_dir, wells_path, out_path, chunksize=None):
+    """Clean the people data in to_clean_dir and save it to out_path, reading the urine arsenic
+    table chunksize rows at a time (all at once if chunksize is None). Returns the number of people saved."""
+    lookups = load_lookups(to_clean_dir, wells_path)
+    urine_as = pd.read_csv(os.path.join(to_clean_dir, 'baseline_urine_as.csv'), chunksize=chunksize)
+    if chunksize is None:
+        urine_as = [urine_as]
+    count = 0
+    for chunk in urine_as:
+        people = clean_people(chunk, lookups)
+        people.to_csv(out_path, mode='w' if count == 0 else 'a', header=count == 0, index=False)
+        if count == 0:
+            print(people.head(5))
+        count += len(people)
+    return count
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--to-clean', default='../araihazar-data/to_clean',
+                        help='folder with age.csv, baseline_urine_as.csv, interview_dates.csv, sex.csv '
+                             'and subject_well_mapping.csv')
+    parser.add_argument('--wells', default='../araihazar-data/to_ingest/wells.csv')
+    parser.add_argument('--out', default='../araihazar-data/to_ingest/people.csv')
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help='number of rows of the urine arsenic table to clean at a time (default: all)')
+    args = parser.parse_args()
+    count = clean_people_data(os.path.abspath(args.to_clean), os.path.abspath(args.wells), os.path.abspath(args.out),
+                              args.chunksize)
+    print(f'saved {count} people to {args.out}')
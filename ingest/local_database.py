@@ -0,0 +1,155 @@
+"""Store the wells and people tables in a local SQLite database instead of PostGIS.
+
+SQLite is part of Python's standard library, so no database server is needed. The tables have the
+same columns as those made by ingest_wells.pgsql, ingest_people.pgsql and ingest_other_well_arsenic.pgsql,
+each table is loaded in one transaction, wells are indexed by position with an R*Tree, and
+extract() returns the same data as get_data_from_db.pgsql.
+"""
+#%% package imports
+import sqlite3
+
+import numpy as np
+import pandas as pd
+
+from neighbor_arsenic import EXPOSURES
+from well_distances import WELL_COLUMNS, DISTANCE_COLUMNS, geodesic_distance
+
+DATABASE_PATH = '../araihazar-data/araihazar.sqlite'
+
+# columns of the people table, in the order of the columns of people.csv
+PEOPLE_COLUMNS = ['subject_id', 'sex', 'age', 'well_id', 'urine_as', 'urine_creatinine', 'urine_as_gmcr',
+                  'interview_date', 'knew_well_as']
+
+SCHEMA = {
+    'wells': '''
+        well_id integer PRIMARY KEY,
+        union_name text,
+        village text,
+        owner_name text,
+        arsenic_ugl real NOT NULL,
+        latitude real NOT NULL,
+        longitude real NOT NULL,
+        depth real,
+        year integer''',
+    'people': '''
+        subject_id integer PRIMARY KEY,
+        sex text,
+        age integer,
+        well_id integer REFERENCES wells(well_id),
+        urine_as real,
+        urine_creatinine real,
+        urine_as_gmcr real,
+        interview_date text,
+        knew_well_as integer''',
+    'well_distances': '''
+        well1_id integer,
+        well2_id integer,
+        well2_arsenic_ugl real,
+        distance_m real,
+        PRIMARY KEY (well1_id, well2_id)''',
+    'other_well_arsenic': 'well_id integer PRIMARY KEY REFERENCES wells(well_id),\n' +
+                          ',\n'.join(f'        {name} real' for name in EXPOSURES),
+}
+
+# the other_as_* columns in the analysis data, as in get_data_from_db.pgsql, and the area-average arsenic
+EXTRACT_EXPOSURES = ['other_as_50m', 'other_as_100m', 'other_as_200m', 'other_as_300m', 'other_as_400m',
+                     'other_as_500m', 'avg_as_500m']
+
+EXTRACT_QUERY = '''
+SELECT people.subject_id,
+       people.urine_as,
+       people.knew_well_as,
+       people.sex,
+       people.age,
+       wells.well_id,
+       wells.arsenic_ugl,
+       wells.depth,
+       wells.union_name,
+       wells.village,
+''' + ''.join(f'       o.{name},\n' for name in EXTRACT_EXPOSURES) + '''
+       --if there were no wells within 30 m, use well arsenic from primary well
+       COALESCE(o.other_as_30m, wells.arsenic_ugl) AS other_as_30m,
+       COALESCE(o.other_as_20m, wells.arsenic_ugl) AS other_as_20m
+FROM people
+JOIN wells ON people.well_id = wells.well_id
+LEFT JOIN other_well_arsenic o ON o.well_id = wells.well_id
+ORDER BY people.subject_id
+'''
+
+def connect(path=DATABASE_PATH):
+    """Open the database at path (':memory:' for one held in memory), creating any missing tables."""
+    connection = sqlite3.connect(path)
+    # the database is rebuilt from the csv files whenever they change, so durability is not needed
+    connection.execute('PRAGMA journal_mode = OFF')
+    connection.execute('PRAGMA synchronous = OFF')
+    for table, columns in SCHEMA.items():
+        connection.execute(f'CREATE TABLE IF NOT EXISTS {table} ({columns})')
+    connection.execute('CREATE VIRTUAL TABLE IF NOT EXISTS wells_position '
+                       'USING rtree(well_id, min_latitude, max_latitude, min_longitude, max_longitude)')
+    return connection
+
+def replace_table(connection, table, data):
+    """Replace the contents of table with the columns of the DataFrame data, which are in the order of
+    the table's columns, in one transaction."""
+    columns = [np.where(pd.isna(data[col]), None, data[col].astype(object)) for col in data.columns]
+    placeholders = ', '.join('?'*len(columns))
+    with connection:
+        connection.execute(f'DELETE FROM {table}')
+        connection.executemany(f'INSERT INTO {table} VALUES ({placeholders})', zip(*columns))
+
+def load_wells(connection, wells):
+    """Load the wells table (with the columns in WELL_COLUMNS) and index the wells by position."""
+    replace_table(connection, 'wells', wells[WELL_COLUMNS])
+    with connection:
+        connection.execute('DELETE FROM wells_position')
+        connection.execute('INSERT INTO wells_position SELECT well_id, latitude, latitude, longitude, longitude '
+                           'FROM wells')
+
+def load_people(connection, people):
+    """Load the people table from people.csv, as saved by clean_people_data.py."""
+    people = people.set_axis(PEOPLE_COLUMNS, axis=1)
+    replace_table(connection, 'people', people.astype({'knew_well_as': int}))
+
+def load_well_distances(connection, well_distances):
+    """Load the well_distances table, as made by well_distances.find_neighbor_pairs."""
+    replace_table(connection, 'well_distances', well_distances[DISTANCE_COLUMNS])
+
+def load_exposures(connection, exposures_table):
+    """Load the other_well_arsenic table, as made by neighbor_arsenic.compute_exposures."""
+    # make the table again, in case exposures have been added to EXPOSURES since the database was made
+    with connection:
+        connection.execute('DROP TABLE IF EXISTS other_well_arsenic')
+        connection.execute(f'CREATE TABLE other_well_arsenic ({SCHEMA["other_well_arsenic"]})')
+    replace_table(connection, 'other_well_arsenic', exposures_table[['well_id'] + list(EXPOSURES)])
+
+def extract(connection):
+    """Return the data for the analysis stage (data_for_regressions.csv), as get_data_from_db.pgsql does."""
+    data = pd.read_sql_query(EXTRACT_QUERY, connection)
+    data['knew_well_as'] = data['knew_well_as'].astype(bool)
+    return data
+
+def wells_near(connection, latitude, longitude, radius_m):
+    """Return the wells within radius_m meters of a point, with their distance from it in a
+    distance_m column, nearest first.
+
+    >>> connection = connect(':memory:')
+    >>> load_wells(connection, pd.DataFrame({'well_id': [1, 2, 3], 'union_name': 'A', 'village': 'v',
+    ...     'owner_name': 'x', 'arsenic_ugl': [10., 20., 30.], 'latitude': [23.8, 23.8, 23.81],
+    ...     'longitude': [90.6, 90.601, 90.6], 'depth': 20., 'year': 2000}))
+    >>> wells_near(connection, 23.8, 90.6, 500)[['well_id', 'distance_m']].round(1).values.tolist()
+    [[1.0, 0.0], [2.0, 101.9]]
+    """
+    # search a box in degrees that holds the circle, then keep the wells in the circle
+    half_height = radius_m/110_000
+    half_width = half_height/np.cos(np.radians(latitude))
+    wells = pd.read_sql_query(
+        'SELECT wells.* FROM wells JOIN wells_position ON wells.well_id = wells_position.well_id '
+        'WHERE min_latitude <= ? AND max_latitude >= ? AND min_longitude <= ? AND max_longitude >= ?',
+        connection, params=(latitude + half_height, latitude - half_height,
+                            longitude + half_width, longitude - half_width))
+    wells['distance_m'] = geodesic_distance(latitude, longitude, wells['latitude'], wells['longitude'])
+    return wells[wells['distance_m'] <= radius_m].sort_values('distance_m', ignore_index=True)
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -0,0 +1,179 @@
+"""Calculate arsenic from combinations of neighboring wells (the other_as_* columns) in one pass.
+
+This replaces running the queries in get_other_well_arsenic.pgsql one at a time. The well_distances
+table is stored as compressed sparse rows (for each well, the positions of its neighbors, the distances
+to them and their arsenic), and every exposure in EXPOSURES is aggregated over it with array operations.
+To add a new exposure, add an entry to EXPOSURES.
+"""
+#%% package imports
+import argparse
+import os
+from collections import namedtuple
+
+import numpy as np
+import pandas as pd
+
+from well_distances import load_wells, load_well_distances
+
+# Each exposure is a weighted average of the arsenic of other wells. Keys of each entry:
+#   weight: 'uniform' (equal weights), 'inverse_distance' (1/distance),
+#           'exponential' (exp(-distance/decay_length_m)) or 'gaussian' (exp(-(distance/bandwidth_m)**2/2))
+#   min_distance_m: only use wells further away than this (default: no lower limit)
+#   max_distance_m: only use wells at most this far away (default: all wells in well_distances, which only
+#                   has the pairs of wells within its radius, 500 m by default, so no exposure reaches further)
+#   decay_length_m: length scale for exponential weights
+#   bandwidth_m: length scale for gaussian weights
+#   round_up_distance_m: distances below this are rounded up to it when calculating weights
+EXPOSURES = {
+    # assume person drinks equally from all wells within the given distance
+    'other_as_20m': {'weight': 'uniform', 'max_distance_m': 20},
+    'other_as_30m': {'weight': 'uniform', 'max_distance_m': 30},
+    'other_as_50m': {'weight': 'uniform', 'max_distance_m': 50},
+    'other_as_100m': {'weight': 'uniform', 'max_distance_m': 100},
+    'other_as_200m': {'weight': 'uniform', 'max_distance_m': 200},
+    'other_as_300m': {'weight': 'uniform', 'max_distance_m': 300},
+    'other_as_400m': {'weight': 'uniform', 'max_distance_m': 400},
+    'other_as_500m': {'weight': 'uniform', 'max_distance_m': 500},
+    # assume person drinks from all other wells in proportion to 1/distance to each well,
+    # for wells beyond 50 m. get_other_well_arsenic.pgsql summed over all other wells, but only wells
+    # within the radius of well_distances are kept, so this is cut off at 500 m; the 1/distance weights
+    # of the wells further away are left out
+    'other_as_hyp_beyond_50': {'weight': 'inverse_distance', 'min_distance_m': 50, 'max_distance_m': 500},
+    # assume person drinks from all other wells in an amount that decreases exponentially with distance
+    'other_as_exp': {'weight': 'exponential', 'decay_length_m': 1},
+    # version where all distances below 5 m are rounded up to 5 m
+    'other_as_exp_dist_round': {'weight': 'exponential', 'decay_length_m': 1, 'round_up_distance_m': 5},
+    # only for wells beyond 30 m from primary well
+    'other_as_exp_beyond_30': {'weight': 'exponential', 'decay_length_m': 1, 'min_distance_m': 30},
+    # area-average arsenic of the other wells around each well, a local version of the study-wide
+    # average (avgAs) in the distributed wells model; the radius can be at most that of well_distances
+    'avg_as_500m': {'weight': 'gaussian', 'bandwidth_m': 250, 'max_distance_m': 500},
+}
+
+# neighbors of the well in row i of the wells table are at positions indptr[i]:indptr[i+1]
+# of neighbor (row in the wells table), distance_m and arsenic_ugl
+NeighborCSR = namedtuple('NeighborCSR', ['well_id', 'indptr', 'neighbor', 'distance_m', 'arsenic_ugl'])
+
+def build_csr(wells, well_distances):
+    """Return the well_distances table as a NeighborCSR over the rows of the wells table."""
+    well_id = wells['well_id'].to_numpy()
+    order = np.argsort(well_id, kind='stable')
+    # row in the wells table of each well in each pair
+    row1 = order[np.searchsorted(well_id, well_distances['well1_id'].to_numpy(), sorter=order)]
+    row2 = order[np.searchsorted(well_id, well_distances['well2_id'].to_numpy(), sorter=order)]
+    sort = np.argsort(row1, kind='stable')
+    row1, row2 = row1[sort], row2[sort]
+    indptr = np.zeros(well_id.shape[0] + 1, dtype=np.int64)
+    np.cumsum(np.bincount(row1, minlength=well_id.shape[0]), out=indptr[1:])
+    # take neighbor arsenic from the wells table, so that it is always current
+    arsenic = wells['arsenic_ugl'].to_numpy(dtype=float)
+    return NeighborCSR(well_id, indptr, row2,
+                       well_distances['distance_m'].to_numpy(dtype=float)[sort], arsenic[row2])
+
+def exposure_weights(distance, spec):
+    """Return the weight of each neighbor at the given distances for one exposure,
+    with zero weight for neighbors outside its distance range. Exponential weights
+    are relative to the nearest neighbor in distance, so only their ratios are meaningful.
+
+    >>> exposure_weights(np.array([10., 40., 80.]), {'weight': 'uniform', 'max_distance_m': 50})
+    array([1., 1., 0.])
+    >>> exposure_weights(np.array([10., 40., 80.]), {'weight': 'inverse_distance', 'min_distance_m': 20})
+    array([0.    , 0.025 , 0.0125])
+    >>> exposure_weights(np.array([0., 100., 600.]), {'weight': 'gaussian', 'bandwidth_m': 100, 'max_distance_m': 500})
+    array([1.        , 0.60653066, 0.        ])
+    """
+    included = np.ones(distance.shape, dtype=bool)
+    if 'min_distance_m' in spec:
+        included &= distance > spec['min_distance_m']
+    if 'max_distance_m' in spec:
+        included &= distance <= spec['max_distance_m']
+    distance = np.maximum(distance, spec.get('round_up_distance_m', 0))
+    if spec['weight'] == 'uniform':
+        weights = np.ones(distance.shape)
+    elif spec['weight'] == 'inverse_distance':
+        with np.errstate(divide='ignore'):
+            weights = 1/distance
+    elif spec['weight'] == 'exponential':
+        # shifting all distances by the same amount does not change the weighted average,
+        # but keeps exp() from underflowing to zero for wells with no very close neighbors
+        nearest = distance[included].min() if included.any() else 0
+        weights = np.exp(-(distance - nearest)/spec['decay_length_m'])
+    elif spec['weight'] == 'gaussian':
+        weights = np.exp(-(distance/spec['bandwidth_m'])**2/2)
+    else:
+        raise ValueError(f'unknown weight {spec["weight"]!r}')
+    return np.where(included, weights, 0)
+
+def compute_exposures(csr, exposures=None, rows=None, max_pairs_per_chunk=5_000_000):
+    """Return a DataFrame with a well_id column and one column per exposure, giving the weighted
+    average arsenic of each well's neighbors (NaN for wells with no neighbors in range).
+    If rows is given, only those rows of the wells table are calculated."""
+    if exposures is None:
+        exposures = EXPOSURES
+    if rows is None:
+        rows = np.arange(csr.well_id.shape[0])
+    rows = np.asarray(rows, dtype=np.int64)
+    counts = csr.indptr[rows + 1] - csr.indptr[rows]
+    results = np.full((rows.shape[0], len(exposures)), np.nan)
+    # work through the wells in chunks of about max_pairs_per_chunk pairs to bound memory
+    cumulative = np.cumsum(counts)
+    boundaries = np.searchsorted(cumulative, np.arange(max_pairs_per_chunk, cumulative[-1] if rows.shape[0] else 0,
+                                                       max_pairs_per_chunk))
+    for chunk in np.split(np.arange(rows.shape[0]), np.unique(boundaries)):
+        chunk = chunk[counts[chunk] > 0]
+        if chunk.shape[0] == 0:
+            continue
+        # positions in csr of the pairs for the wells in this chunk, which are contiguous for each well
+        chunk_counts = counts[chunk]
+        chunk_starts = np.cumsum(chunk_counts) - chunk_counts
+        pairs = np.arange(chunk_counts.sum()) + np.repeat(csr.indptr[rows[chunk]] - chunk_starts, chunk_counts)
+        distance = csr.distance_m[pairs]
+        weights = np.column_stack([_chunk_weights(distance, chunk_starts, chunk_counts, spec)
+                                   for spec in exposures.values()])
+        # sum the weights and weighted arsenic for every well and exposure at once
+        weight_sums = np.add.reduceat(weights, chunk_starts, axis=0)
+        arsenic_sums = np.add.reduceat(weights*csr.arsenic_ugl[pairs][:, np.newaxis], chunk_starts, axis=0)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            results[chunk] = np.where(weight_sums > 0, arsenic_sums/weight_sums, np.nan)
+    out = pd.DataFrame(results, columns=list(exposures))
+    out.insert(0, 'well_id', csr.well_id[rows])
+    return out
+
+def _chunk_weights(distance, starts, counts, spec):
+    """Return exposure_weights for the pairs of many wells, stored contiguously from starts,
+    shifting exponential weights by each well's own nearest included neighbor."""
+    if spec['weight'] != 'exponential':
+        return exposure_weights(distance, spec)
+    included = exposure_weights(distance, {**spec, 'weight': 'uniform'}) > 0
+    shifted = np.where(included, np.maximum(distance, spec.get('round_up_distance_m', 0)), np.inf)
+    nearest = np.minimum.reduceat(shifted, starts)
+    nearest = np.where(np.isfinite(nearest), nearest, 0)
+    return np.where(included, np.exp(-(shifted - np.repeat(nearest, counts))/spec['decay_length_m']), 0)
+
+def add_exposures_to_extract(data, exposures_table):
+    """Replace the exposure columns of the analysis data (data_for_regressions.csv) with those in
+    exposures_table, matching on well_id. As in get_data_from_db.pgsql, other_as_20m and other_as_30m
+    use the primary well arsenic for wells with no other wells in range."""
+    data = data.drop(columns=[col for col in exposures_table.columns if col != 'well_id' and col in data.columns])
+    data = data.merge(exposures_table, on='well_id', how='left')
+    for col in ['other_as_20m', 'other_as_30m']:
+        if col in data.columns:
+            data[col] = data[col].fillna(data['arsenic_ugl'])
+    return data
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--wells', default='../araihazar-data/to_ingest/wells.csv')
+    parser.add_argument('--distances', default='../araihazar-data/to_ingest/well_distances.npz')
+    parser.add_argument('--out', default='../araihazar-data/to_ingest/other_well_arsenic.csv')
+    parser.add_argument('--update-extract', metavar='PATH',
+                        help='also replace the exposure columns of this data_for_regressions.csv')
+    args = parser.parse_args()
+    wells = load_wells(os.path.abspath(args.wells))
+    exposures_table = compute_exposures(build_csr(wells, load_well_distances(os.path.abspath(args.distances))))
+    exposures_table.to_csv(os.path.abspath(args.out), index=False)
+    if args.update_extract:
+        extract = add_exposures_to_extract(pd.read_csv(os.path.abspath(args.update_extract)), exposures_table)
+        extract.to_csv(os.path.abspath(args.update_extract), index=False)
@@ -0,0 +1,60 @@
+"""Run the whole data wrangling stage with one command, using the local SQLite database.
+
+This cleans the people data, loads the wells and people into the database, finds the pairs of wells
+within --radius meters of each other, calculates arsenic from combinations of neighboring wells, and
+saves the data for the analysis stage to 'to_analyze/data_for_regressions.csv', replacing
+ingest_wells.pgsql, ingest_people.pgsql, get_well_dist.pgsql, get_other_well_arsenic.pgsql
+and get_data_from_db.pgsql.
+"""
+#%% package imports
+import argparse
+import os
+import time
+
+import pandas as pd
+
+import local_database
+from clean_people_data import clean_people_data
+from neighbor_arsenic import build_csr, compute_exposures
+from well_distances import find_neighbor_pairs, load_wells, save_well_distances
+
+def refresh_database(data_dir, database_path, radius_m=500, chunksize=None):
+    """Rebuild the database at database_path and the analysis data from the files in data_dir
+    (the araihazar-data repo). Returns the analysis data."""
+    def path(*parts):
+        return os.path.join(data_dir, *parts)
+    start = time.perf_counter()
+    def report(step):
+        print(f'{time.perf_counter() - start:7.2f} s  {step}')
+
+    clean_people_data(path('to_clean'), path('to_ingest', 'wells.csv'), path('to_ingest', 'people.csv'), chunksize)
+    report('cleaned people data')
+    connection = local_database.connect(database_path)
+    wells = load_wells(path('to_ingest', 'wells.csv'))
+    local_database.load_wells(connection, wells)
+    local_database.load_people(connection, pd.read_csv(path('to_ingest', 'people.csv')))
+    report('loaded wells and people')
+    well_distances = find_neighbor_pairs(wells, radius_m)
+    save_well_distances(well_distances, path('to_ingest', 'well_distances.npz'))
+    local_database.load_well_distances(connection, well_distances)
+    report(f'found {well_distances.shape[0]} well pairs within {radius_m:g} m')
+    exposures_table = compute_exposures(build_csr(wells, well_distances))
+    exposures_table.to_csv(path('to_ingest', 'other_well_arsenic.csv'), index=False)
+    local_database.load_exposures(connection, exposures_table)
+    report('calculated arsenic from neighboring wells')
+    data = local_database.extract(connection)
+    connection.close()
+    data.to_csv(path('to_analyze', 'data_for_regressions.csv'), index=False)
+    report(f'saved {data.shape[0]} people for analysis')
+    return data
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--data', default='../araihazar-data', help='the araihazar-data repo')
+    parser.add_argument('--database', default=local_database.DATABASE_PATH)
+    parser.add_argument('--radius', type=float, default=500,
+                        help='largest distance between wells to keep, in meters (default: 500)')
+    parser.add_argument('--chunksize', type=int, default=None,
+                        help='number of rows of the urine arsenic table to clean at a time (default: all)')
+    args = parser.parse_args()
+    refresh_database(os.path.abspath(args.data), os.path.abspath(args.database), args.radius, args.chunksize)
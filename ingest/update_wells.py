@@ -0,0 +1,135 @@
+"""Update the well distances and the arsenic from combinations of neighboring wells after some wells
+are added, removed, moved or re-tested, without rebuilding them for every well.
+
+Only the pairs of wells that include a changed well are recomputed, using the KD-tree from
+well_distances.py to find the changed wells' new neighbors, and only the other_as_* exposures of the
+changed wells and of their old and new neighbors are calculated again.
+"""
+#%% package imports
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+
+from neighbor_arsenic import build_csr, compute_exposures, add_exposures_to_extract
+from well_distances import (build_tree, geodesic_distance, load_wells, load_well_distances,
+                            save_well_distances)
+
+def changed_wells(old_wells, new_wells):
+    """Return the IDs of the wells that were added, removed, moved or re-tested between two versions of
+    the wells table.
+
+    >>> old = pd.DataFrame({'well_id': [1, 2, 3], 'arsenic_ugl': [10., 20., 30.],
+    ...                     'latitude': [23.8, 23.8, 23.8], 'longitude': [90.6, 90.61, 90.62]})
+    >>> new = pd.DataFrame({'well_id': [1, 3, 4], 'arsenic_ugl': [10., 35., 5.],
+    ...                     'latitude': [23.8, 23.8, 23.9], 'longitude': [90.6, 90.62, 90.6]})
+    >>> changed_wells(old, new).tolist()
+    [2, 3, 4]
+    """
+    columns = ['arsenic_ugl', 'latitude', 'longitude']
+    both = old_wells.set_index('well_id')[columns].join(new_wells.set_index('well_id')[columns], how='outer',
+                                                         lsuffix='_old', rsuffix='_new')
+    differs = np.zeros(len(both), dtype=bool)
+    for col in columns:
+        old, new = both[col + '_old'], both[col + '_new']
+        differs |= (old != new) & ~(old.isna() & new.isna())
+    return both.index[differs].to_numpy()
+
+def update_well_distances(wells, well_distances, changed_ids, radius_m=500, tree=None):
+    """Return the well_distances table for the current wells table, updating only the pairs that
+    include a well in changed_ids, and the IDs of the wells whose neighbors changed (the changed
+    wells that still exist, and their old and new neighbors)."""
+    changed_ids = np.asarray(changed_ids)
+    involves_changed = (well_distances['well1_id'].isin(changed_ids) | well_distances['well2_id'].isin(changed_ids))
+    old_neighbors = well_distances.loc[well_distances['well1_id'].isin(changed_ids), 'well2_id'].to_numpy()
+    if tree is None:
+        tree = build_tree(wells)
+    well_id = wells['well_id'].to_numpy()
+    latitude = wells['latitude'].to_numpy(dtype=float)
+    longitude = wells['longitude'].to_numpy(dtype=float)
+    arsenic = wells['arsenic_ugl'].to_numpy(dtype=np.float32)
+    rows = np.flatnonzero(np.isin(well_id, changed_ids))
+    # chord distances are never longer than distances along the ellipsoid, so
+    # searching the tree with the same radius finds every pair we need
+    neighbors = tree.query_ball_point(tree.data[rows], radius_m)
+    first = np.repeat(rows, [len(found) for found in neighbors])
+    second = np.concatenate([np.asarray(found, dtype=np.int64) for found in neighbors] + [np.empty(0, np.int64)])
+    distance = geodesic_distance(latitude[first], longitude[first], latitude[second], longitude[second])
+    keep = (first != second) & (distance <= radius_m)
+    first, second, distance = first[keep], second[keep], distance[keep]
+    # store each pair in both directions, except pairs of two changed wells, which are found from both ends
+    both_changed = np.isin(second, rows)
+    well1 = np.concatenate([first, second[~both_changed]])
+    well2 = np.concatenate([second, first[~both_changed]])
+    distance = np.concatenate([distance, distance[~both_changed]])
+    new_pairs = pd.DataFrame({'well1_id': well_id[well1].astype(np.int32),
+                              'well2_id': well_id[well2].astype(np.int32),
+                              'well2_arsenic_ugl': arsenic[well2],
+                              'distance_m': distance.astype(np.float32)})
+    updated = pd.concat([well_distances[~involves_changed], new_pairs], ignore_index=True)
+    updated = updated.sort_values(['well1_id', 'well2_id'], ignore_index=True)
+    affected = np.union1d(np.union1d(well_id[rows], well_id[second]), old_neighbors)
+    return updated, affected[np.isin(affected, well_id)]
+
+def update_exposures(wells, well_distances, exposures_table, affected_ids):
+    """Return exposures_table (as made by neighbor_arsenic.compute_exposures) for the current wells
+    table, recalculating only the wells in affected_ids."""
+    csr = build_csr(wells, well_distances)
+    rows = np.flatnonzero(np.isin(csr.well_id, affected_ids))
+    recalculated = compute_exposures(csr, rows=rows)
+    kept = exposures_table[exposures_table['well_id'].isin(csr.well_id) &
+                           ~exposures_table['well_id'].isin(affected_ids)]
+    return pd.concat([kept, recalculated], ignore_index=True).sort_values('well_id', ignore_index=True)
+
+def stale_subjects(data, changed_ids, affected_ids):
+    """Return the subject IDs of the rows of the analysis data whose primary well changed or whose
+    primary well's neighbors changed."""
+    stale = data['well_id'].isin(changed_ids) | data['well_id'].isin(affected_ids)
+    return data.loc[stale, 'subject_id'].to_numpy()
+
+def update_wells(wells, well_distances, exposures_table, changed_ids, radius_m=500):
+    """Return the well_distances table, exposures table, and IDs of the wells whose exposures were
+    recalculated, after the wells in changed_ids were added, removed, moved or re-tested."""
+    well_distances, affected_ids = update_well_distances(wells, well_distances, changed_ids, radius_m)
+    exposures_table = update_exposures(wells, well_distances, exposures_table, affected_ids)
+    return well_distances, exposures_table, affected_ids
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--wells', default='../araihazar-data/to_ingest/wells.csv')
+    changes = parser.add_mutually_exclusive_group(required=True)
+    changes.add_argument('--changed', type=int, nargs='+', metavar='WELL_ID',
+                         help='IDs of the wells that were added, removed, moved or re-tested')
+    changes.add_argument('--previous-wells', metavar='PATH',
+                         help='the previous version of wells.csv, to find the changed wells from')
+    parser.add_argument('--radius', type=float, default=500,
+                        help='largest distance between wells kept in the well distances, in meters (default: 500)')
+    parser.add_argument('--distances', default='../araihazar-data/to_ingest/well_distances.npz')
+    parser.add_argument('--exposures', default='../araihazar-data/to_ingest/other_well_arsenic.csv')
+    parser.add_argument('--update-extract', metavar='PATH',
+                        help='also update the well arsenic and exposure columns of this data_for_regressions.csv, '
+                             'and list the subjects whose rows changed')
+    args = parser.parse_args()
+    wells = load_wells(os.path.abspath(args.wells))
+    if args.changed:
+        changed_ids = np.array(args.changed)
+    else:
+        changed_ids = changed_wells(load_wells(os.path.abspath(args.previous_wells)), wells)
+    well_distances, exposures_table, affected_ids = update_wells(
+        wells, load_well_distances(os.path.abspath(args.distances)), pd.read_csv(os.path.abspath(args.exposures)),
+        changed_ids, args.radius)
+    save_well_distances(well_distances, os.path.abspath(args.distances))
+    exposures_table.to_csv(os.path.abspath(args.exposures), index=False)
+    print(f'{len(changed_ids)} wells changed; recalculated exposures for {len(affected_ids)} wells')
+    if args.update_extract:
+        extract = pd.read_csv(os.path.abspath(args.update_extract))
+        stale = stale_subjects(extract, changed_ids, affected_ids)
+        print(f'{len(stale)} subjects in {args.update_extract} have changed well data: {stale.tolist()}')
+        # primary well arsenic of re-tested wells (kept as it was for removed wells)
+        current_arsenic = extract['well_id'].map(wells.set_index('well_id')['arsenic_ugl'])
+        extract['arsenic_ugl'] = current_arsenic.fillna(extract['arsenic_ugl'])
+        extract = add_exposures_to_extract(extract, exposures_table)
+        extract.to_csv(os.path.abspath(args.update_extract), index=False)
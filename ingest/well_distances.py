@@ -0,0 +1,120 @@
+"""Build the well_distances table in process with a KD-tree instead of an all-pairs SQL self-join.
+
+Well latitudes and longitudes are projected once onto the WGS 84 ellipsoid (earth-centred,
+earth-fixed coordinates), so that straight-line (chord) distances can be indexed with a KD-tree.
+Only pairs of wells within the search radius are kept, and their distances are then computed
+on the ellipsoid, matching the distances ST_DISTANCESPHEROID gives for nearby wells.
+"""
+#%% package imports
+import argparse
+import os
+
+import numpy as np
+import pandas as pd
+from scipy.spatial import cKDTree
+
+# WGS 84 ellipsoid, as in 'SPHEROID["WGS 84",6378137,298.257223563]' in get_well_dist.pgsql
+SEMI_MAJOR_AXIS_M = 6378137.0
+FLATTENING = 1/298.257223563
+ECCENTRICITY_SQ = FLATTENING*(2 - FLATTENING)
+
+# columns of wells.csv, in the order ingest_wells.pgsql copies them into the wells table
+WELL_COLUMNS = ['well_id', 'union_name', 'village', 'owner_name', 'arsenic_ugl',
+                'latitude', 'longitude', 'depth', 'year']
+# columns of the well_distances table
+DISTANCE_COLUMNS = ['well1_id', 'well2_id', 'well2_arsenic_ugl', 'distance_m']
+
+def load_wells(path):
+    """Read wells.csv, naming its columns as in the wells table."""
+    return pd.read_csv(path, header=0, names=WELL_COLUMNS)
+
+def project_wells(latitude, longitude):
+    """Return an (n, 3) array of earth-centred, earth-fixed coordinates in meters
+    for latitudes and longitudes in degrees.
+
+    >>> project_wells(np.array([0.0]), np.array([0.0]))
+    array([[6378137.,       0.,       0.]])
+    """
+    lat = np.radians(np.asarray(latitude, dtype=float))
+    lon = np.radians(np.asarray(longitude, dtype=float))
+    # prime vertical radius of curvature
+    prime_vertical = SEMI_MAJOR_AXIS_M/np.sqrt(1 - ECCENTRICITY_SQ*np.sin(lat)**2)
+    return np.column_stack([prime_vertical*np.cos(lat)*np.cos(lon),
+                            prime_vertical*np.cos(lat)*np.sin(lon),
+                            prime_vertical*(1 - ECCENTRICITY_SQ)*np.sin(lat)])
+
+def geodesic_distance(lat1, lon1, lat2, lon2):
+    """Return the distance in meters along the WGS 84 ellipsoid between points given in degrees.
+    Uses the meridional and prime vertical radii of curvature at the mean latitude,
+    which is accurate to well under a millimeter for points a few kilometers apart.
+
+    >>> round(float(geodesic_distance(23.8, 90.6, 23.8, 90.601)), 3)
+    101.908
+    """
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(v, dtype=float)) for v in (lat1, lon1, lat2, lon2))
+    mean_lat = (lat1 + lat2)/2
+    denominator = 1 - ECCENTRICITY_SQ*np.sin(mean_lat)**2
+    meridional = SEMI_MAJOR_AXIS_M*(1 - ECCENTRICITY_SQ)/denominator**1.5
+    prime_vertical = SEMI_MAJOR_AXIS_M/np.sqrt(denominator)
+    # wrap longitude differences into [-pi, pi)
+    dlon = (lon2 - lon1 + np.pi) % (2*np.pi) - np.pi
+    return np.hypot(meridional*(lat2 - lat1), prime_vertical*np.cos(mean_lat)*dlon)
+
+def build_tree(wells):
+    """Return a KD-tree over the projected positions of the wells."""
+    return cKDTree(project_wells(wells['latitude'], wells['longitude']))
+
+def find_neighbor_pairs(wells, radius_m, tree=None):
+    """Return the well_distances table for all ordered pairs of distinct wells
+    within radius_m meters of each other, sorted by well1_id and well2_id."""
+    if tree is None:
+        tree = build_tree(wells)
+    # chord distances are never longer than distances along the ellipsoid, so
+    # searching the tree with the same radius finds every pair we need
+    pairs = tree.query_pairs(radius_m, output_type='ndarray')
+    first, second = pairs[:, 0], pairs[:, 1]
+    latitude = wells['latitude'].to_numpy(dtype=float)
+    longitude = wells['longitude'].to_numpy(dtype=float)
+    distance = geodesic_distance(latitude[first], longitude[first], latitude[second], longitude[second])
+    keep = distance <= radius_m
+    first, second, distance = first[keep], second[keep], distance[keep]
+    # store each pair in both directions, as the SQL table does
+    well1 = np.concatenate([first, second])
+    well2 = np.concatenate([second, first])
+    distance = np.concatenate([distance, distance])
+    well_id = wells['well_id'].to_numpy()
+    order = np.lexsort((well_id[well2], well_id[well1]))
+    well1, well2, distance = well1[order], well2[order], distance[order]
+    return pd.DataFrame({'well1_id': well_id[well1].astype(np.int32),
+                         'well2_id': well_id[well2].astype(np.int32),
+                         'well2_arsenic_ugl': wells['arsenic_ugl'].to_numpy(dtype=np.float32)[well2],
+                         'distance_m': distance.astype(np.float32)})
+
+def save_well_distances(well_distances, path):
+    """Save the well_distances table, as a compressed .npz archive of columns or, for any
+    other extension, as a csv file that can be loaded into the database with COPY."""
+    if path.endswith('.npz'):
+        np.savez_compressed(path, **{col: well_distances[col].to_numpy() for col in DISTANCE_COLUMNS})
+    else:
+        well_distances.to_csv(path, columns=DISTANCE_COLUMNS, index=False)
+
+def load_well_distances(path):
+    """Load a well_distances table saved by save_well_distances."""
+    if path.endswith('.npz'):
+        with np.load(path) as archive:
+            return pd.DataFrame({col: archive[col] for col in DISTANCE_COLUMNS})
+    return pd.read_csv(path)
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--radius', type=float, default=500,
+                        help='largest distance between wells to keep, in meters (default: 500)')
+    parser.add_argument('--wells', default='../araihazar-data/to_ingest/wells.csv')
+    parser.add_argument('--out', default='../araihazar-data/to_ingest/well_distances.npz',
+                        help='output file, .npz for a compressed archive or .csv for COPY')
+    args = parser.parse_args()
+    well_distances = find_neighbor_pairs(load_wells(os.path.abspath(args.wells)), args.radius)
+    save_well_distances(well_distances, os.path.abspath(args.out))
+    print(f'saved {well_distances.shape[0]} well pairs within {args.radius:g} m to {args.out}')
@@ -0,0 +1,122 @@
+"""This module measures the time and memory taken by the stages of run_all (subset, regress, solve, plot
+and compare) for each set of input parameters."""
+import cProfile
+import json
+import os
+import sys
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+
+import pandas as pd
+import matplotlib.pyplot as plt
+
+try:
+    import resource
+except ImportError:
+    # not available on Windows
+    resource = None
+
+def process_peak_rss_mb():
+    """Return the peak resident memory of this process so far in MB, or None if it is not available."""
+    if resource is None:
+        return None
+    # ru_maxrss is in kB on Linux and in bytes on macOS
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return max_rss/1024**2 if sys.platform == 'darwin' else max_rss/1024
+
+def rss_mb():
+    """Return the resident memory of this process now in MB, or None if it is not available (it is read
+    from /proc, so only on Linux)."""
+    try:
+        with open('/proc/self/statm') as statm:
+            resident_pages = int(statm.read().split()[1])
+    except OSError:
+        return None
+    return resident_pages*os.sysconf('SC_PAGE_SIZE')/1024**2
+
+class StageTimer:
+    """
+    This is a class for recording the wall time, CPU time, memory and number of open figures
+    of each stage of a run. The memory recorded is the change in resident memory over the stage
+    (rss_change_mb) and the peak resident memory of the process up to the end of the stage
+    (process_peak_rss_mb), which is the same for every stage after the one that used the most.
+
+    Attributes:
+        labels (dict): Columns added to every record, such as the group name
+        trace_memory (bool): Whether to record the peak memory allocated by Python during each stage
+            with tracemalloc (which makes the run slower)
+        records (list): One dict per stage run
+    """
+    def __init__(self, trace_memory=False, **labels):
+        """
+        Initializes StageTimer with labels for its records.
+        """
+        self.labels = labels
+        self.trace_memory = trace_memory
+        self.records = []
+
+    @contextmanager
+    def stage(self, name):
+        """Record the stage run in the body of a with statement, also if it raises an exception
+        (with failed set to True).
+
+        >>> timer = StageTimer(group='all')
+        >>> with timer.stage('regress'):
+        ...     pass
+        >>> sorted(timer.records[0])[:5]
+        ['cpu_s', 'failed', 'figures', 'group', 'process_peak_rss_mb']
+        >>> with timer.stage('solve'):
+        ...     raise ValueError('no solution')
+        Traceback (most recent call last):
+        ...
+        ValueError: no solution
+        >>> timer.records[1]['stage'], timer.records[1]['failed']
+        ('solve', True)
+        """
+        if self.trace_memory:
+            if not tracemalloc.is_tracing():
+                tracemalloc.start()
+            tracemalloc.reset_peak()
+        rss_start = rss_mb()
+        wall_start, cpu_start = time.perf_counter(), time.process_time()
+        failed = True
+        try:
+            yield
+            failed = False
+        finally:
+            rss_end = rss_mb()
+            record = dict(self.labels, stage=name, wall_s=time.perf_counter() - wall_start,
+                          cpu_s=time.process_time() - cpu_start,
+                          rss_change_mb=None if rss_start is None or rss_end is None else rss_end - rss_start,
+                          process_peak_rss_mb=process_peak_rss_mb(), figures=len(plt.get_fignums()), failed=failed)
+            if self.trace_memory:
+                record['tracemalloc_peak_mb'] = tracemalloc.get_traced_memory()[1]/1024**2
+            self.records.append(record)
+
+def stage(timer, name):
+    """Return timer.stage(name), or a context that does nothing if timer is None."""
+    return nullcontext() if timer is None else timer.stage(name)
+
+def save_report(records, path_prefix):
+    """Save records as path_prefix + '.csv' (one row per stage run) and path_prefix + '.json'
+    (the records, and the total wall and CPU time of each stage)."""
+    # keep integer labels as integers where some records do not have them
+    records = pd.DataFrame(records).convert_dtypes(convert_string=False, convert_floating=False)
+    records.to_csv(path_prefix + '.csv', index=False)
+    totals = records.groupby('stage', sort=False)[['wall_s', 'cpu_s']].sum()
+    with open(path_prefix + '.json', 'w') as report_file:
+        json.dump({'stage_totals': totals.to_dict(orient='index'),
+                   'records': json.loads(records.to_json(orient='records'))}, report_file, indent=1)
+
+def profile_call(path, function, *args):
+    """Run function(*args) under cProfile, saving the profile to path (which can be read with pstats
+    or snakeviz). Returns the result of function."""
+    profiler = cProfile.Profile()
+    result = profiler.runcall(function, *args)
+    profiler.dump_stats(path)
+    return result
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
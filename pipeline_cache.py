@@ -0,0 +1,166 @@
+"""This module provides content hashes of pipeline inputs, used to skip stages whose inputs have not changed,
+and an on-disk cache of the results of pipeline steps, keyed by those hashes."""
+import glob
+import hashlib
+import json
+import os
+import pickle
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from results_sink import recording, replay
+
+CACHE_DIR = '../araihazar-data/analysis_output/.cache'
+# cached results of pipeline steps; the least recently used are deleted when they take up more than MAX_CACHE_BYTES
+RESULTS_DIR = os.path.join(CACHE_DIR, 'results')
+MAX_CACHE_BYTES = 2*1024**3
+# folder of the analysis modules; their sources are part of the key of every cached result
+SOURCE_DIR = os.path.dirname(os.path.abspath(__file__))
+
+def content_hash(*parts):
+    """Return a hex digest of the contents of parts, which may be DataFrames, Series, arrays,
+    dicts, lists, tuples, strings, numbers, or objects whose attributes are any of these.
+
+    >>> content_hash({'Q': 4.4, 'ff': 0.2}) == content_hash({'ff': 0.2, 'Q': 4.4})
+    True
+    >>> content_hash(np.array([1., 2.])) == content_hash(np.array([1., 3.]))
+    False
+    """
+    hasher = hashlib.blake2b(digest_size=16)
+    for part in parts:
+        update_hash(hasher, part)
+    return hasher.hexdigest()
+
+def update_hash(hasher, obj):
+    """Add the contents of obj to hasher, with its type so that equal bytes of different types differ."""
+    hasher.update(type(obj).__name__.encode())
+    if isinstance(obj, pd.DataFrame):
+        update_hash(hasher, [list(map(str, obj.columns)), list(map(str, obj.dtypes))])
+        hasher.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+    elif isinstance(obj, pd.Series):
+        update_hash(hasher, [str(obj.name), str(obj.dtype)])
+        hasher.update(pd.util.hash_pandas_object(obj, index=True).to_numpy().tobytes())
+    elif isinstance(obj, np.ndarray):
+        hasher.update(f'{obj.dtype}{obj.shape}'.encode())
+        hasher.update(np.ascontiguousarray(obj).tobytes())
+    elif isinstance(obj, dict):
+        for key in sorted(obj, key=str):
+            update_hash(hasher, str(key))
+            update_hash(hasher, obj[key])
+    elif isinstance(obj, (list, tuple)):
+        hasher.update(str(len(obj)).encode())
+        for item in obj:
+            update_hash(hasher, item)
+    elif isinstance(obj, bytes):
+        hasher.update(obj)
+    elif callable(obj) and hasattr(obj, '__qualname__'):
+        # functions and classes by name, since their repr includes their address in memory
+        update_hash(hasher, f'{obj.__module__}.{obj.__qualname__}')
+    elif hasattr(obj, '__dict__'):
+        update_hash(hasher, vars(obj))
+    elif hasattr(type(obj), '__slots__'):
+        # such as UncertainVal, hashed like an object with the same attributes in __dict__
+        update_hash(hasher, {name: getattr(obj, name) for name in type(obj).__slots__})
+    else:
+        hasher.update(repr(obj).encode())
+
+def file_hash(path):
+    """Return a hex digest of the contents of the file at path."""
+    hasher = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as infile:
+        for block in iter(lambda: infile.read(1 << 20), b''):
+            hasher.update(block)
+    return hasher.hexdigest()
+
+@lru_cache(maxsize=None)
+def source_hash(source_dir=SOURCE_DIR):
+    """Return a hex digest of the sources of every module in source_dir, so that results cached before any of
+    the code that makes them (including the modules it imports, such as uncertain_val.py) changed are not used."""
+    paths = sorted(glob.glob(os.path.join(source_dir, '*.py')))
+    return content_hash([(os.path.basename(path), file_hash(path)) for path in paths])
+
+def run_stage(stage_name, key, outputs, stage_function, *args):
+    """Run stage_function(*args), unless the stage already ran with the same key (a content hash of
+    its inputs), from the same code, and all of its output files still exist. Returns True if the stage ran.
+    The results the stage writes to the results sink are kept, and written to it again when the stage is skipped."""
+    key = content_hash(key, source_hash())
+    record_path = os.path.abspath(os.path.join(CACHE_DIR, f'{stage_name}.json'))
+    results_path = os.path.abspath(os.path.join(CACHE_DIR, f'{stage_name}_results.pkl'))
+    if os.path.exists(record_path):
+        with open(record_path) as record_file:
+            record = json.load(record_file)
+        if record['key'] == key and all(os.path.exists(path) for path in [*outputs, results_path]):
+            print(f'{stage_name} is up to date, skipping')
+            with open(results_path, 'rb') as results_file:
+                replay(pickle.load(results_file))
+            return False
+    with recording() as recorded:
+        stage_function(*args)
+    os.makedirs(os.path.dirname(record_path), exist_ok=True)
+    with open(results_path, 'wb') as results_file:
+        pickle.dump(recorded, results_file, protocol=pickle.HIGHEST_PROTOCOL)
+    with open(record_path, 'w') as record_file:
+        json.dump({'key': key, 'outputs': list(outputs)}, record_file, indent=1)
+    return True
+
+def cached_call(outputs, function, *args):
+    """Return function(*args), from the results cache if function has been called with the same args
+    (and none of the analysis modules has changed since). outputs are the files that function writes;
+    their contents are cached with its return value and written again when the result comes from the cache,
+    as are the results it writes to the results sink. args are hashed before function is called, so function
+    may modify them."""
+    key = content_hash(function.__module__, function.__qualname__, source_hash(), args, list(outputs))
+    path = os.path.abspath(os.path.join(RESULTS_DIR, key + '.pkl'))
+    try:
+        with open(path, 'rb') as cache_file:
+            result, files, recorded = pickle.load(cache_file)
+    except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+        pass
+    else:
+        # mark as recently used
+        os.utime(path)
+        for output, contents in files.items():
+            with open(os.path.abspath(output), 'wb') as outfile:
+                outfile.write(contents)
+        replay(recorded)
+        return result
+    with recording() as recorded:
+        result = function(*args)
+    files = {}
+    for output in outputs:
+        with open(os.path.abspath(output), 'rb') as infile:
+            files[output] = infile.read()
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    # write to a temporary file first, so that other processes never read a partly written result
+    temp_path = f'{path}.{os.getpid()}.tmp'
+    with open(temp_path, 'wb') as cache_file:
+        pickle.dump((result, files, recorded), cache_file, protocol=pickle.HIGHEST_PROTOCOL)
+    os.replace(temp_path, path)
+    evict(MAX_CACHE_BYTES)
+    return result
+
+def evict(max_bytes):
+    """Delete the least recently used results in the results cache until they take up at most max_bytes."""
+    entries = []
+    for entry in os.scandir(os.path.abspath(RESULTS_DIR)):
+        if entry.name.endswith('.pkl'):
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= max_bytes:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
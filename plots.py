@@ -1,25 +1,102 @@
+import os
+import sys
+from collections import namedtuple
+from concurrent.futures import ProcessPoolExecutor
+
 import pandas as pd
 import matplotlib.pyplot as plt
 from matplotlib.offsetbox import AnchoredText
-import scipy.stats as stats
 import numpy as np
 
+from pipeline_cache import CACHE_DIR, content_hash
+
+# a plot to be made by calling function(*args), which writes the files in paths
+PlotSpec = namedtuple('PlotSpec', ['paths', 'function', 'args'])
+
 def make_plots(distributed_results, distributed_params, household_results, household_params,
-               data_subset, group_name, numbins, household_well_as):
+               data_subset, group_name, numbins, household_well_as, local_params=None):
     """Make plots from model results."""
-    # scatter plots of individual data points
-    scatter_plot_simple_regress(distributed_results, data_subset, group_name, xmax=900, ymax=1600)
-    scatter_plot_multiple_regress(household_results, data_subset, group_name, household_well_as, xmax=900, ymax=1600)
+    render_plots(plot_specs(distributed_results, distributed_params, household_results, household_params,
+                            data_subset, group_name, numbins, household_well_as, local_params))
+
+def plot_specs(distributed_results, distributed_params, household_results, household_params,
+               data_subset, group_name, numbins, household_well_as, local_params=None):
+    """Return the PlotSpecs for the plots that make_plots makes, without making them.
+    local_params is optionally the distributed model solved for each participant with a local avgAs
+    (from solve_mass_balance.solve_params_distributed_local), used for the plot of contributions."""
     # scatter plots of binned data_subset
     binned_data = get_binned_data(data_subset, numbins, ['arsenic_ugl', household_well_as, 'urine_as', 'urine_as_pred_distributed',
                     'urine_as_pred_household'])
-    plot_binned_distributed(distributed_results, binned_data, group_name, 'arsenic_ugl', 'urine_as_pred_distributed',
-                500, 500, 'Primary Household Well Arsenic')
-    plot_binned_household(household_results, binned_data, group_name, 'arsenic_ugl', 'urine_as_pred_household',
-                500, 500, 'Primary Household Well Arsenic')
-    # area plot of contributions (for distributed model only)
-    plot_contributions(data_subset, distributed_params, group_name)
-    plot_contributions_percentile(data_subset, distributed_params, group_name)
+    prefix = 'plots/' + group_name
+    return [
+        # scatter plots of individual data points
+        PlotSpec((prefix + '_distributed_model.png',), scatter_plot_simple_regress,
+                 (distributed_results, data_subset, group_name, 900, 1600)),
+        PlotSpec((prefix + '_household_model_primary_well.png', prefix + '_household_model_household_wells.png'),
+                 scatter_plot_multiple_regress,
+                 (household_results, data_subset, group_name, household_well_as, 900, 1600)),
+        PlotSpec((prefix + '_arsenic_ugl_urine_as_pred_distributed_binned.png',), plot_binned_distributed,
+                 (distributed_results, binned_data, group_name, 'arsenic_ugl', 'urine_as_pred_distributed',
+                  500, 500, 'Primary Household Well Arsenic')),
+        PlotSpec((prefix + '_arsenic_ugl_urine_as_pred_household_binned.png',), plot_binned_household,
+                 (household_results, binned_data, group_name, 'arsenic_ugl', 'urine_as_pred_household',
+                  500, 500, 'Primary Household Well Arsenic')),
+        # area plot of contributions (for distributed model only)
+        PlotSpec((prefix + '_contrib_plot.png',), plot_contributions,
+                 (data_subset, distributed_params, group_name, local_params)),
+        PlotSpec((prefix + '_contrib_plot_percentile.png',), plot_contributions_percentile,
+                 (data_subset, distributed_params, group_name)),
+    ]
+
+def final_specs(specs):
+    """Return only the specs whose files are not written again by a later spec in specs.
+
+    >>> specs = [PlotSpec(('a.png',), print, (1,)), PlotSpec(('b.png',), print, (2,)), PlotSpec(('a.png',), print, (3,))]
+    >>> [spec.args for spec in final_specs(specs)]
+    [(2,), (3,)]
+    """
+    written = set()
+    final = []
+    for spec in reversed(specs):
+        if not written.issuperset(spec.paths):
+            final.append(spec)
+            written.update(spec.paths)
+    return final[::-1]
+
+def digest_path(path):
+    """Return the path of the file holding the digest of the inputs of the plot at path."""
+    return os.path.abspath(os.path.join(CACHE_DIR, 'plot_digests', path.replace('/', '_') + '.digest'))
+
+def render_plot(spec):
+    """Make the plot in spec, unless its files are newer than the module that makes them and were made
+    from the same inputs (as recorded in their digest files). Returns True if the plot was made."""
+    digest = content_hash(spec.function.__qualname__, spec.args)
+    source_time = os.path.getmtime(sys.modules[spec.function.__module__].__file__)
+    up_to_date = True
+    for path in spec.paths:
+        if not os.path.exists(path) or os.path.getmtime(path) < source_time or not os.path.exists(digest_path(path)):
+            up_to_date = False
+            break
+        with open(digest_path(path)) as digest_file:
+            if digest_file.read() != digest:
+                up_to_date = False
+                break
+    if up_to_date:
+        return False
+    spec.function(*spec.args)
+    for path in spec.paths:
+        os.makedirs(os.path.dirname(digest_path(path)), exist_ok=True)
+        with open(digest_path(path), 'w') as digest_file:
+            digest_file.write(digest)
+    return True
+
+def render_plots(specs, jobs=1):
+    """Make the plots in specs, in jobs separate processes if jobs is more than 1.
+    Returns the number of plots made (rather than skipped as up to date)."""
+    if jobs > 1 and len(specs) > 1:
+        with ProcessPoolExecutor(max_workers=jobs) as executor:
+            return sum(executor.map(render_plot, specs))
+    return sum(render_plot(spec) for spec in specs)
 
 def format_scatter_plot(ax):
     """Do formatting common to scatter plots from all models."""
@@ -59,6 +136,7 @@ def scatter_plot_simple_regress(results, data, group_name, xmax, ymax):
             loc=2, frameon=False, prop=dict(size=14)))
     # print('saving figure as plots/' + group_name + '_distributed_model.png')
     plt.savefig('plots/' + group_name + '_distributed_model.png', dpi=600)
+    plt.close(fig)
 
 def scatter_plot_multiple_regress(results, data, group_name, household_well_as, xmax, ymax):
     """Make scatter plots from household well model results"""
@@ -82,6 +160,7 @@ def scatter_plot_multiple_regress(results, data, group_name, household_well_as,
             fr'$intercept = {results.params[0]:.0f}$',
             loc=2, frameon=False, prop=dict(size=14)))
     plt.savefig('plots/' + group_name + '_household_model_primary_well.png')
+    plt.close(fig)
 
     # urinary As vs household well As
     fig, ax = plt.subplots(figsize=(8, 6))
@@ -103,38 +182,53 @@ def scatter_plot_multiple_regress(results, data, group_name, household_well_as,
                   fr'$intercept = {results.params[0]:.0f}$',
                   loc=2, frameon=False, prop=dict(size=14)))
     plt.savefig('plots/' + group_name + '_household_model_household_wells.png')
+    plt.close(fig)
 
-def get_mean_sem_dict(data, first_index, last_index, columns):
-    """Return a dict containing the means and sems for a given bin"""
-    mean_sem_dict = {}
-    for colname in columns:
-        mean_sem_dict[colname + '_mean'] = np.mean(data.loc[first_index:last_index, colname])
-        mean_sem_dict[colname + '_sem'] = stats.sem(data.loc[first_index:last_index, colname])
-    return mean_sem_dict
-
-def get_binned_data(data, nbins, columns):
+def get_binned_data(data, nbins, columns, binning='equal_count'):
     """Divide data into nbins bins by primary well arsenic concentration and get average and sem for each bin.
-    If data does not divide evenly into bins, final bin may have slightly more or fewer data points."""
-    data = data.reset_index(drop=True)
-    data = data.sort_values(by=['urine_as'])
-    data = data.reset_index(drop=True)
-    data = data.sort_values(by=['arsenic_ugl'])
-    data = data.reset_index(drop=True)
-    binned_data = pd.DataFrame()
-    n_tot = data.shape[0]
-    bin_size = round(n_tot/nbins, 0)
-    # get mean and sem for each bin
-    for i in range(0, nbins):
-        # index of first and last item in bin
-        first_index = i*bin_size
-        last_index = (i+1)*bin_size-1
+    With binning='equal_count', each bin has the same number of data points. If data does not divide evenly
+    into bins, final bin may have slightly more or fewer data points. With binning='equal_width', the bins
+    cover equal ranges of primary well arsenic. Empty bins have NaN means and sems.
+
+    >>> data = pd.DataFrame({'arsenic_ugl': [5., 1., 3., 2., 4., 6.], 'urine_as': [50., 10., 30., 20., 40., 90.]})
+    >>> get_binned_data(data, 2, ['arsenic_ugl', 'urine_as'])
+       arsenic_ugl_mean  arsenic_ugl_sem  urine_as_mean  urine_as_sem
+    0               2.0          0.57735           20.0      5.773503
+    1               5.0          0.57735           60.0     15.275252
+    >>> get_binned_data(data, 2, ['urine_as'], binning='equal_width')['urine_as_mean'].tolist()
+    [20.0, 60.0]
+    """
+    # sort once by primary well arsenic, breaking ties by urinary arsenic
+    order = np.lexsort((data['urine_as'].to_numpy(), data['arsenic_ugl'].to_numpy()))
+    n_tot = order.shape[0]
+    # label each data point, in sorted order, with its bin
+    if binning == 'equal_count':
+        bin_size = max(round(n_tot/nbins), 1)
         # final bin may have different amount of data
-        if i == nbins - 1:
-            last_index = n_tot
-        binned_data = binned_data.append(get_mean_sem_dict(data, first_index, last_index, columns), ignore_index=True)
-        # print("i is " + str(i))
-        # print("binned data length is " + str(binned_data.shape[0]))
-    return binned_data
+        labels = np.minimum(np.arange(n_tot)//bin_size, nbins - 1)
+    elif binning == 'equal_width':
+        arsenic = data['arsenic_ugl'].to_numpy(dtype=float)[order]
+        edges = np.linspace(arsenic[0], arsenic[-1], nbins + 1)
+        labels = np.clip(np.searchsorted(edges, arsenic, side='right') - 1, 0, nbins - 1)
+    else:
+        raise ValueError(f'unknown binning {binning!r}')
+    counts = np.bincount(labels, minlength=nbins)
+    # bins are contiguous in sorted order, so each non-empty bin is one segment for reduceat
+    filled = counts > 0
+    starts = (np.cumsum(counts) - counts)[filled]
+    binned_data = {}
+    for colname in columns:
+        values = data[colname].to_numpy(dtype=float)[order]
+        mean = np.full(nbins, np.nan)
+        sem = np.full(nbins, np.nan)
+        mean[filled] = np.add.reduceat(values, starts)/counts[filled]
+        squared_deviations = np.add.reduceat((values - np.repeat(mean[filled], counts[filled]))**2, starts)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            # standard error of the mean with one delta degree of freedom, as scipy.stats.sem
+            sem[filled] = np.sqrt(squared_deviations/(counts[filled] - 1)/counts[filled])
+        binned_data[colname + '_mean'] = mean
+        binned_data[colname + '_sem'] = sem
+    return pd.DataFrame(binned_data)
 
 def plot_binned_distributed(results, binned_data, group_name, xvar, yvar, xmax, ymax, xlabel):
     """Plot binned data for distributed well model."""
@@ -157,6 +251,7 @@ def plot_binned_distributed(results, binned_data, group_name, xvar, yvar, xmax,
     ax.yaxis.set_ticks([0, 100, 200, 300, 400, 500])
     ax.tick_params(axis='both', labelsize=16)
     plt.savefig('plots/' + group_name + '_' + xvar + '_' + yvar + '_binned.png', dpi=600)
+    plt.close(fig)
 
 def plot_binned_household(results, binned_data, group_name, xvar, yvar, xmax, ymax, xlabel):
     """Plot binned data for household well model."""
@@ -175,21 +270,32 @@ def plot_binned_household(results, binned_data, group_name, xvar, yvar, xmax, ym
     ax.yaxis.set_ticks([0, 100, 200, 300, 400, 500])
     ax.tick_params(axis='both', labelsize=16)
     plt.savefig('plots/' + group_name + '_' + xvar + '_' + yvar + '_binned.png', dpi=600)
+    plt.close(fig)
 
-def plot_contributions(data, params, group_name):
-    # varies with an individual's primary well arsenic concentration
-    contrib_primary_well = params['fp'].value*data['arsenic_ugl']
-    contrib_primary_well = contrib_primary_well.to_numpy().astype(float)
-    # both of these are constant across individuals, since we don't have a way to estimate them more granularly
-    contrib_other_well = np.repeat(params['fo'].value*params['avgAs'].value, contrib_primary_well.shape[0])
+def plot_contributions(data, params, group_name, local_params=None):
+    arsenic = data['arsenic_ugl'].to_numpy().astype(float)
+    if local_params is None:
+        # varies with an individual's primary well arsenic concentration
+        contrib_primary_well = params['fp'].value*arsenic
+        # constant across individuals, using the study-wide average arsenic of other wells
+        contrib_other_well = np.repeat(params['fo'].value*params['avgAs'].value, arsenic.shape[0])
+    else:
+        # fp, fo and the average arsenic of other wells around each individual's primary well, for each individual,
+        # in order of primary well arsenic so that the areas are drawn from left to right
+        order = np.argsort(arsenic, kind='stable')
+        arsenic = arsenic[order]
+        contrib_primary_well = local_params['fp'].value[order]*arsenic
+        contrib_other_well = (local_params['fo'].value*local_params['avgAs'].value)[order]
     contrib_other_well = contrib_other_well.astype(float)
+    # constant across individuals, since we don't have a way to estimate it more granularly
     contrib_food = np.repeat(params['Mf'].value/params['Q'].value, contrib_primary_well.shape[0])
     fig, ax = plt.subplots(figsize=(8, 6))
     ax.set_ylabel(r'Contribution to Urinary Arsenic ($\mu g/L$)', fontsize=18)
     ax.set_xlabel(r'Primary Household Well Arsenic Concentration ($\mu g/L$)', fontsize=18)
     print(max(data['arsenic_ugl']))
-    ax.stackplot(data['arsenic_ugl'].to_numpy().astype(float), contrib_primary_well, contrib_other_well, contrib_food)
+    ax.stackplot(arsenic, contrib_primary_well, contrib_other_well, contrib_food)
     plt.savefig('plots/' + group_name + '_contrib_plot.png')
+    plt.close(fig)
     # fig, ax = plt.subplots(figsize=(8, 6))
     # ax.stackplot([1, 2, 10], [1, 3, 5], [2, 2, 2], [3, 3, 3])
     # plt.savefig('plots/test.png')
@@ -231,3 +337,27 @@ def plot_contributions_percentile(data, params, group_name):
     ax2.set_xticklabels(np.percentile(data['arsenic_ugl'], ax2_tick_locations))
     ax2.set_xlabel(r'Primary Well Arsenic ($\mu g/L$)', fontsize=16)
     plt.savefig('plots/' + group_name + '_contrib_plot_percentile.png', dpi=600)
+    plt.close(fig)
+
+def plot_exposure_sweep(table, group_name):
+    """Plot the fit quality of the household wells model and the fractions of water from household wells
+    and other wells against the scale of the household well exposure, from a table made by
+    exposure_sweep.exposure_sweep (with a line for each set of input parameters, if it has a 'parameters' column)."""
+    if 'parameters' not in table.columns:
+        table = table.assign(parameters=0)
+    fig, (ax_fit, ax_fraction) = plt.subplots(2, 1, figsize=(8, 9), sharex=True)
+    for parameters, sweep in table.groupby('parameters', sort=False):
+        sweep = sweep.sort_values('scale_m')
+        scale = sweep['scale_m'].to_numpy()
+        if parameters == table['parameters'].iloc[0]:
+            ax_fit.plot(scale, sweep['r2_adj'], marker='o', c='k')
+        for fraction, color in [('fh', 'tab:orange'), ('fo', 'tab:green')]:
+            value, uncertainty = sweep[fraction].to_numpy(), sweep[fraction + '_uncertainty'].to_numpy()
+            ax_fraction.plot(scale, value, marker='o', c=color, label=f'{fraction} (parameters {parameters})')
+            ax_fraction.fill_between(scale, value - uncertainty, value + uncertainty, color=color, alpha=0.2)
+    ax_fit.set_ylabel(r'Adjusted $R^2$', fontsize=16)
+    ax_fraction.set_ylabel('Fraction of Water Consumed', fontsize=16)
+    ax_fraction.set_xlabel('Household Well Exposure Scale (m)', fontsize=16)
+    ax_fraction.legend()
+    plt.savefig('plots/' + group_name + '_exposure_sweep.png')
+    plt.close(fig)
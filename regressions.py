@@ -2,47 +2,245 @@
 import csv
 import os
 
+import numpy as np
 import pandas as pd
-import statsmodels.api as sm
 
-def run_regressions(data, group_name, household_well_as):
+import results_sink
+
+# regression backends: 'ols' treats every participant as independent; 'cluster' is the same fit with
+# standard errors that allow for correlation within clusters of participants (such as those who share a
+# well, or a village); 'random_intercept' fits a random intercept for each cluster
+BACKENDS = ['ols', 'cluster', 'random_intercept']
+
+def run_regressions(data, group_name, household_well_as, backend='ols', cluster_column='well_id'):
     """For the distributed wells model and household wells model, return the regression results
-    and append predicted urinary arsenic values to dataframe"""
-    data, distributed_results = distributed_wells_regress(data)
-    data, household_results = household_wells_regress(data, group_name, household_well_as)
+    and append predicted urinary arsenic values to dataframe. backend is one of BACKENDS, with clusters
+    of participants given by cluster_column."""
+    gram = None
+    if backend == 'ols':
+        # the sums of products of [1, arsenic_ugl, household well arsenic, urine_as], in one pass over the data;
+        # the distributed wells model is fit from the rows and columns without household well arsenic
+        gram = gram_matrix(data, ['arsenic_ugl', household_well_as], 'urine_as')
+    data, distributed_results = distributed_wells_regress(data, backend, cluster_column,
+                                                          None if gram is None else gram[np.ix_([0, 1, 3], [0, 1, 3])])
+    data, household_results = household_wells_regress(data, group_name, household_well_as, backend, cluster_column,
+                                                      gram)
     return distributed_results, household_results, data
 
+def regression_files(group_name):
+    """Return the paths of the files that run_regressions writes."""
+    return ['../araihazar-data/analysis_output/' + group_name +'_urine_as_pred_household.csv']
+
+#%% least squares
+class OLSResults:
+    """
+    Results of an ordinary least squares fit with a constant term, with the attributes of
+    statsmodels' RegressionResults used by the rest of the analysis.
+
+    Attributes:
+        params (ndarray): The fitted coefficients, constant term first
+        bse (ndarray): The standard errors of the coefficients
+        nobs (float): The number of observations
+        rsquared (float): The coefficient of determination
+        rsquared_adj (float): The coefficient of determination adjusted for the number of regressors
+        n_clusters (int or None): The number of clusters, for the 'cluster' and 'random_intercept' backends
+    """
+    def __init__(self, params, cov, nobs, rsquared, rsquared_adj, n_clusters=None):
+        self.params = params
+        self.bse = np.sqrt(np.diag(cov))
+        self.nobs = nobs
+        self.rsquared = rsquared
+        self.rsquared_adj = rsquared_adj
+        self.n_clusters = n_clusters
+        self._cov = cov
+
+    def cov_params(self):
+        """Return the covariance matrix of the coefficients."""
+        return self._cov
+
+    def predict(self, x):
+        """Return the fitted values for regressors x (without the constant column)."""
+        return self.params[0] + np.asarray(x, dtype=float) @ self.params[1:]
+
+def gram_matrix(data, regressors, y):
+    """Return the Gram matrix Z'Z of Z = [1, regressors..., y] for the columns of data named in regressors and y.
+
+    >>> gram_matrix(pd.DataFrame({'x': [0., 1., 2.], 'y': [1., 3., 5.]}), ['x'], 'y')
+    array([[ 3.,  3.,  9.],
+           [ 3.,  5., 13.],
+           [ 9., 13., 35.]])
+    """
+    z = np.column_stack([np.ones(len(data)), data[regressors].to_numpy(dtype=float), data[y].to_numpy(dtype=float)])
+    return z.T @ z
+
+def ols_from_gram(gram, nobs):
+    """Fit y on a constant and regressors from the Gram matrix Z'Z of Z = [1, regressors..., y].
+
+    >>> z = np.column_stack([np.ones(4), [0., 1., 2., 3.], [1., 3., 5., 7.]])
+    >>> ols_from_gram(z.T @ z, 4).params
+    array([1., 2.])
+    """
+    nparams = gram.shape[0] - 1
+    xtx, xty, yty = gram[:nparams, :nparams], gram[:nparams, nparams], gram[nparams, nparams]
+    xtx_inv = np.linalg.inv(xtx)
+    params = xtx_inv @ xty
+    ssr = yty - params @ xty
+    # total sum of squares about the mean of y
+    centered_tss = yty - gram[0, nparams]**2/nobs
+    rsquared = 1 - ssr/centered_tss
+    rsquared_adj = 1 - (nobs - 1)/(nobs - nparams)*(1 - rsquared)
+    cov = ssr/(nobs - nparams)*xtx_inv
+    return OLSResults(params, cov, float(nobs), rsquared, rsquared_adj)
+
+#%% clustered participants
+def cluster_codes(clusters):
+    """Return a cluster number from 0 for each label in clusters, with each missing label in a cluster of its own.
+
+    >>> cluster_codes(['a', None, 'b', 'a', None])
+    array([0, 2, 1, 0, 3])
+    """
+    codes, labels = pd.factorize(pd.Series(clusters))
+    missing = codes < 0
+    codes[missing] = len(labels) + np.arange(missing.sum())
+    return codes
+
+def cluster_indicators(codes):
+    """Return the sparse matrix with a row for each participant and a column for each cluster,
+    which is 1 where the participant is in the cluster, so that indicators.T @ values sums
+    values within each cluster."""
+    # only needed for the clustered backends, and slow to import
+    from scipy import sparse # pylint: disable=import-outside-toplevel
+    return sparse.csr_matrix((np.ones(len(codes)), (np.arange(len(codes)), codes)),
+                             shape=(len(codes), codes.max() + 1))
+
+def cluster_robust_from_data(z, codes):
+    """Fit y on a constant and regressors, from Z = [1, regressors..., y], with standard errors robust
+    to any correlation within the clusters given by codes (as from cluster_codes), with the small-sample
+    correction G/(G - 1)*(N - 1)/(N - K) for G clusters, N participants and K coefficients.
+
+    >>> x = np.arange(8.)
+    >>> z = np.column_stack([np.ones(8), x, 1 + 2*x + np.array([1., 1., -1., -1.]*2)])
+    >>> results = cluster_robust_from_data(z, np.arange(8) // 2)
+    >>> np.round(results.bse, 3), results.n_clusters
+    (array([0.759, 0.147]), 4)
+    """
+    nobs, nparams = z.shape[0], z.shape[1] - 1
+    gram = z.T @ z
+    results = ols_from_gram(gram, nobs)
+    x = z[:, :nparams]
+    residuals = z[:, nparams] - x @ results.params
+    indicators = cluster_indicators(codes)
+    n_clusters = indicators.shape[1]
+    if n_clusters < 2:
+        raise ValueError('cluster-robust standard errors need at least 2 clusters')
+    # sum of the scores x*residual within each cluster
+    scores = indicators.T @ (x*residuals[:, np.newaxis])
+    xtx_inv = np.linalg.inv(gram[:nparams, :nparams])
+    correction = n_clusters/(n_clusters - 1)*(nobs - 1)/(nobs - nparams)
+    cov = correction*xtx_inv @ (scores.T @ scores) @ xtx_inv
+    return OLSResults(results.params, cov, results.nobs, results.rsquared, results.rsquared_adj, n_clusters)
+
+def random_intercept_from_data(z, codes):
+    """Fit y on a constant and regressors, from Z = [1, regressors..., y], with a random intercept for
+    each of the clusters given by codes, by feasible GLS with the Swamy-Arora estimates of the variances
+    of the intercepts and of the residuals (from the within-cluster and between-cluster regressions).
+    The results also have those variances, sigma2_u and sigma2_e. rsquared is for the fitted values
+    without the random intercepts.
+
+    >>> x = np.arange(12.)
+    >>> z = np.column_stack([np.ones(12), x, 1 + 2*x + np.tile([3., -3., 1.], 4) + np.array([.5, -.5]*6)])
+    >>> results = random_intercept_from_data(z, np.arange(12) % 3)
+    >>> np.round(results.params, 3), round(results.sigma2_u, 3), round(results.sigma2_e, 3)
+    (array([1.457, 1.977]), 16.575, 0.367)
+    """
+    nobs, nparams = z.shape[0], z.shape[1] - 1
+    indicators = cluster_indicators(codes)
+    sizes = np.asarray(indicators.sum(axis=0)).ravel()
+    n_clusters = len(sizes)
+    # means of the columns of Z in each cluster
+    means = (indicators.T @ z)/sizes[:, np.newaxis]
+    # within-cluster regression (deviations from the cluster means, without the constant) for the residual
+    # variance; regressors that are the same for everyone in a cluster (such as primary well arsenic, for
+    # clusters of participants sharing a well) drop out of it, so they do not count towards its rank
+    within = z[:, 1:] - means[codes, 1:]
+    within_params, _, rank, _ = np.linalg.lstsq(within[:, :-1], within[:, -1], rcond=None)
+    within_residuals = within[:, -1] - within[:, :-1] @ within_params
+    if nobs - n_clusters - rank <= 0:
+        raise ValueError('a random intercept needs more participants than clusters plus regressors')
+    sigma2_e = float(within_residuals @ within_residuals/(nobs - n_clusters - rank))
+    # between-cluster regression of the cluster means for the variance of the intercepts
+    between = ols_from_gram(means.T @ means, n_clusters)
+    between_residuals = means[:, nparams] - means[:, :nparams] @ between.params
+    # for clusters of different sizes, the harmonic mean size
+    harmonic_size = n_clusters/np.sum(1/sizes)
+    sigma2_u = max(0., float(between_residuals @ between_residuals/(n_clusters - nparams) - sigma2_e/harmonic_size))
+    # GLS as OLS on the data less a fraction theta of the cluster means
+    theta = 1 - np.sqrt(sigma2_e/(sizes*sigma2_u + sigma2_e))
+    transformed = z - theta[codes, np.newaxis]*means[codes]
+    gram = transformed.T @ transformed
+    xtx_inv = np.linalg.inv(gram[:nparams, :nparams])
+    params = xtx_inv @ gram[:nparams, nparams]
+    residuals = z[:, nparams] - z[:, :nparams] @ params
+    centered_tss = np.sum((z[:, nparams] - z[:, nparams].mean())**2)
+    rsquared = 1 - residuals @ residuals/centered_tss
+    rsquared_adj = 1 - (nobs - 1)/(nobs - nparams)*(1 - rsquared)
+    results = OLSResults(params, sigma2_e*xtx_inv, float(nobs), rsquared, rsquared_adj, n_clusters)
+    results.sigma2_u, results.sigma2_e = sigma2_u, sigma2_e
+    return results
+
+def fit_ols(y, regressors, backend='ols', clusters=None):
+    """Regress y on a constant and the columns of regressors (a DataFrame or 2-d array), with
+    the given backend (one of BACKENDS) and, for the clustered backends, the cluster label of each row."""
+    if backend not in BACKENDS:
+        raise ValueError(f'backend must be one of {BACKENDS}, not {backend!r}')
+    z = np.column_stack([np.ones(len(y)), np.asarray(regressors, dtype=float), np.asarray(y, dtype=float)])
+    if backend == 'ols':
+        return ols_from_gram(z.T @ z, z.shape[0])
+    if backend == 'cluster':
+        return cluster_robust_from_data(z, cluster_codes(clusters))
+    return random_intercept_from_data(z, cluster_codes(clusters))
+
 #%% base case
-def distributed_wells_regress(data):
+def distributed_wells_regress(data, backend='ols', cluster_column='well_id', gram=None):
     """For distributed wells model, return input data with added column for
-    regression predicted values and return regression results."""
-    # add a column of ones to the x-data to get a constant term in the model
-    x = sm.add_constant(data.arsenic_ugl)
-
-    model = sm.OLS(data.urine_as, x)
-    results = model.fit()
+    regression predicted values and return regression results. For the 'ols' backend,
+    gram is optionally the Gram matrix of [1, arsenic_ugl, urine_as] (see gram_matrix) to fit from."""
+    if backend == 'ols' and gram is not None:
+        results = ols_from_gram(gram, len(data))
+    else:
+        results = fit_ols(data.urine_as, data[['arsenic_ugl']], backend,
+                          None if backend == 'ols' else data[cluster_column])
 
     urine_as_pred = results.params[1]*data.arsenic_ugl + results.params[0]
     data['urine_as_pred_distributed'] = urine_as_pred
     return data, results
 
 #%% add wells in family compound
-def household_wells_regress(data, group_name, household_well_as):
+def household_wells_regress(data, group_name, household_well_as, backend='ols', cluster_column='well_id',
+                            gram=None):
     """For household wells model, return input data with added column for
-    regression predicted values and return regression results."""
-    # add a column of ones to the x-data to get a constant term in the model
-    x = sm.add_constant(pd.concat([data.arsenic_ugl, data[household_well_as]], axis=1))
-
-    model = sm.OLS(data.urine_as, x)
-    results = model.fit()
+    regression predicted values and return regression results. For the 'ols' backend, gram is
+    optionally the Gram matrix of [1, arsenic_ugl, household_well_as, urine_as] (see gram_matrix) to fit from."""
+    if backend == 'ols' and gram is not None:
+        results = ols_from_gram(gram, len(data))
+    else:
+        results = fit_ols(data.urine_as, data[['arsenic_ugl', household_well_as]], backend,
+                          None if backend == 'ols' else data[cluster_column])
 
     urine_as_pred = results.params[1]*data.arsenic_ugl + \
                     results.params[2]*data[household_well_as] + \
                     results.params[0]
     data['urine_as_pred_household'] = urine_as_pred
-    with open(os.path.abspath('../araihazar-data/analysis_output/' + group_name +'_urine_as_pred_household.csv'), mode='w') as savefile:
-        writer = csv.writer(savefile)
-        data_for_csv = [data.arsenic_ugl, data['urine_as_pred_household']]
-        writer.writerow(['arsenic_ugl','urine_as_pred_household'])
-        writer.writerows(zip(*data_for_csv))
-    return data, results
\ No newline at end of file
+    def save_csv():
+        with open(os.path.abspath('../araihazar-data/analysis_output/' + group_name +'_urine_as_pred_household.csv'), mode='w') as savefile:
+            writer = csv.writer(savefile)
+            data_for_csv = [data.arsenic_ugl, data['urine_as_pred_household']]
+            writer.writerow(['arsenic_ugl','urine_as_pred_household'])
+            writer.writerows(zip(*data_for_csv))
+    results_sink.write('household_predictions', data[['arsenic_ugl', 'urine_as_pred_household']].reset_index(drop=True),
+                       save_csv, group=group_name, household_well_as=household_well_as)
+    return data, results
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
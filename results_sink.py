@@ -0,0 +1,194 @@
+"""This module collects the tables of results made for each set of input parameters (predicted values,
+solved parameters, subset comparisons) in memory and writes them in bulk to one store, rather than
+opening a small csv file for each.
+
+The store is a folder with one Parquet file per kind of result per flush if pyarrow is installed,
+or else one SQLite database with a table per kind of result. Every row has key columns saying which
+run it came from (such as group, household_well_as and combination), so one kind of result for every
+set of input parameters can be read as one table with read_results.
+
+Code that makes results calls write(), which adds them to the active sink. With no active sink, or an
+active sink with export_csv set, write() also saves them as the csv files the analysis has always made.
+"""
+import os
+import shutil
+import sqlite3
+from contextlib import contextmanager
+
+import pandas as pd
+
+try:
+    import pyarrow # pylint: disable=unused-import
+except ImportError:
+    pyarrow = None
+
+STORE_PATH = '../araihazar-data/analysis_output/results_store'
+# number of buffered rows at which a sink writes to the store
+FLUSH_ROWS = 1_000_000
+
+class ResultsSink:
+    """
+    This is a class for buffering tables of results in memory and writing them to the store in bulk.
+
+    Attributes:
+        store_path (str or None): Folder of the store, or None to discard the results (such as for a run
+            that is only being profiled)
+        export_csv (bool): Whether write() should also save each table as a csv file
+        flush_rows (int): Number of buffered rows at which to write to the store
+        keys (dict): Key columns added to every table added, set with keyed()
+        buffered (list): (kind, records, keys) for each table added since the last flush
+    """
+    def __init__(self, store_path=STORE_PATH, export_csv=False, flush_rows=FLUSH_ROWS):
+        """
+        Initializes ResultsSink with an empty buffer.
+        """
+        self.store_path = store_path
+        self.export_csv = export_csv
+        self.flush_rows = flush_rows
+        self.keys = {}
+        self.buffered = []
+        self.buffered_rows = 0
+        self.parts = 0
+
+    @contextmanager
+    def keyed(self, **keys):
+        """Add keys to the tables added in the body of a with statement."""
+        outer_keys = self.keys
+        self.keys = {**outer_keys, **keys}
+        try:
+            yield self
+        finally:
+            self.keys = outer_keys
+
+    def add(self, kind, records, keys):
+        """Buffer records (a DataFrame) as results of the given kind, with key columns keys,
+        and write to the store if enough rows are buffered."""
+        self.buffered.append((kind, records, {**self.keys, **keys}))
+        self.buffered_rows += len(records)
+        if self.buffered_rows >= self.flush_rows:
+            self.flush()
+
+    def drain(self):
+        """Remove and return the buffered tables, such as to send them from a worker process
+        to the sink of the parent process."""
+        drained, self.buffered, self.buffered_rows = self.buffered, [], 0
+        return drained
+
+    def extend(self, drained):
+        """Add tables from another sink's drain()."""
+        for kind, records, keys in drained:
+            self.add(kind, records, keys)
+
+    def flush(self):
+        """Write the buffered tables to the store, as one file or one transaction for each kind of result."""
+        tables = {}
+        for kind, records, keys in self.drain():
+            tables.setdefault(kind, []).append(with_keys(records, keys))
+        if not tables or self.store_path is None:
+            return
+        os.makedirs(os.path.abspath(self.store_path), exist_ok=True)
+        connection = None if pyarrow is not None else sqlite3.connect(store_database(self.store_path))
+        for kind, frames in tables.items():
+            table = pd.concat(frames, ignore_index=True)
+            if connection is None:
+                kind_path = os.path.abspath(os.path.join(self.store_path, kind))
+                os.makedirs(kind_path, exist_ok=True)
+                table.to_parquet(os.path.join(kind_path, f'part-{os.getpid()}-{self.parts:05d}.parquet'), index=False)
+            else:
+                with connection:
+                    table.to_sql(kind, connection, if_exists='append', index=False)
+        if connection is not None:
+            connection.close()
+        self.parts += 1
+
+    def clear(self):
+        """Delete the store and the buffered tables."""
+        self.drain()
+        if self.store_path is not None:
+            shutil.rmtree(os.path.abspath(self.store_path), ignore_errors=True)
+
+def with_keys(records, keys):
+    """Return records with a column for each key before its own columns.
+
+    >>> with_keys(pd.DataFrame({'value': [1., 2.]}), {'group': 'all'})
+      group  value
+    0   all    1.0
+    1   all    2.0
+    """
+    keys = pd.DataFrame({key: [value]*len(records) for key, value in keys.items()}, index=records.index)
+    return pd.concat([keys, records], axis=1)
+
+def store_database(store_path):
+    """Return the path of the SQLite database used for the store when pyarrow is not installed."""
+    return os.path.abspath(os.path.join(store_path, 'results.sqlite'))
+
+def read_results(kind, store_path=STORE_PATH, **keys):
+    """Return the results of the given kind from the store, only those with the given values of key columns
+    (for example, read_results('solved', group='men')). Use to_csv on the result to export it."""
+    if pyarrow is not None:
+        table = pd.read_parquet(os.path.abspath(os.path.join(store_path, kind)))
+    else:
+        with sqlite3.connect(store_database(store_path)) as connection:
+            table = pd.read_sql_query(f'SELECT * FROM {kind}', connection)
+    for key, value in keys.items():
+        table = table[table[key] == value]
+    return table.reset_index(drop=True)
+
+# the sink that write() adds to, and the lists of writes being recorded by recording()
+active_sink = None
+recorders = []
+
+@contextmanager
+def activated(sink):
+    """Make sink the active sink in the body of a with statement, flushing it at the end."""
+    global active_sink # pylint: disable=global-statement
+    outer_sink, active_sink = active_sink, sink
+    try:
+        yield sink
+        sink.flush()
+    finally:
+        active_sink = outer_sink
+
+def write(kind, records, save_csv=None, **keys):
+    """Add records (a DataFrame) to the active sink as results of the given kind, with key columns keys.
+    save_csv is a function that saves them as a csv file instead, called if there is no active sink
+    or it exports csv files."""
+    for recorded in recorders:
+        recorded.append((kind, records, keys))
+    if active_sink is not None:
+        active_sink.add(kind, records, keys)
+    if save_csv is not None and (active_sink is None or active_sink.export_csv):
+        save_csv()
+
+def csv_outputs(paths):
+    """Return paths, the csv files that write() saves, or no paths if it will not save csv files."""
+    return list(paths) if active_sink is None or active_sink.export_csv else []
+
+@contextmanager
+def recording():
+    """Record the calls to write() in the body of a with statement, in a list of (kind, records, keys),
+    so that they can be replayed later (such as when the results come from the results cache).
+
+    >>> with recording() as recorded:
+    ...     write('example', pd.DataFrame({'value': [1.]}), group='all')
+    >>> [(kind, keys) for kind, _, keys in recorded]
+    [('example', {'group': 'all'})]
+    """
+    recorded = []
+    recorders.append(recorded)
+    try:
+        yield recorded
+    finally:
+        recorders.remove(recorded)
+
+def replay(recorded):
+    """Add the writes from recording() to the active sink (the csv files are not saved again)."""
+    for kind, records, keys in recorded:
+        for outer in recorders:
+            outer.append((kind, records, keys))
+        if active_sink is not None:
+            active_sink.add(kind, records, keys)
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
@@ -1,52 +1,200 @@
 #%% imports
+import argparse
 import os
 import pandas as pd
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from itertools import product
 
 from uncertain_val import UncertainVal
-from regressions import run_regressions
-from plots import make_plots
-from solve_mass_balance import calculate_parameters, apply_formatting
-from compare_subsets import make_subset
-from compare_subsets import compare_subsets
+from analysis_data import DATA_PATH, load
+from bootstrap import bootstrap_fits
+from instrumentation import StageTimer, stage, save_report, profile_call
+from pipeline_cache import CACHE_DIR, cached_call, content_hash, file_hash
+from results_sink import ResultsSink, activated, csv_outputs
+from regressions import BACKENDS, run_regressions, regression_files
+from plots import plot_specs, final_specs, render_plots, digest_path
+from solve_mass_balance import (calculate_parameters, solved_files, apply_formatting, solve_params_distributed_local,
+                                local_solved_files)
+from compare_subsets import make_subset, SubsetIndex
+from compare_subsets import compare_subsets_stage
+from exposure_sweep import RADIUS_COLUMNS, exposure_sweep, save_sweep
+from sweep_config import SWEEP_CONFIG, Checkpoint, load_sweep_config, plan_units
 
 #%%
-def run_one(parameters_with_uncertainties, household_well_as, group_name, data, numbins):
+def run_one(parameters_with_uncertainties, household_well_as, group_name, data, numbins, n_bootstrap=0,
+            n_monte_carlo=0, use_cache=False, plots='all', timer=None, local_avg_as=None, backend='ols',
+            cluster_column='well_id'):
     """Run the two mass balance models for one set of input parameters. Outputs the data with predicted
     values appended, the results of the two regressions, and the parameters for the two models.
+    If n_bootstrap is more than 0, the regressions are also refit to that many bootstrap resamples
+    of the data, and bootstrap confidence intervals are saved with the parameters. If n_monte_carlo
+    is more than 0, Monte Carlo uncertainties from that many samples are also saved with the parameters.
+    data is the full dataset, as a DataFrame or, to avoid looking up the group's rows again, a SubsetIndex.
+    If use_cache is True, the regressions, parameters and plots are taken from the results cache
+    (see pipeline_cache.py) when they have been made before from the same inputs.
+    plots is 'all' to make the plots, or 'final-only' or 'none' to leave them unmade. The plots are
+    also returned as a list of PlotSpecs (empty if plots is 'none'), so that they can be made later.
+    If timer is a StageTimer (see instrumentation.py), the time and memory taken by each stage are recorded in it.
+    If local_avg_as is the name of a column of area-average arsenic (such as 'avg_as_500m'), the distributed
+    model is also solved for each participant with that column as avgAs, and used for the plot of contributions.
+    backend is the regression backend (see regressions.BACKENDS), with clusters of participants given by
+    cluster_column for the 'cluster' and 'random_intercept' backends; the parameters are solved with the
+    covariance of the coefficients from that backend.
+    The predicted values, parameters and solutions for each participant are written to the active results sink
+    (see results_sink.py), and also saved as csv files if there is none or it exports csv files.
     """
+    regressions = regress_one(household_well_as, group_name, data, n_bootstrap, use_cache, timer, backend,
+                              cluster_column)
+    distributed_params, household_params, specs = solve_one(parameters_with_uncertainties, household_well_as,
+                                                            group_name, regressions, numbins, n_monte_carlo,
+                                                            use_cache, plots, timer, local_avg_as)
+    data_subset, distributed_results, household_results, _ = regressions
+    return data_subset, distributed_results, distributed_params, household_results, household_params, specs
+
+def cached(use_cache, outputs, function, *args):
+    """Return function(*args), from the results cache if use_cache is True (see pipeline_cache.cached_call)."""
+    return cached_call(outputs, function, *args) if use_cache else function(*args)
+
+def regress_one(household_well_as, group_name, data, n_bootstrap=0, use_cache=False, timer=None, backend='ols',
+                cluster_column='well_id'):
+    """Run the regressions for one group and household well column, which are the same for every set of
+    input parameters. Outputs the group's data with predicted values appended, the results of the two
+    regressions, and the bootstrap coefficients (None if n_bootstrap is 0), as used by solve_one."""
     # get the correct subset of the data
-    data_subset = make_subset(data, group_name)
+    with stage(timer, 'subset'):
+        data_subset = make_subset(data, group_name)
     # run regressions
-    distributed_results, household_results, data_subset = run_regressions(data_subset, group_name, household_well_as)
-    # calculate parameter values
-    distributed_params, household_params = calculate_parameters(distributed_results, household_results, parameters_with_uncertainties, group_name, household_well_as)
+    with stage(timer, 'regress'):
+        distributed_results, household_results, data_subset = cached(use_cache,
+                                                                      csv_outputs(regression_files(group_name)),
+                                                                      run_regressions, data_subset, group_name,
+                                                                      household_well_as, backend, cluster_column)
+    bootstrap = None
+    if n_bootstrap > 0:
+        with stage(timer, 'bootstrap'):
+            bootstrap = bootstrap_fits(data_subset, household_well_as, n_bootstrap)
+    return data_subset, distributed_results, household_results, bootstrap
+
+def solve_one(parameters_with_uncertainties, household_well_as, group_name, regressions, numbins, n_monte_carlo=0,
+              use_cache=False, plots='all', timer=None, local_avg_as=None):
+    """Solve the two mass balance models for one set of input parameters, using the regressions from
+    regress_one, and plot the results. Outputs the parameters for the two models and the PlotSpecs
+    of the plots (see run_one for the other arguments)."""
+    data_subset, distributed_results, household_results, bootstrap = regressions
+    # calculate parameter values (calculate_parameters adds the regression coefficients to its input parameters)
+    input_params = dict(parameters_with_uncertainties)
+    with stage(timer, 'solve'):
+        distributed_params, household_params = cached(use_cache,
+                                                      csv_outputs(solved_files(group_name, household_well_as)),
+                                                      calculate_parameters, distributed_results, household_results,
+                                                      parameters_with_uncertainties, group_name, household_well_as,
+                                                      bootstrap, n_monte_carlo)
+        local_params = None
+        if local_avg_as is not None:
+            local_params = cached(use_cache, csv_outputs(local_solved_files(group_name)),
+                                  solve_params_distributed_local, distributed_results, group_name, input_params,
+                                  data_subset[local_avg_as], data_subset['subject_id'])
     # plot results
-    make_plots(distributed_results, distributed_params, household_results, household_params, data_subset, group_name, numbins, household_well_as)
-    # compare subsets
-    compare_subsets(distributed_results, data)
-    return data_subset, distributed_results, distributed_params, household_results, household_params
+    specs = []
+    with stage(timer, 'plot'):
+        if plots != 'none':
+            specs = plot_specs(distributed_results, distributed_params, household_results, household_params,
+                               data_subset, group_name, numbins, household_well_as, local_params)
+        if plots == 'all':
+            paths = [path for spec in specs for path in spec.paths]
+            cached(use_cache, paths + [digest_path(path) for path in paths], render_plots, specs)
+    return distributed_params, household_params, specs
+
+def run_unit(data, sink, unit, parameter_sets, numbins, n_bootstrap=0, n_monte_carlo=0, use_cache=False,
+             plots='all', timers=None, local_avg_as=None, backend='ols', cluster_column='well_id',
+             final_combinations=None):
+    """Run one unit of a sweep (see sweep_config.py): the regressions for its group and household well column
+    once, then the mass balance models for each of its sets of input parameters, writing the results to sink.
+    timers has a StageTimer (or None) for each set of inputs in the unit; the stages they share are recorded
+    in the first. With plots 'final-only', only the sets of inputs numbered in final_combinations (by default,
+    all of them) make PlotSpecs, since the plot files of the others are written again by a later set.
+    Outputs, for each set of inputs, its number, the formatted parameters for the two models,
+    the PlotSpecs still to be made and the timer records, and the results drained from sink."""
+    timers = timers or [None]*len(unit.combinations)
+    outputs = []
+    with activated(sink):
+        regressions = regress_one(unit.household_well_as, unit.group, data, n_bootstrap, use_cache, timers[0],
+                                  backend, cluster_column)
+        for (combination, parameter_set), timer in zip(unit.combinations, timers):
+            params = {k: UncertainVal(v[0], v[1]) for k, v in parameter_sets[parameter_set].items()}
+            combination_plots = plots
+            if plots == 'final-only' and final_combinations is not None and combination not in final_combinations:
+                combination_plots = 'none'
+            with sink.keyed(combination=combination, parameters=parameter_set):
+                distributed_params, household_params, specs = solve_one(params, unit.household_well_as, unit.group,
+                                                                        regressions, numbins, n_monte_carlo,
+                                                                        use_cache, combination_plots, timer,
+                                                                        local_avg_as)
+            # the plots have already been made unless they are to be made at the end
+            outputs.append((combination, apply_formatting(distributed_params), apply_formatting(household_params),
+                            specs if plots == 'final-only' else [], timer.records if timer is not None else []))
+        results = sink.drain()
+    return outputs, results
+
+# full dataset and results sink in a worker process, set once per worker by init_worker
+worker_data = None
+worker_sink = None
+
+def init_worker(data, export_csv):
+    """Give a worker process the full dataset, and a results sink whose results are sent back to the
+    parent process rather than written to the store. With the default fork start method on Linux
+    the data is shared with the parent process rather than copied."""
+    global worker_data, worker_sink # pylint: disable=global-statement
+    worker_data = data
+    worker_sink = ResultsSink(export_csv=export_csv, flush_rows=float('inf'))
+
+def run_units_in_worker(unit_inputs):
+    """Run run_unit in a worker process on the dataset and sink from init_worker for each of a list of units, in
+    order. Returns only what run_many keeps, so the regression results do not have to be sent back to the parent."""
+    return [run_unit(worker_data, worker_sink, *inputs) for inputs in unit_inputs]
 
-def run_many():
+def run_many(jobs=1, n_bootstrap=0, n_monte_carlo=0, use_cache=True, plots='all', instrument=False,
+             trace_memory=False, profile=False, local_avg_as=None, sweep=False, export_csv=False,
+             config_path=SWEEP_CONFIG, resume=False, backend='ols', cluster_column='well_id'):
     """Run the two mass balance models for many sets input parameters. Saves one csv for each model,
-    with as many columns of values as there are sets of parameters."""
-    # parameters that may change across runs:
-    # parameters that go into the mass balance equation and their uncertainties
-    d = {'ff':(0.2, 0.1), 'fc':(0.12, 0.06), 'md':(0.06, 0.03),
-                                      'mb':(0, 0.03), 'Mf':(64, 4), 'Q':(4.4, 1.5), 
-                                      'avgAs':(95.2, 1.4)}
-    a = {'ff':(0.2, 0.1), 'fc':(0.12, 0.06), 'md':(0.06, 0.03),
-                                      'mb':(0, 0.03), 'Mf':(96, 6), 'Q':(4.4, 1.5), 
-                                      'avgAs':(95.2, 1.4)}
-    p = [d, a]
-    # which column to use for household well arsenic
-    # h = ['other_as_100m', 'other_as_200m', 'other_as_300m', 'other_as_400m', 'other_as_500m']
-    h = ['other_as_20m', 'other_as_50m']
-    # which subset of the data to look at
-    g = ['all', 'men', 'women', 'may_have_known', 'men_may_have_known', 'women_may_have_known', 'did_not_know', 'men_did_not_know', 'women_did_not_know']
+    with as many columns of values as there are sets of parameters.
+    The sets of input parameters, household well columns and groups are read from the sweep config file
+    at config_path (see sweep_config.py), and every combination of them is run. The combinations with the
+    same household well column and group run as one unit, sharing their regressions and bootstrap.
+    Each unit is saved to a checkpoint as it finishes; if resume is True, the units finished by an
+    interrupted run of the same sweep (same config, data and options) are taken from the checkpoint.
+    The predicted values, solved parameters and subset comparisons of every set of parameters are written
+    together to the results store (see results_sink.py), replacing the store from the last run, with the
+    number of the set of parameters as in the columns of the csvs (combination) and of the input parameter
+    dict (parameters). If export_csv is True, they are also saved as the csv files for each set, as before.
+    If jobs is more than 1, runs that many units at a time in separate processes. When csv files are saved or
+    plots == 'all', the units of each group run in order in one process instead, since they write the same files.
+    If n_bootstrap is more than 0, also reports bootstrap confidence intervals from that many resamples.
+    If n_monte_carlo is more than 0, also reports Monte Carlo uncertainties from that many samples.
+    If use_cache is True, sets of parameters that have been run before are taken from the results cache.
+    plots is 'all' to make the plots for every set of parameters, 'final-only' to make only the last version
+    of each plot file once all sets have run, or 'none' to make no plots.
+    If instrument is True, saves the wall time, CPU time, memory and number of open figures of each
+    stage of each set of parameters to run_many_stage_times.csv and .json (see instrumentation.py); with
+    trace_memory, the peak memory allocated by Python in each stage is also traced (which is slower).
+    If profile is True, the slowest set of parameters is run again, without the results cache, under cProfile,
+    and the profile is saved to run_many_slowest.prof.
+    If local_avg_as is the name of a column of area-average arsenic, the distributed model is also solved for each
+    participant with it as avgAs (see run_one).
+    If sweep is True, the household wells model is also fit for each group with every household well column
+    for radii from 20 m to 500 m at once, saving fit quality and the solved fractions against radius
+    (see exposure_sweep.py).
+    backend is the regression backend, and cluster_column the column of the clusters of participants
+    for the 'cluster' and 'random_intercept' backends (see run_one)."""
+    # parameters that may change across runs, from the sweep config:
+    # parameters that go into the mass balance equation and their uncertainties (p), which column to use
+    # for household well arsenic (h), which subset of the data to look at (g), and number of bins for plotting
+    config = load_sweep_config(config_path)
+    p, h, g, numbins = config
     # get all possible combinations of distinct parameters dicts, household well As column, and data subset
     params_df = pd.DataFrame(list(product(p, h, g)), columns=['p', 'h', 'g'])
     print(params_df.head())
+    units = plan_units(len(p), h, g)
     parameters_with_uncertainties = params_df['p']
     parameters_with_uncertainties = [{k:UncertainVal(v[0], v[1]) for k, v in param_dict.items()}   
                                      for param_dict in parameters_with_uncertainties]
@@ -54,22 +202,91 @@ def run_many():
     group_name = params_df['g']
 
     # parameters that I don't expect to change across runs:
-    # full dataset
-    data = pd.read_csv('../araihazar-data/to_analyze/data_for_regressions.csv')
-    # number of bins for plotting results
-    numbins = 15
-
-    # do run_one on each set of inputs
-    all_distributed_params = []
-    all_household_params = []
-    all_data = []
-    for params, household, group in zip(parameters_with_uncertainties, household_well_as,
-                                        group_name):                                
-        data_with_pred_vals, distributed_results, distributed_params, household_results, \
-            household_params = run_one(params, household, group, data, numbins)
-        all_distributed_params.append(apply_formatting(distributed_params))
-        all_household_params.append(apply_formatting(household_params))
-        all_data.append(data_with_pred_vals)
+    # full dataset, with the rows in each group of participants looked up once
+    data_path = DATA_PATH
+    data = SubsetIndex(load(csv_path=data_path))
+
+    output_dir = '../araihazar-data/analysis_output'
+    instrument = instrument or profile
+    # one timer for each set of inputs, numbered as in the columns of the output csvs
+    timers = [StageTimer(trace_memory, combination=i, household_well_as=household, group=group)
+              if instrument else None for i, (household, group) in enumerate(zip(household_well_as, group_name))]
+
+    # results of every set of inputs, written to the store in bulk
+    sink = ResultsSink(export_csv=export_csv)
+    sink.clear()
+    checkpoint = Checkpoint(os.path.join(CACHE_DIR, 'sweep_checkpoint.pkl'),
+                            content_hash(config, file_hash(data_path), n_bootstrap, n_monte_carlo, plots, local_avg_as,
+                                         export_csv, backend, cluster_column), resume)
+
+    with activated(sink):
+        # compare subsets (only reruns when the data have changed)
+        compare_timer = StageTimer(trace_memory, combination=None, household_well_as=None, group='all') \
+            if instrument else None
+        with stage(compare_timer, 'compare'):
+            compare_subsets_stage(data, data_path)
+
+        # do run_unit on each unit of the sweep, keeping the outputs of each set of inputs in order
+        all_distributed_params = [None]*len(params_df)
+        all_household_params = [None]*len(params_df)
+        # the plot files are named by group, so with plots 'final-only' only the last set of inputs of each
+        # group makes PlotSpecs, and for each plot file only the spec of the last set of inputs is kept
+        final_combinations = set({group: i for i, group in enumerate(group_name)}.values())
+        final_plots = {}
+        def finish(unit_number, unit_results):
+            outputs, results = unit_results
+            for combination, distributed_params, household_params, specs, records in outputs:
+                all_distributed_params[combination] = distributed_params
+                all_household_params[combination] = household_params
+                for spec in specs:
+                    for path in spec.paths:
+                        if path not in final_plots or final_plots[path][0] < combination:
+                            final_plots[path] = (combination, spec)
+                # the timers are copied to worker processes and the checkpoint, so take back what they recorded
+                if timers[combination] is not None:
+                    timers[combination].records = records
+            sink.extend(results)
+            if unit_number not in checkpoint.finished:
+                checkpoint.add(unit_number, unit_results)
+        for unit_number, unit_results in checkpoint.finished.items():
+            finish(unit_number, unit_results)
+        if checkpoint.finished:
+            print(f'resuming the sweep with {len(checkpoint.finished)} of {len(units)} units already run')
+        inputs = {unit_number: (unit, p, numbins, n_bootstrap, n_monte_carlo, use_cache, plots,
+                                [timers[combination] for combination, _ in unit.combinations], local_avg_as, backend,
+                                cluster_column, final_combinations)
+                  for unit_number, unit in enumerate(units) if unit_number not in checkpoint.finished}
+        if jobs > 1:
+            # start with the largest groups, so that the processes finish at about the same time
+            by_size = sorted(inputs, key=lambda unit_number: -len(data.positions[units[unit_number].group]))
+            if export_csv or plots == 'all':
+                # the units of a group write the same csv and plot files, so they run one after another in the
+                # same process, in the same order as with one process
+                group_units = {}
+                for unit_number in by_size:
+                    group_units.setdefault(units[unit_number].group, []).append(unit_number)
+                batches = [sorted(unit_numbers) for unit_numbers in group_units.values()]
+            else:
+                # no files are written for each group, so every unit runs on its own
+                batches = [[unit_number] for unit_number in by_size]
+            with ProcessPoolExecutor(max_workers=jobs, initializer=init_worker, initargs=(data, export_csv)) \
+                    as executor:
+                futures = {executor.submit(run_units_in_worker, [inputs[unit_number] for unit_number in batch]): batch
+                           for batch in batches}
+                for future in as_completed(futures):
+                    for unit_number, unit_results in zip(futures[future], future.result()):
+                        finish(unit_number, unit_results)
+        else:
+            for unit_number, unit_inputs in inputs.items():
+                finish(unit_number, run_unit(data, ResultsSink(export_csv=export_csv, flush_rows=float('inf')),
+                                             *unit_inputs))
+    # make the last version of each plot (skipping those that are up to date) in a pool of jobs processes
+    if plots == 'final-only':
+        all_specs = [spec for _, spec in sorted({id(spec): (combination, spec)
+                                                 for combination, spec in final_plots.values()}.values(),
+                                                key=lambda item: item[0])]
+        with stage(compare_timer, 'final_plots'):
+            render_plots(final_specs(all_specs), jobs)
 
     # save all distributed params to one csv as adjacent columns
     all_distributed_params = pd.DataFrame(all_distributed_params)
@@ -79,10 +296,91 @@ def run_many():
     all_household_params = pd.DataFrame(all_household_params)
     all_household_params = all_household_params.T
     all_household_params.to_csv('../araihazar-data/analysis_output/run_many_household_params.csv')
+    # the sweep has finished, so there is nothing to resume
+    checkpoint.remove()
+
+    if sweep:
+        # every set of input parameters for each group, solved from one fit for all the household well columns
+        for group in dict.fromkeys(group_name):
+            data_subset = make_subset(data, group)
+            columns = [col for col in RADIUS_COLUMNS if col in data_subset.columns]
+            save_sweep(exposure_sweep(data_subset, columns,
+                                      [{k: UncertainVal(*v) for k, v in param_dict.items()} for param_dict in p]),
+                       group)
+
+    if instrument:
+        records = [record for timer in [compare_timer] + timers for record in timer.records]
+        save_report(records, os.path.join(output_dir, 'run_many_stage_times'))
+    if profile:
+        # run the slowest set of inputs again with nothing cached, so every stage is profiled
+        total_times = [sum(record['wall_s'] for record in timer.records) for timer in timers]
+        slowest = total_times.index(max(total_times))
+        print(f'profiling inputs {slowest} ({household_well_as[slowest]}, {group_name[slowest]}), '
+              f'which took {total_times[slowest]:.2f} s')
+        # the results are already in the store, so they are discarded
+        with activated(ResultsSink(store_path=None)):
+            profile_call(os.path.join(output_dir, 'run_many_slowest.prof'), run_one,
+                         parameters_with_uncertainties[slowest], household_well_as[slowest], group_name[slowest],
+                         data, numbins, n_bootstrap, n_monte_carlo, False, plots, None, local_avg_as, backend,
+                         cluster_column)
   
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
-    run_many()
+    parser = argparse.ArgumentParser(description='Run the mass balance models for many sets of input parameters.')
+    parser.add_argument('--jobs', '-j', type=int, default=1,
+                        help='number of units of sets of input parameters (those with the same household well '
+                             'column and group) to run at a time, in separate processes; with --csv or --plots all, '
+                             'the units of each group run in one process, since they write the same files '
+                             '(default: 1; 0 for one per CPU core)')
+    parser.add_argument('--bootstrap', type=int, default=0, metavar='N',
+                        help='also report bootstrap confidence intervals from N resamples of the participants '
+                             '(default: 0, no bootstrap)')
+    parser.add_argument('--monte-carlo', type=int, default=0, metavar='N',
+                        help='also report Monte Carlo uncertainties from N samples of all inputs '
+                             '(default: 0, no Monte Carlo)')
+    parser.add_argument('--no-cache', action='store_true',
+                        help='recompute every set of input parameters instead of using the results cache')
+    parser.add_argument('--plots', choices=['all', 'final-only', 'none'], default='all',
+                        help="make plots for every set of input parameters ('all', the default), only the last "
+                             "version of each plot file ('final-only'), or no plots ('none')")
+    parser.add_argument('--no-plots', dest='plots', action='store_const', const='none',
+                        help="same as --plots=none")
+    parser.add_argument('--instrument', action='store_true',
+                        help='save the time and memory taken by each stage of each set of input parameters '
+                             'to run_many_stage_times.csv and .json')
+    parser.add_argument('--trace-memory', action='store_true',
+                        help='with --instrument, also trace the peak memory allocated by Python in each stage '
+                             '(slower)')
+    parser.add_argument('--profile', action='store_true',
+                        help='run the slowest set of input parameters again under cProfile and save the profile '
+                             'to run_many_slowest.prof (implies --instrument)')
+    parser.add_argument('--local-avg-as', metavar='COLUMN',
+                        help='also solve the distributed model for each participant with this column of area-average '
+                             'arsenic (such as avg_as_500m) as avgAs, and use it for the plots of contributions')
+    parser.add_argument('--sweep', action='store_true',
+                        help='also fit the household wells model for each group with every household well column '
+                             'for radii from 20 m to 500 m, saving <group>_exposure_sweep.csv and a plot')
+    parser.add_argument('--csv', action='store_true',
+                        help='also save the results of each set of input parameters as csv files, as well as '
+                             'to the results store')
+    parser.add_argument('--config', default=SWEEP_CONFIG,
+                        help='sweep config file with the sets of input parameters, household well columns, groups '
+                             'and number of bins to run (default: sweep_config.json)')
+    parser.add_argument('--resume', action='store_true',
+                        help='resume an interrupted run of the same sweep from its checkpoint')
+    parser.add_argument('--regression', choices=BACKENDS, default='ols',
+                        help="fit the regressions by ordinary least squares ('ols', the default), with standard "
+                             "errors robust to correlation within clusters of participants ('cluster'), or with a "
+                             "random intercept for each cluster ('random_intercept')")
+    parser.add_argument('--cluster-column', default='well_id',
+                        help="column of the clusters of participants for --regression cluster or random_intercept, "
+                             "such as well_id, village or union_name (default: well_id)")
+    args = parser.parse_args()
+    run_many(jobs=args.jobs if args.jobs > 0 else os.cpu_count(), n_bootstrap=args.bootstrap,
+             n_monte_carlo=args.monte_carlo, use_cache=not args.no_cache, plots=args.plots,
+             instrument=args.instrument, trace_memory=args.trace_memory, profile=args.profile,
+             local_avg_as=args.local_avg_as, sweep=args.sweep, export_csv=args.csv, config_path=args.config,
+             resume=args.resume, backend=args.regression, cluster_column=args.cluster_column)
 
 
@@ -1,16 +1,224 @@
 import csv
 import os
+from collections import namedtuple
+from functools import lru_cache
 
-from uncertain_val import UncertainVal
+import numpy as np
+import pandas as pd
+import results_sink
+from uncertain_val import UncertainVal, UncertainArray
 import sympy as sym
 
-def calculate_parameters(distributed_results, household_results, ext_params, group_name, household_well_as):
+def calculate_parameters(distributed_results, household_results, ext_params, group_name, household_well_as,
+                         bootstrap=None, n_monte_carlo=0):
     """Calculate parameters for distributed well model and household well model
-    and save to csv files."""
-    distributed_params = solve_params_distributed(distributed_results, group_name, ext_params)
-    household_params = solve_params_household(household_results, group_name, household_well_as, ext_params)
+    and save to csv files. bootstrap is optionally a pair of arrays of regression coefficients
+    fit to bootstrap resamples of the data (as from bootstrap.bootstrap_fits), used to add
+    bootstrap confidence intervals alongside the propagated uncertainties. If n_monte_carlo
+    is more than 0, Monte Carlo uncertainties from that many samples are also added, with both models
+    evaluated on the same draws of the external parameters."""
+    if bootstrap is None:
+        bootstrap = (None, None)
+    monte_carlo = (None, None)
+    if n_monte_carlo > 0:
+        monte_carlo = monte_carlo_propagate(
+            [(distributed_model(), ['intercept', 'slope'],
+              distributed_results.params, distributed_results.cov_params()),
+             (household_model(), ['intercept', 'slope_primary', 'slope_household'],
+              household_results.params, household_results.cov_params())],
+            ext_params, n_monte_carlo)
+    distributed_params = solve_params_distributed(distributed_results, group_name, ext_params, bootstrap[0],
+                                                  monte_carlo[0])
+    household_params = solve_params_household(household_results, group_name, household_well_as, ext_params,
+                                              bootstrap[1], monte_carlo[1])
     return distributed_params, household_params
 
+def solved_files(group_name, household_well_as):
+    """Return the paths of the files that calculate_parameters writes."""
+    return ['../araihazar-data/analysis_output/' + file_name for file_name in
+            [f'{group_name}_distributed_solved.csv', f'{group_name}_{household_well_as}_household_solved.csv']]
+
+def local_solved_files(group_name):
+    """Return the paths of the files that solve_params_distributed_local writes."""
+    return [f'../araihazar-data/analysis_output/{group_name}_distributed_local_solved.csv']
+
+def solve_params_distributed_local(model, group_name, params, local_avg_as, subject_id):
+    """Solve the distributed well model for each participant, with the area-average arsenic around
+    their primary well (local_avg_as, such as the avg_as_500m column) as avgAs in place of the study-wide
+    value, which is kept for participants with no other wells in range. The local averages are treated as
+    exact. Writes one row per participant to the results sink and returns a dict mapping each output of the model
+    (and avgAs) to an UncertainArray with one value per participant."""
+    local_avg_as = np.asarray(local_avg_as, dtype=float)
+    local_avg_as = np.where(np.isnan(local_avg_as), float(params['avgAs'].value), local_avg_as)
+    ext_params = {name: v for name, v in params.items() if name not in ['intercept', 'slope']}
+    ext_params['avgAs'] = UncertainArray(local_avg_as)
+    solved = solve_batch(distributed_model(), ext_params, ['intercept', 'slope'], model.params, model.cov_params())
+    table = pd.DataFrame({'subject_id': np.asarray(subject_id), 'avgAs': local_avg_as})
+    for name, values in solved.items():
+        table[name] = values.value
+        table[name + '_uncertainty'] = values.uncertainty
+    results_sink.write('local_solved', table, lambda: table.to_csv(local_solved_files(group_name)[0], index=False),
+                       group=group_name)
+    solved['avgAs'] = ext_params['avgAs']
+    return solved
+
+def calculate_parameters_batch(distributed_results, household_results, ext_params):
+    """Vectorized version of calculate_parameters for many sets of external parameters at once.
+    ext_params maps each external parameter name to an UncertainArray (or an UncertainVal whose value
+    and uncertainty are arrays or scalars) of the same length. Returns dicts mapping each output of the
+    distributed well model and household well model to an UncertainArray.
+    Nothing is saved to file. Unlike calculate_parameters, uncertainties include the
+    covariance between the fitted regression coefficients."""
+    distributed_params = solve_batch(distributed_model(), ext_params, ['intercept', 'slope'],
+                                     distributed_results.params, distributed_results.cov_params())
+    household_params = solve_batch(household_model(), ext_params,
+                                   ['intercept', 'slope_primary', 'slope_household'],
+                                   household_results.params, household_results.cov_params())
+    return distributed_params, household_params
+
+def solve_batch(expressions, ext_params, coefficient_names, coefficients, coefficient_cov):
+    """Evaluate each expression (a dict mapping names to sympy expressions) and its uncertainty
+    for arrays of external parameters, with fitted coefficients named coefficient_names
+    and their covariance matrix. coefficients and coefficient_cov can also be stacks of
+    many fits, of shape (..., number of coefficients) and (..., number of coefficients, number of coefficients).
+
+    >>> x, a, b = sym.symbols('x a b')
+    >>> solved = solve_batch({'y': a + b*x}, {'x': UncertainVal(np.array([1., 2.]), 0.)},
+    ...                      ['a', 'b'], [1., 2.], [[1., -0.5], [-0.5, 1.]])
+    >>> solved['y'].value, solved['y'].uncertainty
+    (array([3., 5.]), array([1.        , 1.73205081]))
+    """
+    coefficients = np.asarray(coefficients, dtype=float)
+    coefficient_cov = np.asarray(coefficient_cov, dtype=float)
+    values = {name: np.asarray(v.value, dtype=float) for name, v in ext_params.items()}
+    uncertainties = {name: np.asarray(v.uncertainty, dtype=float) for name, v in ext_params.items()}
+    shape = np.broadcast_shapes(*(v.shape for v in values.values()), *(v.shape for v in uncertainties.values()),
+                                coefficients.shape[:-1])
+    values.update({name: np.broadcast_to(coefficients[..., i], shape) for i, name in enumerate(coefficient_names)})
+    solved = {}
+    for output, expr in expressions.items():
+        compiled = compile_expression(expr)
+        args = [values[name] for name in compiled.variables]
+        gradient = {name: np.broadcast_to(derivative(*args), shape)
+                    for name, derivative in zip(compiled.variables, compiled.gradient)}
+        # independent external parameters
+        error_sq = sum((gradient[name]*uncertainties[name])**2 for name in gradient if name in uncertainties)
+        # correlated regression coefficients
+        coefficient_gradient = np.stack([gradient.get(name, np.zeros(shape)) for name in coefficient_names], axis=-1)
+        error_sq = error_sq + np.einsum('...i,...ij,...j->...', coefficient_gradient, coefficient_cov,
+                                        coefficient_gradient)
+        solved[output] = UncertainArray(np.broadcast_to(compiled.value(*args), shape), np.sqrt(error_sq))
+    return solved
+
+def bootstrap_intervals(expressions, params, coefficient_names, coefficient_samples, confidence=0.95):
+    """Solve each expression (a dict mapping names to sympy expressions) for every row of coefficient_samples,
+    an array of regression coefficients named coefficient_names, with the other parameters at their values.
+    Returns a dict mapping each name to the (lower, upper) percentile confidence interval.
+
+    >>> x, a, b = sym.symbols('x a b')
+    >>> samples = np.column_stack([np.zeros(101), np.linspace(0, 1, 101)])
+    >>> intervals = bootstrap_intervals({'y': a + b*x}, {'x': UncertainVal(2., 0.1)}, ['a', 'b'], samples, 0.9)
+    >>> np.round(intervals['y'], 6)
+    array([0.1, 1.9])
+    """
+    values = {name: v.value for name, v in params.items()}
+    values.update({name: coefficient_samples[:, i] for i, name in enumerate(coefficient_names)})
+    tail = (1 - confidence)/2*100
+    intervals = {}
+    for output, expr in expressions.items():
+        compiled = compile_expression(expr)
+        solved = compiled.value(*[values[name] for name in compiled.variables])
+        lower, upper = np.percentile(solved, [tail, 100 - tail])
+        intervals[output] = (float(lower), float(upper))
+    return intervals
+
+def monte_carlo_propagate(models, params, n_samples=1_000_000, quantiles=(0.025, 0.5, 0.975), seed=0,
+                          chunk_size=100_000):
+    """Propagate uncertainty through one or more models by sampling. models is a list of
+    (expressions, coefficient_names, coefficients, coefficient_cov), where expressions is a dict mapping
+    names to sympy expressions. Parameters in params (a dict mapping names to UncertainVals) are drawn
+    independently from normal distributions, once for all of the models, and the regression coefficients
+    of each model are drawn jointly from a multivariate normal distribution with their covariance matrix.
+    Samples are drawn and evaluated chunk_size at a time, and only running summaries are kept, so memory
+    does not grow with n_samples: the mean and sd are exact (merged across chunks), and each quantile is
+    the average of the quantiles of the chunks, weighted by their size, which is close to the quantile of all
+    the samples when the chunks are large (the default 100,000 samples is ample for the 2.5th percentile).
+    Returns a list with a dict for each model mapping each name to a dict with the 'mean', 'sd'
+    and a dict of 'quantiles'.
+
+    >>> x, a = sym.symbols('x a')
+    >>> [summary] = monte_carlo_propagate([({'y': a*x}, ['a'], [3.], [[1.]])], {'x': UncertainVal(2., 0.)})
+    >>> round(summary['y']['mean'], 2), round(summary['y']['sd'], 2), round(summary['y']['quantiles'][0.5], 2)
+    (6.0, 2.0, 6.0)
+    """
+    rng = np.random.default_rng(seed)
+    compiled = [compile_outputs(tuple(expressions.items())) for expressions, _, _, _ in models]
+    coefficient_names = {name for _, names, _, _ in models for name in names}
+    needed = {name for outputs in compiled for name in outputs.variables}
+    shared = [(name, v) for name, v in params.items() if name in needed and name not in coefficient_names]
+    # running count, mean and sum of squared deviations from the mean, and weighted sum of chunk quantiles
+    totals = [{output: [0, 0., 0., np.zeros(len(quantiles))] for output in outputs.names} for outputs in compiled]
+    for start in range(0, n_samples, chunk_size):
+        size = min(chunk_size, n_samples - start)
+        samples = {name: rng.normal(v.value, v.uncertainty, size) for name, v in shared}
+        for (_, names, coefficients, coefficient_cov), outputs, model_totals in zip(models, compiled, totals):
+            drawn = rng.multivariate_normal(np.asarray(coefficients, dtype=float),
+                                            np.asarray(coefficient_cov, dtype=float), size)
+            samples.update(zip(names, drawn.T))
+            solved = outputs.value(*[samples[name] for name in outputs.variables])
+            for output, values in zip(outputs.names, solved):
+                values = np.broadcast_to(values, size)
+                count, mean, sum_sq, quantile_sum = model_totals[output]
+                chunk_mean = float(np.mean(values))
+                chunk_sum_sq = float(np.sum((values - chunk_mean)**2))
+                # combine with the earlier chunks (Chan et al.'s parallel algorithm)
+                delta = chunk_mean - mean
+                total = count + size
+                model_totals[output] = [total, mean + delta*size/total,
+                                        sum_sq + chunk_sum_sq + delta**2*count*size/total,
+                                        quantile_sum + size*np.quantile(values, quantiles)]
+    summaries = []
+    for model_totals in totals:
+        summaries.append({output: {'mean': mean, 'sd': float(np.sqrt(sum_sq/(count - 1))),
+                                   'quantiles': dict(zip(quantiles, (quantile_sum/count).tolist()))}
+                          for output, (count, mean, sum_sq, quantile_sum) in model_totals.items()})
+    return summaries
+
+def monte_carlo_solutions(summary):
+    """Turn the summary of a model from monte_carlo_propagate into entries for a solutions dict: for each name,
+    '<name>_mc' with the mean and sd, and '<name>_mc_q<percent>' for each quantile."""
+    entries = {}
+    for output, stats in summary.items():
+        entries[output] = {output + '_mc': UncertainVal(stats['mean'], stats['sd'])}
+        entries[output].update({f'{output}_mc_q{100*q:g}': v for q, v in stats['quantiles'].items()})
+    return entries
+
+def add_intervals(solutions, intervals):
+    """Return solutions with the lower and upper bounds of each interval placed after the value it belongs to."""
+    return add_after(solutions, {name: {name + '_ci_lower': lower, name + '_ci_upper': upper}
+                                 for name, (lower, upper) in intervals.items()})
+
+def add_after(solutions, additions):
+    """Return solutions with the entries in additions[name] placed after the value for each name."""
+    with_additions = {}
+    for name, value in solutions.items():
+        with_additions[name] = value
+        with_additions.update(additions.get(name, {}))
+    return with_additions
+
+def parameter_grid(param_options):
+    """Expand a dict mapping each external parameter name to a list of (value, uncertainty) options
+    into every combination of options, as a dict of UncertainArrays for calculate_parameters_batch.
+
+    >>> grid = parameter_grid({'ff': [(0.2, 0.1), (0.3, 0.1)], 'Q': [(3, 1), (4.4, 1.5), (5, 1)]})
+    >>> grid['ff'].value, grid['Q'].uncertainty
+    (array([0.2, 0.2, 0.2, 0.3, 0.3, 0.3]), array([1. , 1.5, 1. , 1. , 1.5, 1. ]))
+    """
+    options = {name: np.asarray(opts, dtype=float) for name, opts in param_options.items()}
+    indices = np.meshgrid(*(np.arange(opts.shape[0]) for opts in options.values()), indexing='ij')
+    return {name: UncertainArray(opts[index.ravel(), 0], opts[index.ravel(), 1])
+            for (name, opts), index in zip(options.items(), indices)}
+
 # adapted function from Jason
 def propagate_uncertainty(expr, values=None, uncertainties=None, d=sym.symbols('d', cls=sym.Function)):
     """
@@ -47,6 +255,63 @@ def propagate_uncertainty(expr, values=None, uncertainties=None, d=sym.symbols('
     final_error = num_error.subs({dv(k):d(k) for k in variables})
     return UncertainVal(expr.subs(values), final_error)
 
+# variable names of an expression, with NumPy functions of those variables (in that order)
+# for the value of the expression and for its partial derivative with respect to each variable
+CompiledExpression = namedtuple('CompiledExpression', ['variables', 'value', 'gradient'])
+
+@lru_cache(maxsize=None)
+def compile_expression(expr):
+    """Differentiate a sympy expression with respect to each of its variables and turn the
+    expression and its derivatives into NumPy functions. Results are cached by expression,
+    so the symbolic work is only done once for each expression.
+
+    >>> x, y = sym.symbols('x y')
+    >>> compiled = compile_expression(x * y)
+    >>> compiled.variables
+    ('x', 'y')
+    >>> compiled.value(2, 3), [derivative(2, 3) for derivative in compiled.gradient]
+    (6, [3, 2])
+    """
+    variables = sorted(expr.free_symbols, key=lambda v: v.name)
+    value = sym.lambdify(variables, expr, modules='numpy')
+    gradient = tuple(sym.lambdify(variables, sym.diff(expr, v), modules='numpy') for v in variables)
+    return CompiledExpression(tuple(v.name for v in variables), value, gradient)
+
+# names of the outputs of a model and of all of their variables (in that order), with a NumPy function
+# of those variables that returns the value of every output
+CompiledOutputs = namedtuple('CompiledOutputs', ['names', 'variables', 'value'])
+
+@lru_cache(maxsize=None)
+def compile_outputs(outputs):
+    """Turn a model, a tuple of (name, sympy expression) pairs, into one NumPy function that evaluates
+    every expression, with the subexpressions they share computed only once. Results are cached by model.
+
+    >>> x, y = sym.symbols('x y')
+    >>> compiled = compile_outputs((('sum', x + y), ('ratio', (x + y)/x)))
+    >>> compiled.names, compiled.variables, compiled.value(2., 6.)
+    (('sum', 'ratio'), ('x', 'y'), [8.0, 4.0])
+    """
+    variables = sorted(set().union(*(expr.free_symbols for _, expr in outputs)), key=lambda v: v.name)
+    value = sym.lambdify(variables, [expr for _, expr in outputs], modules='numpy', cse=True)
+    return CompiledOutputs(tuple(name for name, _ in outputs), tuple(v.name for v in variables), value)
+
+def propagate_uncertainty_numeric(expr, values, uncertainties):
+    """Numeric version of propagate_uncertainty, for when every variable in expr has a value
+    and an uncertainty. Keys of values and uncertainties may be sympy Symbols or variable names.
+    Uses compile_expression, so after the first call for an expression this is plain array math.
+
+    >>> x, y = sym.symbols('x y')
+    >>> propagate_uncertainty_numeric(x * y, {x:20, y:30}, {x:2, y:3})
+    UncertainVal(600.0, 84.8528137423857)
+    """
+    compiled = compile_expression(expr)
+    values = {str(k):v for k, v in values.items()}
+    uncertainties = {str(k):v for k, v in uncertainties.items()}
+    args = [values[name] for name in compiled.variables]
+    error_sq = sum((derivative(*args)*uncertainties[name])**2
+                   for name, derivative in zip(compiled.variables, compiled.gradient))
+    return UncertainVal(float(compiled.value(*args)), float(np.sqrt(error_sq)))
+
 def split_uncertainties(parameters_with_uncertainties):
     """Takes a dict mapping variable to UncertainVal.
     Splits it into separate dicts for values and uncertainties and turns variables into sympy Symbols."""
@@ -77,51 +342,59 @@ def apply_formatting(arg):
     else:
         return str(arg)
 
-def solve_params_distributed(model, group_name, params):
-    """Solve for parameters and uncertainties for distributed well model and save to csv."""
+@lru_cache(maxsize=None)
+def distributed_model():
+    """Return a dict mapping the names of the outputs of the distributed well model
+    to their sympy expressions."""
     ff, fc, md, mb, Mf, Q, avgAs, slope, intercept = sym.symbols('ff fc md mb Mf Q avgAs slope intercept')
-    # get values and uncertainties for slope and intercept
-    params['slope'] = UncertainVal(model.params[1], model.bse[1])
-    params['intercept'] = UncertainVal(model.params[0], model.bse[0])
-    # split values and uncertainties into separate lists
-    values, uncertainties = split_uncertainties(params)
-
     # solve for fp, fu, and fo
     fp = (slope*(1-ff-fc)*avgAs+Mf/Q)/(slope*avgAs+intercept)
     fu = (1-md-mb)*(fp/slope)
     fo = 1 - fp - ff - fc
     frac_primary_well = fp/(fp+fo)
     frac_other_well = fo/(fp+fo)
+    return {'fp': fp, 'fu': fu, 'fo': fo, 'frac_primary_well': frac_primary_well,
+            'frac_other_well': frac_other_well}
+
+def solve_params_distributed(model, group_name, params, bootstrap=None, monte_carlo=None):
+    """Solve for parameters and uncertainties for distributed well model and save to csv.
+    If bootstrap (an array of intercepts and slopes fit to resamples of the data) is given,
+    also include bootstrap confidence intervals. If monte_carlo (the summary of this model
+    from monte_carlo_propagate) is given, also include the Monte Carlo uncertainties."""
+    # get values and uncertainties for slope and intercept
+    params['slope'] = UncertainVal(model.params[1], model.bse[1])
+    params['intercept'] = UncertainVal(model.params[0], model.bse[0])
+    # split values and uncertainties into separate lists
+    values, uncertainties = split_uncertainties(params)
 
-    fp = propagate_uncertainty(fp, values, uncertainties)
-    fu = propagate_uncertainty(fu, values, uncertainties)
-    fo = propagate_uncertainty(fo, values, uncertainties)
-    frac_primary_well = propagate_uncertainty(frac_primary_well, values, uncertainties)
-    frac_other_well = propagate_uncertainty(frac_other_well, values, uncertainties)
+    # solve for fp, fu, and fo
+    solved = {name: propagate_uncertainty_numeric(expr, values, uncertainties)
+              for name, expr in distributed_model().items()}
 
     solutions = {'nobs':model.nobs, 'r2':model.rsquared, 'r2_adj':model.rsquared_adj,
                 'intercept':(model.params[0], model.bse[0]), 'slope':(model.params[1], model.bse[1]),
-                'fu': fu, 'fp': fp, 'fo': fo, 'frac_primary_well':frac_primary_well,
-                'frac_other_well':frac_other_well}
+                'fu': solved['fu'], 'fp': solved['fp'], 'fo': solved['fo'],
+                'frac_primary_well':solved['frac_primary_well'],
+                'frac_other_well':solved['frac_other_well']}
+    if bootstrap is not None:
+        solutions = add_intervals(solutions, bootstrap_intervals(distributed_model(), params,
+                                                                 ['intercept', 'slope'], bootstrap))
+    if monte_carlo is not None:
+        solutions = add_after(solutions, monte_carlo_solutions(monte_carlo))
     # also include the input parameters so they can be referenced alongside the output parmeters
     solutions.update(params)
     # also include info about which cohort
     solutions.update({'group':group_name})
     file_name = f'{group_name}_distributed_solved.csv'
-    format_and_save_file(file_name, solutions)
+    format_and_save_file(file_name, solutions, model='distributed', group=group_name, household_well_as=None)
     return solutions
 
-def solve_params_household(model, group_name, household_well_as, params):
-    """Solve for parameters and uncertainties for distributed well model and save to csv."""
+@lru_cache(maxsize=None)
+def household_model():
+    """Return a dict mapping the names of the outputs of the household well model
+    to their sympy expressions."""
     ff, fc, md, mb, Mf, Q, avgAs, slope_primary, slope_household, intercept = \
         sym.symbols('ff fc md mb Mf Q avgAs slope_primary slope_household intercept')
-    # get values and uncertainties for slope and intercept
-    params['slope_primary'] = UncertainVal(model.params[1], model.bse[1])
-    params['slope_household'] = UncertainVal(model.params[2], model.bse[2])
-    params['intercept'] = UncertainVal(model.params[0], model.bse[0])
-    # split values and uncertainties into separate lists
-    values, uncertainties = split_uncertainties(params)
-
     # solve for fp, fu, fo, fh
     fu = (1 - md - mb)*(1 - ff - fc + Mf/Q/avgAs)/(slope_primary + slope_household + intercept/avgAs)
     # print(f'fu is{fu}'')
@@ -132,39 +405,80 @@ def solve_params_household(model, group_name, household_well_as, params):
     frac_primary_well = fp/(fp+fo+fh)
     frac_other_well = fo/(fp+fo+fh)
     frac_household_well = fh/(fp+fo+fh)
+    return {'fp': fp, 'fu': fu, 'fo': fo, 'fh': fh, 'frac_primary_well': frac_primary_well,
+            'frac_other_well': frac_other_well, 'frac_household_well': frac_household_well}
+
+def solve_params_household(model, group_name, household_well_as, params, bootstrap=None, monte_carlo=None):
+    """Solve for parameters and uncertainties for household well model and save to csv.
+    If bootstrap (an array of intercepts, primary well slopes and household well slopes
+    fit to resamples of the data) is given, also include bootstrap confidence intervals.
+    If monte_carlo (the summary of this model from monte_carlo_propagate) is given,
+    also include the Monte Carlo uncertainties."""
+    # get values and uncertainties for slope and intercept
+    params['slope_primary'] = UncertainVal(model.params[1], model.bse[1])
+    params['slope_household'] = UncertainVal(model.params[2], model.bse[2])
+    params['intercept'] = UncertainVal(model.params[0], model.bse[0])
+    # split values and uncertainties into separate lists
+    values, uncertainties = split_uncertainties(params)
 
-    fp = propagate_uncertainty(fp, values, uncertainties)
-    fu = propagate_uncertainty(fu, values, uncertainties)
-    fo = propagate_uncertainty(fo, values, uncertainties)
-    fh = propagate_uncertainty(fh, values, uncertainties)
-    frac_primary_well = propagate_uncertainty(frac_primary_well, values, uncertainties)
-    frac_other_well = propagate_uncertainty(frac_other_well, values, uncertainties)
-    frac_household_well = propagate_uncertainty(frac_household_well, values, uncertainties)
+    # solve for fp, fu, fo, fh
+    solved = {name: propagate_uncertainty_numeric(expr, values, uncertainties)
+              for name, expr in household_model().items()}
     solutions =  {'nobs':model.nobs, 'r2':model.rsquared, 'r2_adj':model.rsquared_adj,
                   'intercept':(model.params[0], model.bse[0]),
                   'slope_primary':(model.params[1], model.bse[1]),
                   'slope_household':(model.params[2], model.bse[2]),
-                  'fu': fu, 'fp': fp, 'fh': fh, 'fo': fo,
-                  'frac_primary_well': frac_primary_well,
-                  'frac_household_well': frac_household_well,
-                  'frac_other_well':frac_other_well
+                  'fu': solved['fu'], 'fp': solved['fp'], 'fh': solved['fh'], 'fo': solved['fo'],
+                  'frac_primary_well': solved['frac_primary_well'],
+                  'frac_household_well': solved['frac_household_well'],
+                  'frac_other_well':solved['frac_other_well']
                  }
+    if bootstrap is not None:
+        solutions = add_intervals(solutions, bootstrap_intervals(
+            household_model(), params, ['intercept', 'slope_primary', 'slope_household'], bootstrap))
+    if monte_carlo is not None:
+        solutions = add_after(solutions, monte_carlo_solutions(monte_carlo))
     # also include the input parameters so they can be referenced alongside the output parmeters
     solutions.update(params)
     # also include info about which cohort
     solutions.update({'group':group_name})
     solutions.update({'group':household_well_as})
     file_name = f'{group_name}_{household_well_as}_household_solved.csv'
-    format_and_save_file(file_name, solutions)
+    format_and_save_file(file_name, solutions, model='household', group=group_name,
+                         household_well_as=household_well_as)
     return solutions
 
-def format_and_save_file(file_name, solutions):
-    """Formats solutions and saves them as csv file with in output_data folder with file_name"""
-    with open(os.path.abspath('../araihazar-data/analysis_output/' + file_name), "w") as savefile:
-        writer = csv.writer(savefile)
-        for value in apply_formatting(solutions).items():
-        # for value in solutions.items():
-            writer.writerow(value)
+def solution_records(solutions):
+    """Return solutions as a table with one row per name, with its value and uncertainty as numbers
+    (NaN where it has none, such as for the group name) and formatted for display.
+
+    >>> solution_records({'fp': UncertainVal(0.5, 0.2), 'ff': 0.2, 'group': 'all'})
+        name  value  uncertainty   formatted
+    0     fp    0.5          0.2  0.50+-0.20
+    1     ff    0.2          NaN        0.20
+    2  group    NaN          NaN         all
+    """
+    def numbers(v):
+        if isinstance(v, UncertainVal):
+            return float(v.value), float(v.uncertainty)
+        if isinstance(v, (int, float)):
+            return float(v), np.nan
+        return np.nan, np.nan
+    values, uncertainties = zip(*map(numbers, solutions.values()))
+    return pd.DataFrame({'name': list(solutions), 'value': np.array(values, dtype=float),
+                         'uncertainty': np.array(uncertainties, dtype=float),
+                         'formatted': list(apply_formatting(solutions).values())})
+
+def format_and_save_file(file_name, solutions, **keys):
+    """Formats solutions and writes them to the results sink as 'solved' results with key columns keys,
+    saving them as csv file with in output_data folder with file_name if csv files are being saved"""
+    def save_csv():
+        with open(os.path.abspath('../araihazar-data/analysis_output/' + file_name), "w") as savefile:
+            writer = csv.writer(savefile)
+            for value in apply_formatting(solutions).items():
+            # for value in solutions.items():
+                writer.writerow(value)
+    results_sink.write('solved', solution_records(solutions), save_csv, **keys)
 
 if __name__ == "__main__":
     import doctest
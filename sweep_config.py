@@ -0,0 +1,145 @@
+"""This module reads the sets of inputs that run_all.run_many sweeps over from a config file (by default
+sweep_config.json, next to this file), plans the sweep as units of work that share their regressions,
+and keeps a checkpoint of the finished units so that an interrupted sweep can be resumed.
+
+The config file is a JSON object with
+    "parameters": the options for each input parameter of the mass balance, each a list of
+        [value, uncertainty] pairs or, for a Latin hypercube design, {"range": [low, high], "uncertainty": u}
+    "design": "product" for every combination of the options (the default), or "latin_hypercube" for
+        "samples" sets of parameters sampled from them (with random "seed")
+    "household_well_as": the household well arsenic columns
+    "groups": the groups of participants
+    "numbins": the number of bins for plotting results
+Every set of parameters is run with every household well column and every group.
+"""
+import json
+import os
+import pickle
+from collections import namedtuple
+from itertools import product
+
+import numpy as np
+
+SWEEP_CONFIG = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'sweep_config.json')
+
+# the sets of inputs of a sweep: parameter_sets is a list of dicts mapping each input parameter
+# to a (value, uncertainty) pair
+SweepConfig = namedtuple('SweepConfig', ['parameter_sets', 'household_well_as', 'groups', 'numbins'])
+
+# one unit of work of a sweep: the sets of inputs with the same household well column and group, which share
+# their regressions. combinations lists the number of each set of inputs (as in the columns of the run_many
+# csvs) with the number of its set of parameters.
+SweepUnit = namedtuple('SweepUnit', ['household_well_as', 'group', 'combinations'])
+
+def load_sweep_config(path=SWEEP_CONFIG):
+    """Return the SweepConfig in the config file at path."""
+    with open(path) as config_file:
+        config = json.load(config_file)
+    return SweepConfig(expand_parameters(config['parameters'], config.get('design', 'product'),
+                                         config.get('samples'), config.get('seed', 0)),
+                       list(config['household_well_as']), list(config['groups']), int(config.get('numbins', 15)))
+
+def expand_parameters(parameters, design='product', samples=None, seed=0):
+    """Return the list of parameter sets of a design from the options for each parameter.
+
+    >>> expand_parameters({'Mf': [[64, 4], [96, 6]], 'Q': [[4.4, 1.5]]})
+    [{'Mf': (64, 4), 'Q': (4.4, 1.5)}, {'Mf': (96, 6), 'Q': (4.4, 1.5)}]
+    >>> sets = expand_parameters({'Mf': {'range': [64, 96], 'uncertainty': 5}, 'Q': [[3, 1], [5, 1]]},
+    ...                          'latin_hypercube', samples=4)
+    >>> sorted(int(s['Mf'][0]) // 8 for s in sets), sorted(s['Q'] for s in sets)
+    ([8, 9, 10, 11], [(3, 1), (3, 1), (5, 1), (5, 1)])
+    """
+    if design == 'product':
+        ranged = [name for name, options in parameters.items() if isinstance(options, dict)]
+        if ranged:
+            raise ValueError(f'parameters {ranged} have a range, which needs the latin_hypercube design')
+        return [dict(zip(parameters, map(tuple, options))) for options in product(*parameters.values())]
+    if design == 'latin_hypercube':
+        if not samples:
+            raise ValueError('the latin_hypercube design needs a number of samples')
+        return latin_hypercube(parameters, samples, seed)
+    raise ValueError(f"design must be 'product' or 'latin_hypercube', not {design!r}")
+
+def latin_hypercube(parameters, samples, seed=0):
+    """Return samples parameter sets from a Latin hypercube over the parameters: each parameter with a range
+    takes one value from each of samples equal slices of it, and each with a list of options takes each
+    option in the same share of the sets."""
+    rng = np.random.default_rng(seed)
+    # one point in a random slice of each parameter for each sample, with each slice used once
+    slices = rng.permuted(np.tile(np.arange(samples), (len(parameters), 1)), axis=1).T
+    points = (slices + rng.random((samples, len(parameters))))/samples
+    columns = {}
+    for (name, options), point in zip(parameters.items(), points.T):
+        if isinstance(options, dict):
+            low, high = options['range']
+            columns[name] = [(float(low + (high - low)*x), options['uncertainty']) for x in point]
+        else:
+            columns[name] = [tuple(options[int(x*len(options))]) for x in point]
+    return [{name: columns[name][i] for name in parameters} for i in range(samples)]
+
+def plan_units(n_parameter_sets, household_columns, groups):
+    """Return the SweepUnits of a sweep over every combination of n_parameter_sets sets of parameters,
+    household_columns and groups, numbered in that order.
+
+    >>> plan_units(2, ['other_as_20m'], ['all', 'men'])
+    [SweepUnit(household_well_as='other_as_20m', group='all', combinations=[(0, 0), (2, 1)]), \
+SweepUnit(household_well_as='other_as_20m', group='men', combinations=[(1, 0), (3, 1)])]
+    """
+    units = {}
+    for combination, (parameter_set, household, group) in enumerate(product(range(n_parameter_sets),
+                                                                            household_columns, groups)):
+        units.setdefault((household, group), []).append((combination, parameter_set))
+    return [SweepUnit(household, group, combinations) for (household, group), combinations in units.items()]
+
+class Checkpoint:
+    """
+    This is a class for saving the results of each unit of a sweep as it finishes, so that
+    the sweep can be resumed after an interruption without running those units again.
+
+    Attributes:
+        path (str): File of the checkpoint, which starts with the key and then has one record per unit
+        key (str): Hash of the inputs of the sweep; a checkpoint with a different key is not resumed
+        finished (dict): Maps the number of each finished unit to its results
+    """
+    def __init__(self, path, key, resume=False):
+        """
+        Initializes Checkpoint, with the units finished in an earlier run of the same sweep if resume is True.
+        """
+        self.path = os.path.abspath(path)
+        self.key = key
+        self.finished = self.read() if resume else {}
+        os.makedirs(os.path.dirname(self.path), exist_ok=True)
+        # rewrite the checkpoint, without any record left partly written by the interruption
+        with open(self.path, 'wb') as checkpoint_file:
+            pickle.dump(self.key, checkpoint_file, protocol=pickle.HIGHEST_PROTOCOL)
+            for record in self.finished.items():
+                pickle.dump(record, checkpoint_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def read(self):
+        """Return the finished units in the checkpoint file, or none if it is for a different sweep."""
+        finished = {}
+        try:
+            with open(self.path, 'rb') as checkpoint_file:
+                if pickle.load(checkpoint_file) != self.key:
+                    print('the checkpoint is for a different sweep, starting from the beginning')
+                    return {}
+                while True:
+                    unit_number, results = pickle.load(checkpoint_file)
+                    finished[unit_number] = results
+        except (FileNotFoundError, EOFError, pickle.UnpicklingError):
+            pass
+        return finished
+
+    def add(self, unit_number, results):
+        """Save the results of a finished unit."""
+        self.finished[unit_number] = results
+        with open(self.path, 'ab') as checkpoint_file:
+            pickle.dump((unit_number, results), checkpoint_file, protocol=pickle.HIGHEST_PROTOCOL)
+
+    def remove(self):
+        """Delete the checkpoint file, once the sweep has finished."""
+        os.remove(self.path)
+
+if __name__ == "__main__":
+    import doctest
+    doctest.testmod()
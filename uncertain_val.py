@@ -1,4 +1,37 @@
-"""This module provides the class for dealing with values with uncertainties."""
+"""This module provides classes for dealing with values with uncertainties.
+
+Arithmetic (+, -, *, / and **) propagates uncertainties to first order, assuming the two operands
+are independent. UncertainArray can also hold a covariance matrix, which is propagated with it.
+"""
+import numpy as np
+
+def _add(a, b):
+    """Return a + b and its partial derivatives with respect to a and b."""
+    return a + b, 1, 1
+
+def _sub(a, b):
+    return a - b, 1, -1
+
+def _mul(a, b):
+    return a*b, b, a
+
+def _truediv(a, b):
+    return a/b, 1/b, -a/b**2
+
+def _pow(a, b):
+    value = a**b
+    # the derivative with respect to b is only needed (and only defined for a > 0) if b is uncertain
+    return value, b*a**(b - 1), lambda: value*np.log(a)
+
+def _reflect(operation):
+    """Return operation with its operands swapped."""
+    def reflected(a, b):
+        value, d_a, d_b = operation(b, a)
+        return value, d_b, d_a
+    return reflected
+
+def _derivative(d):
+    return d() if callable(d) else d
 
 class UncertainVal:
     """
@@ -8,6 +41,10 @@ class UncertainVal:
         value (float): The parameter value
         uncertainty (float): The uncertainty on the parameter value
     """
+    __slots__ = ('value', 'uncertainty')
+    # make NumPy hand arithmetic with UncertainVals back to UncertainVal
+    __array_ufunc__ = None
+
     def __init__(self, value, uncertainty):
         """
         Initializes UncertainVal class with value and uncertainty.
@@ -15,7 +52,7 @@ class UncertainVal:
         self.value = value
         self.uncertainty = uncertainty
 
-    def __repr__(self):   
+    def __repr__(self):
         """
         >>> uval = UncertainVal(0.5, 0.1)
         >>> eval(repr(uval)) == uval
@@ -26,7 +63,7 @@ class UncertainVal:
     def __str__(self):
         """
         Returns value and uncertainty as a formatted string.
-        
+
         >>> uval = UncertainVal(0.5, 0.1)
         >>> str(uval)
         '0.50+-0.10'
@@ -37,6 +74,237 @@ class UncertainVal:
         """Two UncertainVals are equal if their values are equal and their uncertainties are equal"""
         return self.value == other.value and self.uncertainty == other.uncertainty
 
+    def _propagate(self, other, operation):
+        """Apply operation to the values of self and other (an UncertainVal or a number)
+        and propagate their uncertainties.
+
+        >>> UncertainVal(3., 0.3) + UncertainVal(4., 0.4)
+        UncertainVal(7.0, 0.5)
+        >>> 2*UncertainVal(3., 0.3) - 1
+        UncertainVal(5.0, 0.6)
+        >>> UncertainVal(6., 0.6) / UncertainVal(2., 0.)
+        UncertainVal(3.0, 0.3)
+        >>> UncertainVal(3., 0.3)**2
+        UncertainVal(9.0, 1.7999999999999998)
+        """
+        if isinstance(other, UncertainArray):
+            return NotImplemented
+        other_value, other_uncertainty = ((other.value, other.uncertainty) if isinstance(other, UncertainVal)
+                                          else (other, None))
+        value, d_self, d_other = operation(self.value, other_value)
+        error_sq = (_derivative(d_self)*self.uncertainty)**2
+        if other_uncertainty is not None:
+            error_sq = error_sq + (_derivative(d_other)*other_uncertainty)**2
+        return UncertainVal(value, error_sq**0.5)
+
+    def __add__(self, other):
+        return self._propagate(other, _add)
+
+    def __radd__(self, other):
+        return self._propagate(other, _reflect(_add))
+
+    def __sub__(self, other):
+        return self._propagate(other, _sub)
+
+    def __rsub__(self, other):
+        return self._propagate(other, _reflect(_sub))
+
+    def __mul__(self, other):
+        return self._propagate(other, _mul)
+
+    def __rmul__(self, other):
+        return self._propagate(other, _reflect(_mul))
+
+    def __truediv__(self, other):
+        return self._propagate(other, _truediv)
+
+    def __rtruediv__(self, other):
+        return self._propagate(other, _reflect(_truediv))
+
+    def __pow__(self, other):
+        return self._propagate(other, _pow)
+
+    def __rpow__(self, other):
+        return self._propagate(other, _reflect(_pow))
+
+    def __neg__(self):
+        return UncertainVal(-self.value, self.uncertainty)
+
+class UncertainArray:
+    """
+    This is a class for dealing with arrays of values with uncertainties, such as an estimate
+    for each bin or each participant, so that a whole array propagates in one operation.
+
+    Attributes:
+        value (numpy.ndarray): The values
+        uncertainty (numpy.ndarray): The uncertainty on each value
+        covariance (numpy.ndarray or None): The covariance matrix of a 1-D array of values, if known.
+            If it is None the values are treated as independent.
+    """
+    __slots__ = ('value', 'uncertainty', 'covariance')
+    __array_ufunc__ = None
+
+    def __init__(self, value, uncertainty=0., covariance=None):
+        """
+        Initializes UncertainArray class with values and either uncertainties or a covariance matrix.
+        """
+        self.value = np.asarray(value, dtype=float)
+        if covariance is not None:
+            self.covariance = np.asarray(covariance, dtype=float)
+            if self.value.ndim != 1 or self.covariance.shape != (self.value.size,)*2:
+                raise ValueError(f'covariance of shape {self.covariance.shape} does not match values of shape '
+                                 f'{self.value.shape}')
+            self.uncertainty = np.sqrt(np.diag(self.covariance))
+        else:
+            self.covariance = None
+            self.uncertainty = np.broadcast_to(np.asarray(uncertainty, dtype=float), self.value.shape)
+
+    @classmethod
+    def sample_means(cls, samples):
+        """Return the means of the columns of samples (one row per sample) and their covariance,
+        the covariance of the columns divided by the number of samples. The uncertainties are the
+        standard errors of the means.
+
+        >>> means = UncertainArray.sample_means([[1., 2.], [3., 6.], [5., 7.]])
+        >>> means
+        UncertainArray(array([3., 5.]), covariance=array([[1.33333333, 1.66666667],
+               [1.66666667, 2.33333333]]))
+        """
+        samples = np.asarray(samples, dtype=float)
+        return cls(samples.mean(axis=0), covariance=np.atleast_2d(np.cov(samples, rowvar=False))/samples.shape[0])
+
+    def __repr__(self):
+        """
+        >>> UncertainArray([0.5, 1.], 0.1)
+        UncertainArray(array([0.5, 1. ]), array([0.1, 0.1]))
+        """
+        if self.covariance is not None:
+            return f'UncertainArray({self.value!r}, covariance={self.covariance!r})'
+        return f'UncertainArray({self.value!r}, {np.array(self.uncertainty)!r})'
+
+    def __str__(self):
+        """
+        Returns the values and uncertainties as a formatted string.
+
+        >>> str(UncertainArray([0.5, 1.], [0.1, 0.2]))
+        '[0.50+-0.10 1.00+-0.20]'
+        """
+        return '[' + ' '.join(f'{v:.2f}+-{u:.2f}' for v, u in zip(self.value.ravel(), self.uncertainty.ravel())) + ']'
+
+    def __eq__(self, other):
+        """Two UncertainArrays are equal if their values, uncertainties and covariances are equal"""
+        return (isinstance(other, UncertainArray) and np.array_equal(self.value, other.value)
+                and np.array_equal(self.uncertainty, other.uncertainty)
+                and (self.covariance is None) == (other.covariance is None)
+                and (self.covariance is None or np.array_equal(self.covariance, other.covariance)))
+
+    def __len__(self):
+        return len(self.value)
+
+    def __getitem__(self, index):
+        """Return one value as an UncertainVal, or a part of the array as an UncertainArray.
+
+        >>> means = UncertainArray([1., 2., 3.], covariance=np.diag([1., 4., 9.]))
+        >>> means[1], means[1:].uncertainty
+        (UncertainVal(2.0, 2.0), array([2., 3.]))
+        """
+        value = self.value[index]
+        if np.ndim(value) == 0:
+            return UncertainVal(float(value), float(self.uncertainty[index]))
+        if self.covariance is not None:
+            rows = np.arange(self.value.size)[index]
+            return UncertainArray(value, covariance=self.covariance[np.ix_(rows, rows)])
+        return UncertainArray(value, self.uncertainty[index])
+
+    def _propagate(self, other, operation):
+        """Apply operation to the values of self and other (an UncertainArray, an UncertainVal, or numbers)
+        element by element, and propagate the uncertainties, and the covariances if either has them.
+
+        >>> UncertainArray([3., 6.], [0.3, 0.6]) + UncertainVal(4., 0.4)
+        UncertainArray(array([ 7., 10.]), array([0.5       , 0.72111026]))
+        >>> total = UncertainArray([3., 6.], [0.3, 0.6]) + UncertainArray([4., 8.], covariance=[[0.16, 0.], [0., 0.64]])
+        >>> total.covariance
+        array([[0.25, 0.  ],
+               [0.  , 1.  ]])
+        >>> (1/UncertainArray([2., 4.], [0.2, 0.4])).uncertainty
+        array([0.05 , 0.025])
+        """
+        value, d_self, d_other = operation(self.value, other.value if isinstance(other, (UncertainVal, UncertainArray))
+                                           else other)
+        value = np.asarray(value, dtype=float)
+        terms = [(self, _derivative(d_self))]
+        if isinstance(other, (UncertainVal, UncertainArray)):
+            terms.append((other, _derivative(d_other)))
+        if any(getattr(operand, 'covariance', None) is not None for operand, _ in terms):
+            # full covariance of the result, J C J^T summed over the operands
+            covariance = np.zeros((value.size, value.size))
+            for operand, d in terms:
+                d = np.broadcast_to(np.asarray(d, dtype=float), value.shape)
+                if isinstance(operand, UncertainVal):
+                    # one value shared by every element
+                    covariance += np.outer(d, d)*operand.uncertainty**2
+                elif operand.covariance is not None:
+                    covariance += d[:, None]*operand.covariance*d[None, :]
+                else:
+                    covariance += np.diag((d*operand.uncertainty)**2)
+            return UncertainArray(value, covariance=covariance)
+        error_sq = sum((np.asarray(d, dtype=float)*operand.uncertainty)**2 for operand, d in terms)
+        return UncertainArray(value, np.sqrt(error_sq))
+
+    def __add__(self, other):
+        return self._propagate(other, _add)
+
+    def __radd__(self, other):
+        return self._propagate(other, _reflect(_add))
+
+    def __sub__(self, other):
+        return self._propagate(other, _sub)
+
+    def __rsub__(self, other):
+        return self._propagate(other, _reflect(_sub))
+
+    def __mul__(self, other):
+        return self._propagate(other, _mul)
+
+    def __rmul__(self, other):
+        return self._propagate(other, _reflect(_mul))
+
+    def __truediv__(self, other):
+        return self._propagate(other, _truediv)
+
+    def __rtruediv__(self, other):
+        return self._propagate(other, _reflect(_truediv))
+
+    def __pow__(self, other):
+        return self._propagate(other, _pow)
+
+    def __rpow__(self, other):
+        return self._propagate(other, _reflect(_pow))
+
+    def __neg__(self):
+        return UncertainArray(-self.value, self.uncertainty, self.covariance)
+
+    def __rmatmul__(self, weights):
+        """Return weights @ self: a weighted sum of the values (an UncertainVal) for a vector of weights,
+        or an UncertainArray of weighted sums, with their covariance, for a matrix of weights.
+        Unlike elementwise arithmetic, this uses the covariance between the values.
+
+        >>> means = UncertainArray([10., 20.], covariance=[[1., 0.5], [0.5, 1.]])
+        >>> [0.5, 0.5] @ means
+        UncertainVal(15.0, 0.8660254037844386)
+        """
+        weights = np.asarray(weights, dtype=float)
+        covariance = self.covariance if self.covariance is not None else np.diag(self.uncertainty**2)
+        value = weights @ self.value
+        result_covariance = weights @ covariance @ weights.T
+        if weights.ndim == 1:
+            return UncertainVal(float(value), float(np.sqrt(result_covariance)))
+        return UncertainArray(value, covariance=result_covariance)
+
+    def sum(self):
+        """Return the sum of the values as an UncertainVal."""
+        return np.ones(self.value.size) @ self
+
 if __name__ == "__main__":
     import doctest
     doctest.testmod()
@@ -2,12 +2,13 @@ import pandas as pd
 import numpy as np
 from scipy import stats
 
+from analysis_data import load
 from compare_subsets import make_subset, make_histograms
 
 # get subsets by sex
 # subset_pairs = [['women', 'men'], ['women_did_not_know', 'men_did_not_know'], ['women_may_have_known', 'men_may_have_known']]
 subset_pairs = [['women_did_not_know', 'men_did_not_know']]
-data = pd.read_csv('../araihazar-data/to_analyze/data_for_regressions.csv')
+data = load(['knew_well_as', 'sex', 'arsenic_ugl', 'urine_as'])
 
 for subset_pair in subset_pairs:
     data_pair = {}